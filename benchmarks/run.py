@@ -0,0 +1,309 @@
+"""
+benchmarks/run.py
+Offline throughput benchmark for the lookup engine.
+
+    python -m benchmarks.run                      # compare against baseline.json
+    python -m benchmarks.run --save-baseline      # record a new baseline
+
+A synthetic zone is served by the local stand-in DNS and HTTPS servers
+(`benchmarks/standins.py`), so no network access is needed.  Each
+concurrency level runs in a fresh process, which makes its peak RSS
+meaningful, and reports domains/sec plus p50/p95/p99 latency per detection
+method.  It also reports the CPU time per domain of the client and of the
+stand-in servers: once their sum fills the available cores, throughput is
+CPU-bound and higher concurrency only adds latency.  Verdicts are checked against the zone as well, so a change that is
+fast but wrong does not pass.  With a baseline, the exit status is 1 when
+any level regresses by more than `--tolerance`.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import ssl
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Sequence
+
+from email_host_lookup import http_probe, resolver
+from email_host_lookup.async_lookup import (
+    async_detect_provider_by_spf_expanded,
+    async_detect_provider_by_srv,
+    async_get_dmarc_record,
+    async_get_mx_records,
+    async_get_spf_record,
+)
+from email_host_lookup.email_host_lookup import detect_provider, detect_provider_by_dmarc
+
+from .standins import METHODS, StandInServers, SyntheticZone
+
+try:
+    import resource
+except ImportError:  # pragma: no cover - not available on Windows
+    resource = None  # type: ignore[assignment]
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), "baseline.json")
+PERCENTILES = (50, 95, 99)
+# Parameters that must match for a baseline comparison to be meaningful.
+COMPARED_PARAMS = ("domains", "dns_latency_ms", "dns_jitter_ms", "loss", "nxdomain", "http_latency_ms", "http")
+# Latency differences below this many milliseconds are treated as noise.
+LATENCY_SLACK_MS = 5.0
+
+
+async def _mx(domain: str) -> str:
+    return detect_provider(await async_get_mx_records(domain))
+
+
+async def _spf(domain: str) -> str:
+    return await async_detect_provider_by_spf_expanded(domain, await async_get_spf_record(domain))
+
+
+async def _dmarc(domain: str) -> str:
+    return detect_provider_by_dmarc(await async_get_dmarc_record(domain))
+
+
+PROBES: Dict[str, Callable[[str], Awaitable[str]]] = {
+    "mx": _mx,
+    "spf": _spf,
+    "dmarc": _dmarc,
+    "srv": async_detect_provider_by_srv,
+    "autoconfig": http_probe.async_detect_provider_by_autoconfig,
+    "webfinger": http_probe.async_detect_provider_by_webfinger,
+}
+
+
+def percentile(samples: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted sequence."""
+    if not samples:
+        return 0.0
+    rank = max(1, -(-len(samples) * pct // 100))
+    return samples[int(rank) - 1]
+
+
+def configure_client(dns_port: int, https_port: int, dns_timeout: float = 0.5) -> None:
+    """Point the engine's resolver and HTTP probes at the stand-in servers."""
+    resolver.configure_nameservers(["127.0.0.1"], port=dns_port, timeout=dns_timeout, lifetime=dns_timeout * 4)
+    ctx = ssl.create_default_context()
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    http_probe.set_ssl_context(ctx)
+    http_probe.set_address_override(lambda host, port: ("127.0.0.1", https_port))
+
+
+async def run_level(
+    domains: Sequence[str],
+    expected: Dict[str, Dict[str, Optional[str]]],
+    concurrency: int,
+    methods: Sequence[str] = METHODS,
+) -> Dict[str, Any]:
+    """Look up every domain with `concurrency` in flight and collect per-method timings."""
+    samples: Dict[str, List[float]] = {method: [] for method in ("domain",) + tuple(methods)}
+    errors = dict.fromkeys(methods, 0)
+    wrong = dict.fromkeys(methods, 0)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def timed(method: str, domain: str) -> None:
+        start = time.perf_counter()
+        try:
+            verdict: Optional[str] = await PROBES[method](domain)
+        except Exception:
+            verdict = None
+            errors[method] += 1
+        samples[method].append((time.perf_counter() - start) * 1000)
+        want = expected[domain].get(method)
+        if want is not None and not (verdict or "").startswith(want):
+            wrong[method] += 1
+
+    async def one(domain: str) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await asyncio.gather(*(timed(method, domain) for method in methods))
+            samples["domain"].append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    cpu_start = time.process_time()
+    await asyncio.gather(*(one(domain) for domain in domains))
+    elapsed = time.perf_counter() - start
+    cpu = time.process_time() - cpu_start
+    await http_probe.close_pool()
+
+    latency = {}
+    for method, values in samples.items():
+        values.sort()
+        latency[method] = {f"p{pct}": round(percentile(values, pct), 2) for pct in PERCENTILES}
+        if method != "domain":
+            latency[method].update(errors=errors[method], wrong=wrong[method])
+    return {
+        "concurrency": concurrency,
+        "elapsed": round(elapsed, 3),
+        "domains_per_sec": round(len(domains) / elapsed, 1) if elapsed else 0.0,
+        "cpu_ms_per_domain": round(cpu * 1000 / len(domains), 2) if domains else 0.0,
+        "latency_ms": latency,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else None,
+    }
+
+
+def _level_worker(config: Dict[str, Any]) -> Dict[str, Any]:
+    """Entry point of the per-level child process."""
+    configure_client(config["dns_port"], config["https_port"], config["dns_timeout"])
+    return asyncio.run(run_level(config["domains"], config["expected"], config["concurrency"], config["methods"]))
+
+
+def run_benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    zone = SyntheticZone(args.domains, nxdomain_rate=args.nxdomain, seed=args.seed)
+    methods = METHODS if args.http else tuple(m for m in METHODS if m not in ("autoconfig", "webfinger"))
+    servers = StandInServers(
+        zone,
+        dns_latency=args.dns_latency_ms / 1000,
+        dns_jitter=args.dns_jitter_ms / 1000,
+        loss=args.loss,
+        http_latency=args.http_latency_ms / 1000,
+        seed=args.seed,
+    )
+    levels = []
+    with servers:
+        for concurrency in args.concurrency:
+            config = {
+                "dns_port": servers.dns_port,
+                "https_port": servers.https_port,
+                "dns_timeout": args.dns_timeout,
+                "domains": zone.domains,
+                "expected": zone.expected,
+                "concurrency": concurrency,
+                "methods": methods,
+            }
+            standin_cpu = servers.cpu_time()
+            if args.in_process:
+                level = _level_worker(config)
+            else:
+                with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as pool:
+                    level = pool.submit(_level_worker, config).result()
+            standin_cpu = servers.cpu_time() - standin_cpu
+            level["standin_cpu_ms_per_domain"] = round(standin_cpu * 1000 / len(zone.domains), 2)
+            levels.append(level)
+            print(format_level(level), file=sys.stderr)
+        queries, dropped = servers.dns.queries, servers.dns.dropped
+    return {
+        "cpus": os.cpu_count(),
+        "params": {
+            "domains": args.domains,
+            "dns_latency_ms": args.dns_latency_ms,
+            "dns_jitter_ms": args.dns_jitter_ms,
+            "loss": args.loss,
+            "nxdomain": args.nxdomain,
+            "http_latency_ms": args.http_latency_ms,
+            "http": args.http,
+            "seed": args.seed,
+        },
+        "dns_queries": queries,
+        "dns_dropped": dropped,
+        "levels": levels,
+    }
+
+
+def format_level(level: Dict[str, Any]) -> str:
+    lines = [
+        f"concurrency {level['concurrency']}: {level['domains_per_sec']} domains/sec, "
+        f"peak RSS {level['peak_rss_kb']} KB",
+        f"  CPU per domain: client {level['cpu_ms_per_domain']}ms, "
+        f"stand-ins {level.get('standin_cpu_ms_per_domain', '?')}ms",
+    ]
+    for method, stats in level["latency_ms"].items():
+        extra = f" errors={stats['errors']} wrong={stats['wrong']}" if "errors" in stats else ""
+        lines.append(f"  {method:<10} p50={stats['p50']}ms p95={stats['p95']}ms p99={stats['p99']}ms{extra}")
+    return "\n".join(lines)
+
+
+def compare(result: Dict[str, Any], baseline: Dict[str, Any], tolerance: float = 0.25) -> List[str]:
+    """
+    Return a description of every regression of `result` against `baseline`:
+    lower throughput, higher p95 latency, client CPU per domain or peak RSS
+    by more than `tolerance` (a fraction), and more wrong verdicts.  CPU per
+    domain does not depend on how busy the machine is, so it catches
+    slowdowns that a CPU-bound throughput figure blurs.  Lookups that time
+    out under overload count as wrong, so the baseline's count is the bar.
+    """
+    problems: List[str] = []
+    mismatched = [name for name in COMPARED_PARAMS if result["params"].get(name) != baseline["params"].get(name)]
+    if mismatched:
+        problems.append(f"baseline was recorded with different parameters: {', '.join(mismatched)}")
+        return problems
+    base_levels = {level["concurrency"]: level for level in baseline["levels"]}
+    for level in result["levels"]:
+        base = base_levels.get(level["concurrency"])
+        if base is None:
+            continue
+        name = f"concurrency {level['concurrency']}"
+        if level["domains_per_sec"] < base["domains_per_sec"] * (1 - tolerance):
+            problems.append(f"{name}: {level['domains_per_sec']} domains/sec, baseline {base['domains_per_sec']}")
+        for method, stats in level["latency_ms"].items():
+            base_p95 = base["latency_ms"].get(method, {}).get("p95")
+            if base_p95 is not None and stats["p95"] > max(base_p95 * (1 + tolerance), base_p95 + LATENCY_SLACK_MS):
+                problems.append(f"{name}: {method} p95 {stats['p95']}ms, baseline {base_p95}ms")
+            base_wrong = base["latency_ms"].get(method, {}).get("wrong", 0)
+            if stats.get("wrong", 0) > base_wrong * (1 + tolerance) + 1:
+                problems.append(f"{name}: {stats['wrong']} wrong {method} verdicts, baseline {base_wrong}")
+        if level.get("cpu_ms_per_domain") and base.get("cpu_ms_per_domain"):
+            if level["cpu_ms_per_domain"] > base["cpu_ms_per_domain"] * (1 + tolerance):
+                problems.append(
+                    f"{name}: {level['cpu_ms_per_domain']}ms CPU per domain, baseline {base['cpu_ms_per_domain']}ms"
+                )
+        if level["peak_rss_kb"] and base.get("peak_rss_kb"):
+            if level["peak_rss_kb"] > base["peak_rss_kb"] * (1 + tolerance):
+                problems.append(f"{name}: peak RSS {level['peak_rss_kb']} KB, baseline {base['peak_rss_kb']} KB")
+    return problems
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Offline benchmark against local stand-in DNS/HTTPS servers.")
+    parser.add_argument("--domains", type=int, default=1000, help="Synthetic domains per level (default: 1000).")
+    parser.add_argument(
+        "--concurrency",
+        type=lambda text: [int(part) for part in text.split(",")],
+        default=[10, 25, 50],
+        help="Comma-separated concurrency levels (default: 10,25,50).",
+    )
+    parser.add_argument("--dns-latency-ms", type=float, default=20.0, help="Mean DNS response delay (default: 20).")
+    parser.add_argument("--dns-jitter-ms", type=float, default=5.0, help="Uniform DNS delay jitter (default: 5).")
+    parser.add_argument("--loss", type=float, default=0.0, help="Fraction of DNS queries dropped (default: 0).")
+    parser.add_argument("--nxdomain", type=float, default=0.05, help="Fraction of nonexistent domains (default: 0.05).")
+    parser.add_argument("--http-latency-ms", type=float, default=20.0, help="HTTPS response delay (default: 20).")
+    parser.add_argument("--no-http", dest="http", action="store_false", help="Skip the autoconfig and WebFinger probes.")
+    parser.add_argument("--dns-timeout", type=float, default=0.5, help="Per-query DNS timeout in seconds (default: 0.5).")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for the zone, latency and loss (default: 1).")
+    parser.add_argument("--in-process", action="store_true", help="Run levels in this process (peak RSS accumulates).")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE, help="Baseline JSON file (default: benchmarks/baseline.json).")
+    parser.add_argument("--save-baseline", action="store_true", help="Write the results as the new baseline.")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Allowed regression fraction (default: 0.25).")
+    parser.add_argument("-o", "--output", help="Also write the results as JSON to this file.")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    result = run_benchmark(args)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as fp:
+            json.dump(result, fp, indent=2)
+            fp.write("\n")
+        print(f"Wrote baseline {args.baseline}", file=sys.stderr)
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.", file=sys.stderr)
+        return 0
+    with open(args.baseline, encoding="utf-8") as fp:
+        problems = compare(result, json.load(fp), args.tolerance)
+    for problem in problems:
+        print(f"REGRESSION {problem}", file=sys.stderr)
+    if not problems:
+        print("No regressions against the baseline.", file=sys.stderr)
+    return 1 if problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
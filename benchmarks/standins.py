@@ -0,0 +1,313 @@
+"""
+benchmarks/standins.py
+Local stand-in DNS and HTTPS servers for offline benchmarks.
+
+`SyntheticZone` generates domains whose MX, SPF, DMARC, SRV, autoconfig and
+WebFinger answers cycle through every pattern of the signature table (plus
+a custom, unrecognized variant), so a run exercises every detection rule.
+`StandInDNS` serves the zone over UDP with configurable latency, jitter and
+packet loss; `handle_https` serves the HTTP endpoints.  `StandInServers`
+runs both on a background thread so benchmark clients can live in other
+processes, and reports the CPU time that thread used (the stand-ins compete
+with the client for the same cores).
+"""
+
+import asyncio
+import json
+import os
+import random
+import ssl
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
+import dns.flags
+import dns.message
+import dns.rcode
+import dns.rdataclass
+import dns.rdatatype
+import dns.rrset
+
+from email_host_lookup.email_host_lookup import srv_names
+from email_host_lookup.signatures import DEFAULT_SIGNATURES_PATH
+
+DEFAULT_CERT = os.path.join(os.path.dirname(os.path.dirname(__file__)), "tests", "data", "localhost.pem")
+ZONE_SUFFIX = "bench.test"
+TTL = 300
+SOA = f"ns.{ZONE_SUFFIX}. hostmaster.{ZONE_SUFFIX}. 1 3600 600 86400 60"
+
+# Detection methods a synthetic domain carries an expected verdict for.
+METHODS = ("mx", "spf", "dmarc", "srv", "autoconfig", "webfinger")
+
+
+def _channel_patterns(signatures_path: str) -> Dict[str, List[Tuple[str, str]]]:
+    """Return `(pattern, expected label prefix)` pairs per channel."""
+    with open(signatures_path, encoding="utf-8") as fp:
+        data = json.load(fp)
+    patterns: Dict[str, List[Tuple[str, str]]] = {}
+    for channel, spec in data["channels"].items():
+        patterns[channel] = [
+            (pattern, rule.get("label", rule["provider"]).split(" (")[0])
+            for rule in spec["rules"]
+            for pattern in rule["patterns"]
+        ]
+    return patterns
+
+
+class SyntheticZone:
+    """
+    `count` synthetic domains below `bench.test`.  A fraction
+    `nxdomain_rate` of them do not exist at all, and a fraction
+    `include_rate` publish their provider only through a nested SPF include.
+    """
+
+    def __init__(
+        self,
+        count: int,
+        nxdomain_rate: float = 0.0,
+        include_rate: float = 0.2,
+        seed: int = 0,
+        signatures_path: str = DEFAULT_SIGNATURES_PATH,
+    ) -> None:
+        rng = random.Random(seed)
+        channels = _channel_patterns(signatures_path)
+        self.domains: List[str] = []
+        self.records: Dict[Tuple[str, str], List[str]] = {}
+        self.names: Set[str] = set()
+        self.http: Dict[Tuple[str, str], bytes] = {}
+        self.expected: Dict[str, Dict[str, Optional[str]]] = {}
+        self.nxdomains = 0
+
+        def pick(channel: str, i: int) -> Tuple[Optional[str], Optional[str]]:
+            # One extra slot per channel yields a custom, unrecognized setup.
+            options = channels.get(channel, [])
+            index = i % (len(options) + 1)
+            return options[index] if index < len(options) else (None, None)
+
+        for i in range(count):
+            if rng.random() < nxdomain_rate:
+                domain = f"nx{i}.{ZONE_SUFFIX}"
+                self.domains.append(domain)
+                self.expected[domain] = {method: None for method in METHODS}
+                self.nxdomains += 1
+                continue
+            domain = f"d{i}.{ZONE_SUFFIX}"
+            self.domains.append(domain)
+            expected: Dict[str, Optional[str]] = {}
+
+            pattern, expected["mx"] = pick("mx", i)
+            self._add(domain, "MX", [f"10 mx1.{pattern or domain}.", f"20 mx2.{pattern or domain}."])
+
+            pattern, expected["spf"] = pick("spf", i)
+            spf = f"v=spf1 {pattern} ~all" if pattern else "v=spf1 ip4:192.0.2.0/24 -all"
+            if pattern and rng.random() < include_rate:
+                self._add(f"_spf.{domain}", "TXT", [f'"{spf}"'])
+                spf = f"v=spf1 include:_spf.{domain} -all"
+            self._add(domain, "TXT", [f'"{spf}"', f'"site-verification={i}"'])
+
+            pattern, expected["dmarc"] = pick("dmarc", i)
+            self._add(f"_dmarc.{domain}", "TXT", [f'"v=DMARC1; p=none; rua=mailto:dmarc@{pattern or domain}"'])
+
+            pattern, expected["srv"] = pick("srv", i)
+            if pattern:
+                self._add(srv_names(domain)[i % 3], "SRV", [f"0 1 993 mail.{pattern}."])
+
+            pattern, expected["autoconfig"] = pick("autoconfig", i)
+            body = f"<clientConfig><incomingServer><hostname>imap.{pattern or domain}</hostname></incomingServer></clientConfig>"
+            self.http[(f"autoconfig.{domain}", "/mail/config-v1.1.xml")] = body.encode()
+
+            pattern, expected["webfinger"] = pick("webfinger", i)
+            if pattern:
+                body = f'{{"subject": "acct:user@{domain}", "links": [{{"href": "https://login.{pattern}.example/"}}]}}'
+                self.http[(domain, "/.well-known/webfinger")] = body.encode()
+
+            self.expected[domain] = expected
+
+    def _add(self, name: str, rdtype: str, rdatas: List[str]) -> None:
+        self.records[(name, rdtype)] = rdatas
+        self.names.add(name)
+
+
+class StandInDNS(asyncio.DatagramProtocol):
+    """Authoritative UDP responder for a `SyntheticZone`."""
+
+    def __init__(
+        self,
+        zone: SyntheticZone,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        loss: float = 0.0,
+        seed: int = 0,
+    ) -> None:
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.queries = 0
+        self.dropped = 0
+        self._rng = random.Random(seed)
+        self._names = zone.names
+        self._rrsets = {
+            (name, rdtype): dns.rrset.from_text_list(name + ".", TTL, "IN", rdtype, rdatas)
+            for (name, rdtype), rdatas in zone.records.items()
+        }
+        self._soa = dns.rrset.from_text(ZONE_SUFFIX + ".", TTL, "IN", "SOA", SOA)
+        self._transport: Optional[asyncio.DatagramTransport] = None
+
+    def connection_made(self, transport: asyncio.BaseTransport) -> None:
+        self._transport = transport  # type: ignore[assignment]
+
+    def datagram_received(self, data: bytes, addr: Tuple[str, int]) -> None:
+        self.queries += 1
+        if self._rng.random() < self.loss:
+            self.dropped += 1
+            return
+        response = self.respond(data)
+        if response is None or self._transport is None:
+            return
+        delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self._transport.sendto, response, addr)
+        else:
+            self._transport.sendto(response, addr)
+
+    def respond(self, wire: bytes) -> Optional[bytes]:
+        """Build the wire-format answer to a query, or None for garbage."""
+        try:
+            query = dns.message.from_wire(wire)
+        except Exception:
+            return None
+        response = dns.message.make_response(query)
+        response.flags |= dns.flags.AA
+        if not query.question:
+            response.set_rcode(dns.rcode.FORMERR)
+            return response.to_wire()
+        question = query.question[0]
+        name = question.name.to_text(omit_final_dot=True).lower()
+        rrset = self._rrsets.get((name, dns.rdatatype.to_text(question.rdtype)))
+        if rrset is not None:
+            response.answer.append(rrset)
+        else:
+            if name not in self._names:
+                response.set_rcode(dns.rcode.NXDOMAIN)
+            response.authority.append(self._soa)
+        return response.to_wire()
+
+
+def make_https_handler(zone: SyntheticZone, latency: float = 0.0):
+    """Return an `asyncio.start_server` callback serving the zone's HTTP endpoints."""
+
+    async def handle(reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    return
+                host = ""
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    if name.strip().lower() == "host":
+                        host = value.strip().split(":")[0].lower()
+                path = request_line.split()[1].decode("latin-1").split("?")[0]
+                if latency:
+                    await asyncio.sleep(latency)
+                body = zone.http.get((host, path))
+                if body is None:
+                    writer.write(b"HTTP/1.1 404 Not Found\r\nContent-Length: 9\r\n\r\nnot found")
+                else:
+                    writer.write(b"HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s" % (len(body), body))
+                await writer.drain()
+        except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError, IndexError):
+            pass
+        finally:
+            writer.close()
+
+    return handle
+
+
+class StandInServers:
+    """
+    Run the stand-in DNS and HTTPS servers on a background event loop.
+    `dns_port` and `https_port` are set once `start()` returns.
+    """
+
+    def __init__(
+        self,
+        zone: SyntheticZone,
+        dns_latency: float = 0.0,
+        dns_jitter: float = 0.0,
+        loss: float = 0.0,
+        http_latency: float = 0.0,
+        cert: str = DEFAULT_CERT,
+        seed: int = 0,
+    ) -> None:
+        self.zone = zone
+        self.dns = StandInDNS(zone, dns_latency, dns_jitter, loss, seed)
+        self.http_latency = http_latency
+        self.cert = cert
+        self.dns_port = 0
+        self.https_port = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._thread: Optional[threading.Thread] = None
+        self._ready = threading.Event()
+        self._error: Optional[BaseException] = None
+
+    def start(self) -> "StandInServers":
+        self._thread = threading.Thread(target=self._run, name="standin-servers", daemon=True)
+        self._thread.start()
+        self._ready.wait()
+        if self._error is not None:
+            raise self._error
+        return self
+
+    def stop(self) -> None:
+        if self._loop is not None and self._thread is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def cpu_time(self) -> float:
+        """CPU seconds the servers' thread has used so far."""
+        if self._loop is None:
+            return 0.0
+
+        async def thread_time() -> float:
+            return time.thread_time()
+
+        return asyncio.run_coroutine_threadsafe(thread_time(), self._loop).result()
+
+    def __enter__(self) -> "StandInServers":
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
+
+    def _run(self) -> None:
+        loop = self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            transport, _ = loop.run_until_complete(
+                loop.create_datagram_endpoint(lambda: self.dns, local_addr=("127.0.0.1", 0))
+            )
+            ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+            ctx.load_cert_chain(self.cert)
+            server = loop.run_until_complete(
+                asyncio.start_server(make_https_handler(self.zone, self.http_latency), "127.0.0.1", 0, ssl=ctx, backlog=1024)
+            )
+        except BaseException as e:
+            self._error = e
+            self._ready.set()
+            loop.close()
+            return
+        self.dns_port = transport.get_extra_info("sockname")[1]
+        self.https_port = server.sockets[0].getsockname()[1]
+        self._ready.set()
+        try:
+            loop.run_forever()
+        finally:
+            server.close()
+            transport.close()
+            loop.run_until_complete(asyncio.sleep(0))
+            loop.close()
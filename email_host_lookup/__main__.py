@@ -0,0 +1,7 @@
+"""`python -m email_host_lookup` runs the command line interface."""
+
+import sys
+
+from .cli import main
+
+sys.exit(main())
@@ -0,0 +1,219 @@
+"""
+async_lookup.py
+Asyncio lookup engine: fires every record query for a domain at once and
+keeps many domains in flight under a bounded semaphore.
+"""
+
+import asyncio
+from typing import AsyncIterator, Awaitable, Callable, Iterable, List, Tuple, Union
+
+from .email_host_lookup import (
+    detect_provider,
+    detect_provider_by_dmarc,
+    detect_provider_by_spf,
+    detect_provider_by_srv_entries,
+    dmarc_fallback_domain,
+    has_dmarc_policy,
+    mx_hosts_from_answer,
+    srv_entries_from_answer,
+    srv_names,
+    txt_from_answer,
+)
+from .metrics import timed
+from .records import HostInfo
+from .resolver import resolve_async
+from .spf import async_detect_provider_by_spf_tree
+
+# (method, verdict, records) as yielded by `stream_method_verdicts`.
+MethodVerdict = Tuple[str, str, List[str]]
+
+
+@timed("mx")
+async def async_get_mx_records(domain: str) -> List[str]:
+    """Fetch MX records for the given domain."""
+    try:
+        return mx_hosts_from_answer(await resolve_async(domain, "MX"))
+    except Exception as e:
+        raise Exception(f"Failed to resolve MX records for {domain}: {e}")
+
+
+@timed("spf")
+async def async_get_spf_record(domain: str) -> List[str]:
+    """Fetch SPF (TXT) records for the given domain."""
+    try:
+        answers = await resolve_async(domain, "TXT")
+        return [txt for txt in txt_from_answer(answers) if txt.startswith("v=spf1")]
+    except Exception as e:
+        return [f"Error: {e}"]
+
+
+async def _dmarc_txt(domain: str) -> List[str]:
+    try:
+        return txt_from_answer(await resolve_async(f"_dmarc.{domain}", "TXT"))
+    except Exception as e:
+        return [f"Error: {e}"]
+
+
+@timed("dmarc")
+async def async_get_dmarc_record(domain: str) -> List[str]:
+    """
+    Fetch DMARC (TXT) records for the given domain, falling back to the
+    organizational domain's policy when the domain has none.
+    """
+    records = await _dmarc_txt(domain)
+    org = dmarc_fallback_domain(domain, records)
+    if org is not None:
+        # The organizational domain is its own fallback, so one level is enough.
+        org_records = await _dmarc_txt(org)
+        if has_dmarc_policy(org_records):
+            return org_records
+    return records
+
+
+async def _srv_entries(srv: str) -> List[str]:
+    try:
+        return srv_entries_from_answer(srv, await resolve_async(srv, "SRV"))
+    except Exception:
+        return []
+
+
+@timed("srv")
+async def async_detect_provider_by_srv(domain: str) -> str:
+    """Query all mail-related SRV names concurrently and classify the targets."""
+    results = await asyncio.gather(*(_srv_entries(srv) for srv in srv_names(domain)))
+    return detect_provider_by_srv_entries([entry for found in results for entry in found])
+
+
+@timed("spf_includes")
+async def async_detect_provider_by_spf_expanded(domain: str, spf_records: List[str]) -> str:
+    """
+    Classify the SPF records, following `include:`/`redirect=` chains
+    when the top-level record does not name a provider itself.
+    """
+    provider_spf = detect_provider_by_spf(spf_records)
+    if provider_spf.startswith("Unknown") and any(txt.startswith("v=spf1") for txt in spf_records):
+        provider_spf, _ = await async_detect_provider_by_spf_tree(domain, spf_records)
+    return provider_spf
+
+
+async def async_get_email_host_info(domain: str) -> HostInfo:
+    """
+    Aggregate detection results from MX, SPF, DMARC methods.
+    All three record types are resolved concurrently, so a domain costs
+    the slowest round trip rather than the sum of them.
+    """
+    spf_task = asyncio.ensure_future(async_get_spf_record(domain))
+    dmarc_task = asyncio.ensure_future(async_get_dmarc_record(domain))
+    try:
+        mx_records = await async_get_mx_records(domain)
+    except Exception:
+        spf_task.cancel()
+        dmarc_task.cancel()
+        await asyncio.gather(spf_task, dmarc_task, return_exceptions=True)
+        raise
+    spf_records, dmarc_records = await asyncio.gather(spf_task, dmarc_task)
+
+    return HostInfo(
+        domain,
+        mx_records,
+        detect_provider(mx_records),
+        spf_records,
+        await async_detect_provider_by_spf_expanded(domain, spf_records),
+        dmarc_records,
+        detect_provider_by_dmarc(dmarc_records),
+    )
+
+
+async def stream_method_verdicts(domain: str) -> AsyncIterator[MethodVerdict]:
+    """
+    Run every detection method (MX, SPF, DMARC, SRV, autoconfig, WebFinger)
+    for the domain at once and yield `(method, verdict, records)` as soon as
+    each one resolves.  A failing method yields its error as the verdict.
+    """
+    from . import http_probe
+
+    async def mx() -> Tuple[str, List[str]]:
+        records = await async_get_mx_records(domain)
+        return detect_provider(records), records
+
+    async def spf() -> Tuple[str, List[str]]:
+        records = await async_get_spf_record(domain)
+        return await async_detect_provider_by_spf_expanded(domain, records), records
+
+    async def dmarc() -> Tuple[str, List[str]]:
+        records = await async_get_dmarc_record(domain)
+        return detect_provider_by_dmarc(records), records
+
+    async def probe(detect: Callable[[str], Awaitable[str]]) -> Tuple[str, List[str]]:
+        return await detect(domain), []
+
+    async def run(method: str, pending: Awaitable[Tuple[str, List[str]]]) -> MethodVerdict:
+        try:
+            verdict, records = await pending
+        except Exception as e:
+            return method, f"Error: {e}", []
+        return method, verdict, records
+
+    tasks = [
+        asyncio.ensure_future(run(method, pending))
+        for method, pending in (
+            ("MX", mx()),
+            ("SPF", spf()),
+            ("DMARC", dmarc()),
+            ("SRV", probe(async_detect_provider_by_srv)),
+            ("Autoconfig", probe(http_probe.async_detect_provider_by_autoconfig)),
+            ("WebFinger", probe(http_probe.async_detect_provider_by_webfinger)),
+        )
+    ]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            yield await next_done
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+
+async def lookup_many(
+    domains: Iterable[str],
+    concurrency: int = 100,
+) -> AsyncIterator[Tuple[str, Union[HostInfo, Exception]]]:
+    """
+    Look up many domains with at most `concurrency` of them in flight.
+
+    `domains` is consumed lazily, so memory stays bounded by the number of
+    in-flight lookups.  Yields `(domain, info)` pairs in completion order;
+    a failed lookup yields the exception in place of the info tuple.
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    semaphore = asyncio.Semaphore(concurrency)
+    done: "asyncio.Queue[Tuple[str, Union[HostInfo, Exception]]]" = asyncio.Queue()
+    pending = 0
+
+    async def run(domain: str) -> None:
+        try:
+            result: Union[HostInfo, Exception] = await async_get_email_host_info(domain)
+        except Exception as e:
+            result = e
+        finally:
+            semaphore.release()
+        await done.put((domain, result))
+
+    tasks = set()
+    try:
+        for domain in domains:
+            await semaphore.acquire()
+            task = asyncio.ensure_future(run(domain))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+            pending += 1
+            while not done.empty():
+                pending -= 1
+                yield done.get_nowait()
+        while pending:
+            pending -= 1
+            yield await done.get()
+    finally:
+        for task in tasks:
+            task.cancel()
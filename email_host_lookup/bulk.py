@@ -0,0 +1,575 @@
+"""
+bulk.py
+Streaming bulk classification of address lists.
+
+Addresses are read lazily, deduplicated by domain so every domain is
+resolved once, and the verdict is fanned back out to each address.  Memory
+is bounded by the number of in-flight domains and pending rows, never by
+the size of the input.
+"""
+
+import asyncio
+import csv
+import json
+import sys
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    TextIO,
+    Tuple,
+    Union,
+)
+
+from .async_lookup import async_detect_provider_by_srv, async_get_email_host_info
+from .domains import normalize_domain, organizational_domain
+from .email_host_lookup import is_valid_email
+from .latency import LatencyTracker
+from .metrics import get_metrics, timed
+from .planner import ALL_METHODS, DNS_METHODS, Planner, expiry, saved_cost
+from .records import ResultBatch
+from .resolver import watch_ttls
+
+if TYPE_CHECKING:
+    from .store import VerdictStore
+
+CSV_FIELDS = [
+    "address",
+    "domain",
+    "provider",
+    "confidence",
+    "provider_mx",
+    "provider_spf",
+    "provider_dmarc",
+    "mx_records",
+    "spf_records",
+    "dmarc_records",
+    "srv",
+    "autoconfig",
+    "webfinger",
+    "mx_ip",
+    "skipped",
+    "partial",
+    "error",
+]
+
+Verdict = Dict[str, Any]
+
+# Shortest per-domain budget the adaptive deadline may shrink to.
+MIN_BUDGET = 1.0
+
+
+class BulkStats:
+    """Counters collected while a bulk scan runs."""
+
+    def __init__(self) -> None:
+        self.addresses = 0
+        self.invalid = 0
+        self.domains_resolved = 0
+        self.domain_errors = 0
+        self.deduplicated = 0
+        self.store_hits = 0
+        # Domains whose deadline ran out before every method finished.
+        self.partial = 0
+        # Methods the planner skipped once a verdict was confident enough.
+        self.skipped: Dict[str, int] = {}
+        # Their summed `planner.Method.cost`, roughly in DNS queries.
+        self.saved_cost = 0.0
+        self.started = time.monotonic()
+        self.finished: Optional[float] = None
+        # Set when the scan stopped reading input early (see `sharded`).
+        self.interrupted = False
+        # Snapshot of `metrics.Metrics` at the end of the run, if enabled.
+        self.metrics: Optional[Dict[str, Any]] = None
+
+    @property
+    def elapsed(self) -> float:
+        return (self.finished or time.monotonic()) - self.started
+
+    def count_verdict(self, verdict: Verdict) -> None:
+        """Count a freshly resolved domain's verdict."""
+        self.domains_resolved += 1
+        if "error" in verdict:
+            self.domain_errors += 1
+        if "partial" in verdict:
+            self.partial += 1
+        skipped = verdict.get("skipped", ())
+        for name in skipped:
+            self.skipped[name] = self.skipped.get(name, 0) + 1
+        self.saved_cost += saved_cost(skipped)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "addresses": self.addresses,
+            "invalid": self.invalid,
+            "domains_resolved": self.domains_resolved,
+            "domain_errors": self.domain_errors,
+            "deduplicated": self.deduplicated,
+            "store_hits": self.store_hits,
+            "partial": self.partial,
+            "elapsed": round(self.elapsed, 3),
+            **({"interrupted": True} if self.interrupted else {}),
+            **({"skipped": dict(self.skipped), "saved_cost": round(self.saved_cost, 1)} if self.skipped else {}),
+            **({"metrics": self.metrics} if self.metrics is not None else {}),
+        }
+
+
+def read_addresses(source: Union[str, TextIO]) -> Iterator[str]:
+    """
+    Yield addresses one per line from a path, `-` for stdin, or an open file.
+    Blank lines and `#` comments are skipped.
+    """
+    if isinstance(source, str):
+        if source == "-":
+            yield from read_addresses(sys.stdin)
+            return
+        with open(source, encoding="utf-8", errors="replace") as fp:
+            yield from read_addresses(fp)
+        return
+    for line in source:
+        line = line.strip()
+        if line and not line.startswith("#"):
+            yield line
+
+
+def count_addresses(source: str) -> int:
+    """Count the addresses `read_addresses(source)` would yield (e.g. for a progress bar)."""
+    return sum(1 for _ in read_addresses(source))
+
+
+def address_domain(address: str, org_domains: bool = False) -> Optional[str]:
+    """
+    Return the normalized lookup domain of an address, or None if it is
+    invalid.  With `org_domains` the organizational domain is returned, so
+    every subdomain of an organization shares one lookup.
+    """
+    if not is_valid_email(address):
+        return None
+    try:
+        domain = normalize_domain(address.split("@")[-1])
+        return organizational_domain(domain) if org_domains else domain
+    except ValueError:
+        return None
+
+
+class DomainBudget:
+    """
+    Per-domain time budget shared by a scan: at most `deadline` seconds,
+    and less once finished domains show that a typical lookup is faster
+    (three times their p95, never below `MIN_BUDGET`).
+    """
+
+    def __init__(self, deadline: float) -> None:
+        self.deadline = deadline
+        self._latency = LatencyTracker(MIN_BUDGET, deadline)
+
+    def seconds(self) -> float:
+        return self._latency.timeout()
+
+    def observe(self, seconds: float, verdict: Verdict) -> None:
+        # A cut-off lookup says nothing about how long it would have taken.
+        if "partial" not in verdict:
+            self._latency.observe(seconds)
+
+
+@timed("domain")
+async def lookup_domain(
+    domain: str,
+    probes: bool = False,
+    budget: Optional[DomainBudget] = None,
+    planner: Optional[Planner] = None,
+) -> Verdict:
+    """
+    Resolve one domain into a verdict dict; failures are reported in `error`.
+    With `probes` the SRV, autoconfig and WebFinger verdicts are added too.
+    A `planner` decides which methods run (`probes` is then ignored) and
+    adds a scored `provider`.  With a `budget`, methods still running when
+    it is spent are cancelled and listed in the verdict's `partial` key.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.enter("domains")
+    try:
+        if planner is None and budget is None:
+            return await _lookup_domain(domain, probes)
+        if planner is None:
+            planner = Planner(ALL_METHODS if probes else DNS_METHODS, threshold=None)
+        start = time.monotonic()
+        verdict = await planner.run(domain, budget.seconds() if budget is not None else None)
+        if budget is not None:
+            budget.observe(time.monotonic() - start, verdict)
+        return verdict
+    finally:
+        if metrics is not None:
+            metrics.exit("domains")
+
+
+async def _lookup_domain(domain: str, probes: bool) -> Verdict:
+    # The engine queries every record type at once, so all methods share
+    # the domain's shortest TTL.
+    with watch_ttls() as watch:
+        try:
+            (
+                _,
+                mx_records,
+                provider_mx,
+                spf_records,
+                provider_spf,
+                dmarc_records,
+                provider_dmarc,
+            ) = await async_get_email_host_info(domain)
+        except Exception as e:
+            return {"error": str(e)}
+        verdict: Verdict = {
+            "provider_mx": provider_mx,
+            "provider_spf": provider_spf,
+            "provider_dmarc": provider_dmarc,
+            "mx_records": mx_records,
+            "spf_records": spf_records,
+            "dmarc_records": dmarc_records,
+        }
+        if probes:
+            # HTTP probes (and ssl) are loaded only when a run asks for them.
+            from .http_probe import async_detect_provider_by_autoconfig, async_detect_provider_by_webfinger
+
+            verdict["srv"], verdict["autoconfig"], verdict["webfinger"] = await asyncio.gather(
+                async_detect_provider_by_srv(domain),
+                async_detect_provider_by_autoconfig(domain),
+                async_detect_provider_by_webfinger(domain),
+            )
+    verdict["expires"] = expiry(dict.fromkeys(ALL_METHODS if probes else DNS_METHODS, watch.ttl))
+    return verdict
+
+
+def _row(address: str, domain: Optional[str], verdict: Verdict) -> Dict[str, Any]:
+    row: Dict[str, Any] = {"address": address, "domain": domain}
+    row.update(verdict)
+    return row
+
+
+_INVALID: Verdict = {"error": "Invalid email address"}
+
+
+async def scan_addresses(
+    addresses: Iterable[Union[str, Tuple[str, Verdict]]],
+    concurrency: int = 100,
+    ordered: bool = True,
+    max_pending: Optional[int] = None,
+    verdict_cache_size: int = 100_000,
+    stats: Optional[BulkStats] = None,
+    store: Optional["VerdictStore"] = None,
+    probes: bool = False,
+    org_domains: bool = False,
+    deadline: Optional[float] = None,
+    planner: Optional[Planner] = None,
+    reuse: Optional[Callable[[str, Verdict], Optional[Verdict]]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Classify a stream of addresses, yielding one row dict per address.
+
+    At most `concurrency` domains are resolved at once.  With `ordered`
+    rows come out in input order; otherwise each row is emitted as soon as
+    its domain resolves.  `max_pending` caps rows waiting for a verdict, and
+    the last `verdict_cache_size` finished domains are remembered so repeats
+    further down the input are not resolved again.  With a `store`, fresh
+    stored verdicts are used instead of resolving and new ones are saved.
+    Domains are deduplicated by their normalized form (see `address_domain`).
+    `deadline` caps the seconds spent on one domain (see `DomainBudget`),
+    and a `planner` picks and orders the methods (see `planner`).
+
+    An input item may also be an `(address, previous)` pair carrying the
+    verdict an earlier scan gave the address.  Before such a row's domain
+    is resolved, `reuse(domain, previous)` is called; it returns the
+    verdict to use as is, or None to resolve the domain (see `rescan`).
+    """
+    if concurrency < 1:
+        raise ValueError("concurrency must be at least 1")
+    max_pending = max_pending or concurrency * 10
+    stats = stats or BulkStats()
+    budget = DomainBudget(deadline) if deadline else None
+    semaphore = asyncio.Semaphore(concurrency)
+    inflight: Dict[str, "asyncio.Future[Verdict]"] = {}
+    verdicts: "OrderedDict[str, Verdict]" = OrderedDict()
+    finished: "asyncio.Queue[Tuple[str, Verdict]]" = asyncio.Queue()
+    # Ordered mode: rows in input order, each with a verdict or a pending future.
+    window: Deque[Tuple[str, Optional[str], Union[Verdict, "asyncio.Future[Verdict]"]]] = deque()
+    # Completion mode: addresses waiting on each in-flight domain.
+    waiting: Dict[str, List[str]] = {}
+    waiting_count = 0
+
+    async def resolve(domain: str) -> Verdict:
+        # Whatever happens, the domain leaves `inflight` and its waiting
+        # rows are released; a failure becomes the domain's error verdict.
+        verdict: Verdict = {"error": "Lookup cancelled"}
+        try:
+            try:
+                verdict = await lookup_domain(domain, probes, budget, planner)
+            finally:
+                semaphore.release()
+            if store is not None:
+                store.put(domain, verdict)
+        except Exception as e:
+            verdict = {"error": str(e) or type(e).__name__}
+        finally:
+            del inflight[domain]
+            if not ordered:
+                finished.put_nowait((domain, verdict))
+        stats.count_verdict(verdict)
+        verdicts[domain] = verdict
+        if len(verdicts) > verdict_cache_size:
+            verdicts.popitem(last=False)
+        return verdict
+
+    def drain_window() -> Iterator[Dict[str, Any]]:
+        while window:
+            address, domain, verdict = window[0]
+            if isinstance(verdict, asyncio.Future):
+                if not verdict.done():
+                    return
+                verdict = verdict.result()
+            window.popleft()
+            yield _row(address, domain, verdict)
+
+    def fan_out(domain: str, verdict: Verdict) -> Iterator[Dict[str, Any]]:
+        nonlocal waiting_count
+        for address in waiting.pop(domain, []):
+            waiting_count -= 1
+            yield _row(address, domain, verdict)
+
+    def drain_finished() -> Iterator[Dict[str, Any]]:
+        while not finished.empty():
+            yield from fan_out(*finished.get_nowait())
+
+    tasks = set()
+    try:
+        for item in addresses:
+            address, previous = (item, None) if isinstance(item, str) else item
+            stats.addresses += 1
+            domain = address_domain(address, org_domains)
+            verdict: Union[Verdict, "asyncio.Future[Verdict]", None] = None
+            if domain is None:
+                stats.invalid += 1
+                verdict = _INVALID
+            elif domain in verdicts:
+                stats.deduplicated += 1
+                verdicts.move_to_end(domain)
+                verdict = verdicts[domain]
+            elif domain in inflight:
+                stats.deduplicated += 1
+                verdict = inflight[domain]
+            elif store is not None and (stored := store.get(domain)) is not None:
+                stats.store_hits += 1
+                verdicts[domain] = verdict = stored
+                if len(verdicts) > verdict_cache_size:
+                    verdicts.popitem(last=False)
+            elif previous is not None and reuse is not None and (kept := reuse(domain, previous)) is not None:
+                verdicts[domain] = verdict = kept
+                if len(verdicts) > verdict_cache_size:
+                    verdicts.popitem(last=False)
+            else:
+                await semaphore.acquire()
+                task = asyncio.ensure_future(resolve(domain))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+                inflight[domain] = verdict = task
+
+            if ordered:
+                window.append((address, domain, verdict))
+                for row in drain_window():
+                    yield row
+                while len(window) >= max_pending:
+                    head = window[0][2]
+                    if isinstance(head, asyncio.Future):
+                        await asyncio.wait([head])
+                    for row in drain_window():
+                        yield row
+            else:
+                if isinstance(verdict, asyncio.Future):
+                    waiting.setdefault(domain, []).append(address)
+                    waiting_count += 1
+                else:
+                    yield _row(address, domain, verdict)
+                for row in drain_finished():
+                    yield row
+                while waiting_count >= max_pending:
+                    for row in fan_out(*await finished.get()):
+                        yield row
+
+        while window:
+            head = window[0][2]
+            if isinstance(head, asyncio.Future):
+                await asyncio.wait([head])
+            for row in drain_window():
+                yield row
+        while waiting_count:
+            for row in fan_out(*await finished.get()):
+                yield row
+    finally:
+        for task in tasks:
+            task.cancel()
+        stats.finished = time.monotonic()
+
+
+class RowWriter:
+    """Incremental JSONL or CSV writer for scan rows."""
+
+    def __init__(self, fp: TextIO, fmt: str = "jsonl", header: bool = True) -> None:
+        if fmt not in ("jsonl", "csv"):
+            raise ValueError(f"Unsupported output format: {fmt}")
+        self.fp = fp
+        self.fmt = fmt
+        self._csv: Optional[Any] = None
+        if fmt == "csv":
+            self._csv = csv.DictWriter(fp, fieldnames=CSV_FIELDS, extrasaction="ignore")
+            if header:
+                self._csv.writeheader()
+
+    def write(self, row: Dict[str, Any]) -> None:
+        if self._csv is None:
+            self.fp.write(json.dumps(row, ensure_ascii=False) + "\n")
+            return
+        flat = dict(row)
+        for key in ("mx_records", "spf_records", "dmarc_records", "skipped", "partial"):
+            if isinstance(flat.get(key), list):
+                flat[key] = " | ".join(flat[key])
+        self._csv.writerow(flat)
+
+
+async def close_http_pool() -> None:
+    """
+    Close the HTTPS connections the probes pooled on the running loop.
+    Runs that never probed have not imported `http_probe` and hold none.
+    """
+    http_probe = sys.modules.get(f"{__package__}.http_probe")
+    if http_probe is not None:
+        await http_probe.close_pool()
+
+
+def save_checkpoint(
+    store: "VerdictStore", run_id: str, rows_done: int, out: TextIO, finished: bool = False
+) -> None:
+    """Flush `out` and checkpoint the run together with the output's size."""
+    out.flush()
+    try:
+        offset: Optional[int] = out.tell()
+    except (OSError, ValueError):  # not seekable, e.g. a pipe
+        offset = None
+    store.checkpoint(run_id, rows_done, finished=finished, output_offset=offset)
+
+
+def rewind_output(out: TextIO, offset: Optional[int]) -> None:
+    """
+    Cut off what an interrupted run wrote to `out` after its last
+    checkpoint: its buffer may have been flushed before it was killed.
+    """
+    if offset is None:
+        return
+    out.seek(0, 2)
+    if out.tell() > offset:
+        out.truncate(offset)
+        out.seek(offset)
+
+
+async def run_bulk_async(
+    addresses: Iterable[str],
+    out: TextIO,
+    fmt: str = "jsonl",
+    concurrency: int = 100,
+    ordered: bool = True,
+    flush_every: int = 1000,
+    store: Optional["VerdictStore"] = None,
+    run_id: Optional[str] = None,
+    resume_from: int = 0,
+    probes: bool = False,
+    org_domains: bool = False,
+    deadline: Optional[float] = None,
+    planner: Optional[Planner] = None,
+) -> BulkStats:
+    """
+    Scan `addresses` and stream every row to `out`; returns the scan stats.
+
+    With a `store` and `run_id` (input order only) progress is checkpointed
+    each time the output is flushed.  `resume_from` skips that many input
+    rows, which an earlier interrupted run has already written to `out`;
+    anything it wrote after its last checkpoint is truncated first.
+    """
+    if run_id is not None and (store is None or not ordered):
+        raise ValueError("resumable runs need a store and input-ordered output")
+    if resume_from and run_id is not None:
+        rewind_output(out, store.resume_offset(run_id))
+    stats = BulkStats()
+    writer = RowWriter(out, fmt, header=resume_from == 0)
+    written = resume_from
+    rows = scan_addresses(
+        islice(addresses, resume_from, None),
+        concurrency=concurrency,
+        ordered=ordered,
+        stats=stats,
+        store=store,
+        probes=probes,
+        org_domains=org_domains,
+        deadline=deadline,
+        planner=planner,
+    )
+    completed = False
+    try:
+        async for row in rows:
+            writer.write(row)
+            written += 1
+            if written % flush_every == 0:
+                if run_id is not None:
+                    save_checkpoint(store, run_id, written, out)
+                else:
+                    out.flush()
+        completed = True
+    finally:
+        if run_id is not None:
+            save_checkpoint(store, run_id, written, out, finished=completed)
+        else:
+            out.flush()
+            if store is not None:
+                store.flush()
+        metrics = get_metrics()
+        if metrics is not None:
+            stats.metrics = metrics.snapshot()
+        await close_http_pool()
+    return stats
+
+
+def run_bulk(
+    addresses: Iterable[str],
+    out: TextIO,
+    fmt: str = "jsonl",
+    concurrency: int = 100,
+    ordered: bool = True,
+    **kwargs: Any,
+) -> BulkStats:
+    """Blocking wrapper around `run_bulk_async`."""
+    return asyncio.run(run_bulk_async(addresses, out, fmt, concurrency, ordered, **kwargs))
+
+
+def collect_batch(addresses: Iterable[str], **kwargs: Any) -> ResultBatch:
+    """
+    Scan `addresses` (keyword arguments as for `scan_addresses`) and keep
+    every row in a compact `records.ResultBatch` instead of row dicts.
+    """
+    async def collect() -> ResultBatch:
+        batch = ResultBatch()
+        try:
+            async for row in scan_addresses(addresses, **kwargs):
+                batch.append(row["address"], row["domain"], row)
+        finally:
+            await close_http_pool()
+        return batch
+
+    return asyncio.run(collect())
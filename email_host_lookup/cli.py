@@ -0,0 +1,503 @@
+"""
+cli.py
+Command line interface: a detailed report for one address, or a streaming
+bulk scan of an address file (or stdin) written as JSONL/CSV.
+
+This is the `email-host-lookup` console entry point.  Only argparse is
+imported up front; DNS, the HTTP probes, SQLite and the TUI are loaded by
+the code path that needs them, so `--help` and short jobs start fast.
+"""
+
+import argparse
+import sys
+from typing import List, Optional, Tuple
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(
+        prog="email-host-lookup",
+        description="Detect the email hosting provider of an address or of a whole address list.",
+    )
+    parser.add_argument("email", nargs="?", help="email address to report on")
+    parser.add_argument("--signatures", help="provider signature table (JSON) to use instead of the built-in one")
+    parser.add_argument("--tui", action="store_true", help="start the interactive terminal UI")
+    parser.add_argument(
+        "--nameserver",
+        action="append",
+        metavar="ADDR[:PORT]",
+        help="upstream nameserver for the resolver pool (repeatable; 'system' adds those in /etc/resolv.conf)",
+    )
+    parser.add_argument(
+        "--server-qps", type=float, help="rate limit per upstream nameserver, in queries per second"
+    )
+    parser.add_argument(
+        "--offline",
+        action="append",
+        metavar="FILE",
+        help="answer every DNS query from zone files or passive-DNS JSON exports instead of the network "
+        "(repeatable; HTTP probes are skipped)",
+    )
+    bulk = parser.add_argument_group("bulk mode")
+    bulk.add_argument("-i", "--input", help="file with one address per line, or - for stdin")
+    bulk.add_argument("-o", "--output", default="-", help="output file (default: stdout)")
+    bulk.add_argument("-f", "--format", choices=("jsonl", "csv"), default="jsonl", help="output format")
+    bulk.add_argument("-c", "--concurrency", type=int, default=100, help="domains resolved at once")
+    bulk.add_argument(
+        "--cache-size", type=int, default=100_000, help="DNS answers kept in memory (0 disables the cache)"
+    )
+    bulk.add_argument(
+        "--order",
+        choices=("input", "completion"),
+        default="input",
+        help="emit rows in input order or as soon as each domain resolves",
+    )
+    bulk.add_argument(
+        "--probes", action="store_true", help="also run the SRV, autoconfig and WebFinger probes"
+    )
+    bulk.add_argument(
+        "--mx-ip",
+        action="store_true",
+        help="also classify MX hosts by their IP addresses against the provider prefix table",
+    )
+    bulk.add_argument(
+        "--confidence",
+        type=float,
+        help="stop probing a domain once its scored verdict reaches this confidence "
+        "(default 0.8 with --probes)",
+    )
+    bulk.add_argument(
+        "--full-evidence",
+        action="store_true",
+        help="run every method even when the verdict is already confident",
+    )
+    bulk.add_argument(
+        "--org-domain",
+        action="store_true",
+        help="look up each address's organizational domain (subdomains share one lookup)",
+    )
+    bulk.add_argument(
+        "--deadline",
+        type=float,
+        help="time budget per domain in seconds (shrinks toward the typical lookup time); "
+        "methods still running are cut off and listed in the partial column",
+    )
+    bulk.add_argument("--store", help="SQLite verdict store; fresh verdicts are reused across runs")
+    bulk.add_argument(
+        "--store-ttl", type=float, default=86400, help="seconds a stored verdict stays fresh"
+    )
+    bulk.add_argument(
+        "--run-id",
+        help="name of a resumable run: an interrupted run with the same id continues where it stopped",
+    )
+    bulk.add_argument(
+        "--workers",
+        type=int,
+        default=0,
+        help="shard domains across this many worker processes (-c then applies per worker)",
+    )
+    bulk.add_argument(
+        "--worker-memory-mb",
+        type=float,
+        help="replace a worker once its resident memory exceeds this many MiB",
+    )
+    service = parser.add_argument_group("service mode")
+    service.add_argument(
+        "--serve",
+        metavar="[HOST:]PORT",
+        help="run the HTTP/JSON lookup service (GET /lookup?domain=..., POST /lookup with a batch); "
+        "uses -c, --cache-size and the planner options",
+    )
+    service.add_argument(
+        "--max-pending",
+        type=int,
+        help="lookups admitted at once, running or queued; more are refused with 503 (default: 10 x -c)",
+    )
+    service.add_argument("--max-batch", type=int, default=1000, help="most entries in one batch request")
+    rescan = parser.add_argument_group("rescan mode")
+    rescan.add_argument(
+        "--rescan",
+        metavar="RESULTS",
+        help="refresh an earlier JSONL result file: only expired or failed records are queried again; "
+        "the new results go to --output and provider changes to --diff",
+    )
+    rescan.add_argument("--diff", default="-", help="where to write the provider-change stream (default: stdout)")
+    rescan.add_argument(
+        "--grace",
+        type=float,
+        default=0.0,
+        help="seconds to keep trusting records past their TTL, trading freshness for fewer queries",
+    )
+    metrics = parser.add_argument_group("metrics")
+    metrics.add_argument(
+        "--metrics", action="store_true", help="print timing and query statistics as JSON to stderr after a bulk run"
+    )
+    metrics.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+    metrics.add_argument("--metrics-interval", type=float, help="log a one-line metrics summary every N seconds")
+    return parser
+
+
+def print_report(email_input: str, offline: bool = False) -> int:
+    """Print the full multi-method report for a single address."""
+    from .domains import normalize_domain
+    from .email_host_lookup import (
+        detect_provider_by_autoconfig,
+        detect_provider_by_srv,
+        detect_provider_by_webfinger,
+        get_email_host_info,
+        is_valid_email,
+    )
+
+    if not is_valid_email(email_input):
+        print(f"Invalid email address: {email_input}")
+        return 1
+
+    try:
+        domain_to_lookup = normalize_domain(email_input.split("@")[-1])
+    except ValueError as e:
+        print(f"Invalid email address: {email_input} ({e})")
+        return 1
+    print(f"Looking up email hosting information for: {email_input} (domain: {domain_to_lookup})...")
+
+    try:
+        (
+            resolved_domain,
+            mx_records_list,
+            provider_mx,
+            spf_records_list,
+            provider_spf,
+            dmarc_records_list,
+            provider_dmarc
+        ) = get_email_host_info(domain_to_lookup)
+
+        print(f"\nDomain: {resolved_domain}")
+
+        print(f"\n[MX Record Based]\n  Likely Mail Provider: {provider_mx}")
+        if mx_records_list:
+            print("  MX Records:")
+            for record in mx_records_list:
+                print(f"    - {record}")
+        else:
+            print("  No MX Records found.")
+
+        print(f"\n[SPF Record Based]\n  Likely Mail Provider: {provider_spf}")
+        if spf_records_list:
+            print("  SPF Records:")
+            for record in spf_records_list:
+                print(f"    - {record}")
+        else:
+            print("  No SPF Records found.")
+
+        print(f"\n[DMARC Record Based]\n  Likely Mail Provider: {provider_dmarc}")
+        if dmarc_records_list:
+            print("  DMARC Records:")
+            for record in dmarc_records_list:
+                print(f"    - {record}")
+        else:
+            print("  No DMARC Records found.")
+
+        if offline:
+            print("\n[Autoconfig/Autodiscover Based]\n  Skipped (offline)")
+        else:
+            print(f"\n[Autoconfig/Autodiscover Based]\n  {detect_provider_by_autoconfig(domain_to_lookup)}")
+        print(f"\n[SRV Record Based]\n  {detect_provider_by_srv(domain_to_lookup)}")
+        if offline:
+            print("\n[WebFinger Based]\n  Skipped (offline)")
+        else:
+            print(f"\n[WebFinger Based]\n  {detect_provider_by_webfinger(domain_to_lookup)}")
+
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+def plan_options(args: argparse.Namespace) -> Tuple[Optional[Tuple[str, ...]], Optional[float]]:
+    """Planner methods and threshold requested by the options; no methods means no planner."""
+    if not (args.probes or args.mx_ip or args.confidence is not None or args.full_evidence):
+        return None, None
+    from .planner import ALL_METHODS, DEFAULT_CONFIDENCE, DNS_METHODS, HTTP_METHODS
+
+    methods = ALL_METHODS if args.probes else DNS_METHODS
+    if args.mx_ip:
+        methods += ("mx_ip",)
+    if args.offline:
+        # SRV works from the index; the HTTP probes would need the network.
+        methods = tuple(name for name in methods if name not in HTTP_METHODS)
+    if args.full_evidence:
+        return methods, None
+    return methods, DEFAULT_CONFIDENCE if args.confidence is None else args.confidence
+
+
+def run_bulk_cli(args: argparse.Namespace) -> int:
+    """Stream a bulk scan to the requested output; a summary goes to stderr."""
+    from .bulk import read_addresses, run_bulk
+    from .dns_cache import DnsCache
+    from .resolver import get_cache, set_cache
+
+    set_cache(DnsCache(max_entries=args.cache_size) if args.cache_size > 0 else None)
+
+    if args.run_id and (not args.store or args.output == "-" or args.order != "input"):
+        print("--run-id needs --store, an --output file and input order.", file=sys.stderr)
+        return 1
+    if args.worker_memory_mb and not args.workers:
+        print("--worker-memory-mb needs --workers.", file=sys.stderr)
+        return 1
+    if args.offline and args.workers:
+        print("--offline cannot be combined with --workers.", file=sys.stderr)
+        return 1
+    store = None
+    resume_from = 0
+    if args.store:
+        from .store import VerdictStore
+
+        store = VerdictStore(args.store, ttl=args.store_ttl)
+        if args.run_id:
+            resume_from = store.resume_position(args.run_id)
+            if resume_from:
+                print(f"Resuming run {args.run_id} after {resume_from} rows.", file=sys.stderr)
+
+    server = reporter = None
+    if args.metrics or args.metrics_port is not None or args.metrics_interval:
+        from . import metrics
+
+        metrics.enable_metrics()
+        if args.metrics_port is not None:
+            server = metrics.start_http_server(args.metrics_port)
+        if args.metrics_interval:
+            reporter = metrics.PeriodicLogger(args.metrics_interval).start()
+
+    plan_methods, plan_threshold = plan_options(args)
+
+    mode = "a" if resume_from else "w"
+    out = sys.stdout if args.output == "-" else open(args.output, mode, encoding="utf-8", newline="")
+    try:
+        if args.workers:
+            from .sharded import WorkerConfig, run_sharded
+
+            stats = run_sharded(
+                read_addresses(args.input),
+                out,
+                fmt=args.format,
+                run_id=args.run_id,
+                resume_from=resume_from,
+                workers=args.workers,
+                config=WorkerConfig(
+                    concurrency=args.concurrency,
+                    cache_size=args.cache_size,
+                    memory_limit_mb=args.worker_memory_mb,
+                    probes=args.probes,
+                    signatures_path=args.signatures,
+                    nameservers=tuple(args.nameservers) if args.nameservers else None,
+                    # The servers' budget is shared by all workers.
+                    server_qps=args.server_qps / args.workers if args.server_qps else None,
+                    deadline=args.deadline,
+                    plan_methods=plan_methods,
+                    plan_threshold=plan_threshold,
+                ),
+                ordered=args.order == "input",
+                store=store,
+                org_domains=args.org_domain,
+            )
+        else:
+            from .planner import Planner
+
+            planner = Planner(plan_methods, plan_threshold) if plan_methods else None
+            stats = run_bulk(
+                read_addresses(args.input),
+                out,
+                fmt=args.format,
+                concurrency=args.concurrency,
+                ordered=args.order == "input",
+                store=store,
+                run_id=args.run_id,
+                resume_from=resume_from,
+                probes=args.probes,
+                org_domains=args.org_domain,
+                deadline=args.deadline,
+                planner=planner,
+            )
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    finally:
+        if out is not sys.stdout:
+            out.close()
+        if store is not None:
+            store.close()
+        if reporter is not None:
+            reporter.stop()
+        if server is not None:
+            server.shutdown()
+    summary = stats.as_dict()
+    print(
+        f"{summary['addresses']} addresses, {summary['domains_resolved']} domains resolved "
+        f"({summary['deduplicated']} deduplicated, {summary['store_hits']} from store, "
+        f"{summary['invalid']} invalid, {summary['partial']} partial) "
+        f"in {summary['elapsed']}s",
+        file=sys.stderr,
+    )
+    if summary.get("skipped"):
+        skipped = ", ".join(f"{name}: {count}" for name, count in sorted(summary["skipped"].items()))
+        print(
+            f"Planner skipped {sum(summary['skipped'].values())} probes ({skipped}), "
+            f"saving about {summary['saved_cost']:g} query-equivalents",
+            file=sys.stderr,
+        )
+    if summary.get("interrupted"):
+        resume = f"; rerun with --run-id {args.run_id} to continue" if args.run_id else ""
+        print(f"Interrupted: input reading stopped early{resume}.", file=sys.stderr)
+    cache = get_cache()
+    # With --workers each worker keeps its own cache; the parent's is unused.
+    if cache is not None and not args.workers:
+        cache_stats = cache.stats()
+        print(
+            f"DNS cache: {cache_stats['hits'] + cache_stats['negative_hits']} hits, "
+            f"{cache_stats['misses']} misses (hit ratio {cache_stats['hit_ratio']:.1%})",
+            file=sys.stderr,
+        )
+    if args.metrics and stats.metrics is not None:
+        import json
+
+        print(json.dumps(stats.metrics, indent=2), file=sys.stderr)
+    return 130 if summary.get("interrupted") else 0
+
+
+def run_rescan_cli(args: argparse.Namespace) -> int:
+    """Refresh an earlier result file; a summary goes to stderr."""
+    from .dns_cache import DnsCache
+    from .planner import ALL_METHODS, DNS_METHODS
+    from .rescan import read_results, run_rescan
+    from .resolver import set_cache
+
+    if args.output == "-" or args.output == args.rescan or args.format != "jsonl":
+        print("--rescan needs a new JSONL --output file.", file=sys.stderr)
+        return 1
+    if args.input or args.store or args.run_id or args.workers:
+        print("--rescan cannot be combined with --input, --store, --run-id or --workers.", file=sys.stderr)
+        return 1
+    set_cache(DnsCache(max_entries=args.cache_size) if args.cache_size > 0 else None)
+
+    diff_out = sys.stdout if args.diff == "-" else open(args.diff, "w", encoding="utf-8")
+    try:
+        with open(args.output, "w", encoding="utf-8") as out:
+            stats, rescan = run_rescan(
+                read_results(args.rescan),
+                out,
+                diff_out,
+                concurrency=args.concurrency,
+                methods=(ALL_METHODS if args.probes else DNS_METHODS) + (("mx_ip",) if args.mx_ip else ()),
+                grace=args.grace,
+                ordered=args.order == "input",
+                org_domains=args.org_domain,
+                deadline=args.deadline,
+            )
+    except KeyboardInterrupt:
+        print("Interrupted.", file=sys.stderr)
+        return 130
+    finally:
+        if diff_out is not sys.stdout:
+            diff_out.close()
+    summary = rescan.as_dict()
+    print(
+        f"{stats.addresses} addresses: {summary['fresh']} domains still fresh, {summary['refreshed']} refreshed, "
+        f"{summary['changed']} changed; {summary['methods_run']} methods run, "
+        f"{summary['methods_reused']} reused in {stats.elapsed:.3f}s",
+        file=sys.stderr,
+    )
+    return 0
+
+
+def run_service_cli(args: argparse.Namespace) -> int:
+    """Serve lookups over HTTP until interrupted."""
+    from .dns_cache import DnsCache
+    from .planner import Planner
+    from .resolver import set_cache
+    from .service import run_service
+
+    host, _, port = args.serve.rpartition(":")
+    try:
+        port_number = int(port)
+    except ValueError:
+        print(f"Invalid --serve address: {args.serve}", file=sys.stderr)
+        return 1
+    set_cache(DnsCache(max_entries=args.cache_size) if args.cache_size > 0 else None)
+    if args.metrics:
+        from . import metrics
+
+        metrics.enable_metrics()
+    plan_methods, plan_threshold = plan_options(args)
+    print(f"Serving lookups on http://{host or '127.0.0.1'}:{port_number}/lookup", file=sys.stderr)
+    try:
+        run_service(
+            host or "127.0.0.1",
+            port_number,
+            concurrency=args.concurrency,
+            max_pending=args.max_pending,
+            max_batch=args.max_batch,
+            probes=args.probes,
+            planner=Planner(plan_methods, plan_threshold) if plan_methods else None,
+            deadline=args.deadline,
+            org_domains=args.org_domain,
+        )
+    except KeyboardInterrupt:
+        pass
+    except OSError as e:
+        print(f"Cannot serve on {args.serve}: {e}", file=sys.stderr)
+        return 1
+    return 0
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = build_parser().parse_args(argv)
+    if args.signatures:
+        from .signatures import load_signatures, set_signatures
+
+        set_signatures(load_signatures(args.signatures))
+    args.nameservers = args.nameserver or (["system"] if args.server_qps else None)
+    if args.offline:
+        if args.nameservers:
+            print("--offline cannot be combined with --nameserver or --server-qps.", file=sys.stderr)
+            return 1
+        import time
+
+        from .offline import load_index
+        from .resolver import set_source
+
+        start = time.monotonic()
+        try:
+            index = load_index(args.offline)
+        except (OSError, ValueError) as e:
+            print(f"Cannot load offline data: {e}", file=sys.stderr)
+            return 1
+        set_source(index)
+        print(
+            f"Indexed {len(index)} MX/TXT/SRV records from {len(args.offline)} file(s) "
+            f"in {time.monotonic() - start:.1f}s",
+            file=sys.stderr,
+        )
+    if args.nameservers:
+        from .resolver import configure_nameservers
+
+        configure_nameservers(args.nameservers, rate=args.server_qps)
+    if args.tui:
+        from .email_host_lookup_screen import main as tui_main
+
+        return tui_main()
+    if args.serve:
+        return run_service_cli(args)
+    if args.rescan:
+        return run_rescan_cli(args)
+    if args.input:
+        return run_bulk_cli(args)
+    if not args.email:
+        print("Usage: email-host-lookup <email-address>")
+        print("       email-host-lookup --input <file|-> [--format jsonl|csv]")
+        print("       email-host-lookup --rescan <results.jsonl> --output <new.jsonl> [--diff <file>]")
+        print("       email-host-lookup --serve [HOST:]PORT")
+        print("       email-host-lookup --tui")
+        return 1
+    return print_report(args.email, offline=bool(args.offline))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,167 @@
+"""
+dns_cache.py
+TTL-aware in-memory DNS answer cache with LRU eviction.
+
+Positive answers are kept for their record TTL.  NXDOMAIN and NoAnswer
+results are kept for the negative TTL advertised by the zone's SOA
+(RFC 2308: the smaller of the SOA record's TTL and its MINIMUM field).
+Entries are evicted least-recently-used first once the entry or byte cap
+is exceeded.
+"""
+
+import copy
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional, Tuple
+
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+
+CacheKey = Tuple[str, str]
+
+# Rough per-entry bookkeeping overhead used for the byte cap.
+_ENTRY_OVERHEAD = 200
+
+
+def cache_key(qname: str, rdtype: str) -> CacheKey:
+    """Normalise a query into its cache key."""
+    return qname.rstrip(".").lower(), rdtype.upper()
+
+
+def negative_ttl(exc: Exception, default: int = 60) -> Optional[int]:
+    """
+    Return the RFC 2308 negative-caching TTL of an NXDOMAIN/NoAnswer error,
+    `default` if the response carried no SOA, or None when the error must
+    not be cached (timeouts, SERVFAIL, ...).
+    """
+    if isinstance(exc, dns.resolver.NXDOMAIN):
+        responses: Iterable[Any] = exc.kwargs.get("responses", {}).values()
+    elif isinstance(exc, dns.resolver.NoAnswer):
+        responses = [exc.kwargs.get("response")]
+    else:
+        return None
+    for response in responses:
+        for rrset in getattr(response, "authority", []):
+            if rrset.rdtype == dns.rdatatype.SOA and len(rrset):
+                return min(rrset.ttl, rrset[0].minimum)
+    return default
+
+
+class DnsCache:
+    """
+    Cache of DNS answers keyed by (qname, rdtype).
+
+    Values are either an RRset or the NXDOMAIN/NoAnswer exception to
+    re-raise.  Thread safe, so blocking and asyncio callers can share it.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 100_000,
+        max_bytes: Optional[int] = None,
+        max_ttl: int = 86400,
+        default_negative_ttl: int = 60,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_ttl = max_ttl
+        self.default_negative_ttl = default_negative_ttl
+        self.clock = clock
+        self._entries: "OrderedDict[CacheKey, Tuple[float, Any, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def lookup(self, qname: str, rdtype: str) -> Tuple[bool, Any]:
+        """Return `(True, value)` for a fresh entry, else `(False, None)`."""
+        key = cache_key(qname, rdtype)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires, value, size = entry
+                if expires > self.clock():
+                    self._entries.move_to_end(key)
+                    if isinstance(value, Exception):
+                        self.negative_hits += 1
+                        # A fresh copy, so raising it does not grow a shared traceback.
+                        value = copy.copy(value)
+                    else:
+                        self.hits += 1
+                    return True, value
+                del self._entries[key]
+                self.bytes -= size
+                self.expirations += 1
+            self.misses += 1
+            return False, None
+
+    def remaining(self, qname: str, rdtype: str) -> Optional[float]:
+        """Seconds until the entry for the query expires, or None if there is none."""
+        with self._lock:
+            entry = self._entries.get(cache_key(qname, rdtype))
+        return None if entry is None else max(0.0, entry[0] - self.clock())
+
+    def store_answer(self, qname: str, rdtype: str, rrset: dns.rrset.RRset) -> None:
+        """Cache a positive answer for its TTL."""
+        self._store(cache_key(qname, rdtype), rrset, rrset.ttl, len(rrset.to_text()))
+
+    def store_error(self, qname: str, rdtype: str, exc: Exception) -> bool:
+        """Cache an NXDOMAIN/NoAnswer error; returns False if it is not cacheable."""
+        ttl = negative_ttl(exc, self.default_negative_ttl)
+        if ttl is None:
+            return False
+        # Cached errors keep their response message for the SOA; count it.
+        # The copy drops the traceback, which would pin the raising frames.
+        self._store(cache_key(qname, rdtype), copy.copy(exc), ttl, 512)
+        return True
+
+    def _store(self, key: CacheKey, value: Any, ttl: int, size: int) -> None:
+        ttl = min(ttl, self.max_ttl)
+        if ttl <= 0:
+            return
+        size += _ENTRY_OVERHEAD
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.bytes -= old[2]
+            self._entries[key] = (self.clock() + ttl, value, size)
+            self.bytes += size
+            while self._entries and (
+                len(self._entries) > self.max_entries
+                or (self.max_bytes is not None and self.bytes > self.max_bytes)
+            ):
+                _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+
+    @property
+    def hit_ratio(self) -> float:
+        total = self.hits + self.negative_hits + self.misses
+        return (self.hits + self.negative_hits) / total if total else 0.0
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for reporting."""
+        return {
+            "entries": len(self._entries),
+            "bytes": self.bytes,
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hit_ratio, 4),
+        }
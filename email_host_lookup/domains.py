@@ -0,0 +1,139 @@
+"""
+domains.py
+Domain normalization and Public Suffix List lookups.
+
+`normalize_domain` folds case, converts internationalized names to their
+IDNA (punycode) form and drops trailing dots, so `EXAMPLE.co.jp.` and
+`example.co.jp` share one lookup.  `organizational_domain` applies the
+Public Suffix List (a precompiled trie shipped as `psl_trie.json`, no
+network needed) to find the RFC 7489 organizational domain used for the
+DMARC fallback and, optionally, as the bulk dedupe key.
+"""
+
+import json
+import os
+import sys
+from typing import Any, Dict, List, Optional
+
+PSL_TRIE_PATH = os.path.join(os.path.dirname(__file__), "psl_trie.json")
+
+# Trie node markers: a rule ends here / an exception rule ends here.
+_RULE = "$"
+_EXCEPTION = "!"
+_WILDCARD = "*"
+
+Trie = Dict[str, Any]
+
+_trie: Optional[Trie] = None
+
+
+def normalize_domain(name: str) -> str:
+    """
+    Return the canonical lookup form of a domain name: lower case, IDNA
+    encoded and without a trailing dot.  Raises ValueError for names that
+    cannot be valid hostnames.
+    """
+    name = name.strip().rstrip(".").lower()
+    if not name:
+        raise ValueError("empty domain name")
+    if not name.isascii():
+        try:
+            name = name.encode("idna").decode("ascii")
+        except UnicodeError as e:
+            raise ValueError(f"invalid internationalized domain name {name!r}: {e}")
+    if len(name) > 253:
+        raise ValueError(f"domain name too long: {name!r}")
+    for label in name.split("."):
+        if not label or len(label) > 63:
+            raise ValueError(f"invalid domain name {name!r}")
+    return name
+
+
+def compile_psl(lines: List[str]) -> Trie:
+    """Compile Public Suffix List rules into a trie keyed by reversed labels."""
+    trie: Trie = {}
+    for line in lines:
+        rule = line.strip().split()[0] if line.strip() else ""
+        if not rule or rule.startswith("//"):
+            continue
+        exception = rule.startswith("!")
+        rule = normalize_domain(rule.lstrip("!").replace("*", "wildcard-placeholder"))
+        node = trie
+        for label in reversed(rule.split(".")):
+            node = node.setdefault(_WILDCARD if label == "wildcard-placeholder" else label, {})
+        node[_EXCEPTION if exception else _RULE] = 1
+    return trie
+
+
+def load_psl_trie() -> Trie:
+    """Return the shipped Public Suffix List trie, loading it on first use."""
+    global _trie
+    if _trie is None:
+        with open(PSL_TRIE_PATH, encoding="utf-8") as fp:
+            _trie = json.load(fp)["trie"]
+    return _trie
+
+
+def public_suffix_labels(labels: List[str], trie: Optional[Trie] = None) -> int:
+    """
+    Return how many trailing labels of `labels` form the public suffix,
+    following the PSL algorithm: exception rules win, then the longest
+    matching rule, with `*` as the implicit default rule.
+    """
+    node = load_psl_trie() if trie is None else trie
+    matched = 1
+    depth = 0
+    for label in reversed(labels):
+        child = node.get(label)
+        if child is not None and _EXCEPTION in child:
+            return depth
+        wildcard = node.get(_WILDCARD)
+        if wildcard is not None:
+            matched = max(matched, depth + 1)
+        if child is None:
+            break
+        depth += 1
+        if _RULE in child:
+            matched = max(matched, depth)
+        node = child
+    return matched
+
+
+def public_suffix(name: str) -> str:
+    """Return the public suffix of a (normalized) domain name."""
+    labels = normalize_domain(name).split(".")
+    return ".".join(labels[-public_suffix_labels(labels):])
+
+
+def organizational_domain(name: str) -> str:
+    """
+    Return the RFC 7489 organizational domain: the public suffix plus one
+    label.  A name that is itself a public suffix is returned unchanged.
+    """
+    labels = normalize_domain(name).split(".")
+    count = public_suffix_labels(labels) + 1
+    return ".".join(labels[-count:])
+
+
+def _compile_main(argv: List[str]) -> int:
+    """`python -m email_host_lookup.domains public_suffix_list.dat` refreshes psl_trie.json."""
+    if len(argv) != 2:
+        print("Usage: python -m email_host_lookup.domains <public_suffix_list.dat>")
+        return 1
+    with open(argv[1], encoding="utf-8") as fp:
+        lines = fp.read().splitlines()
+    version = next((line.split(":", 1)[1].strip() for line in lines if line.startswith("// VERSION:")), "unknown")
+    data = {
+        "source": "https://publicsuffix.org/list/public_suffix_list.dat",
+        "license": "MPL-2.0",
+        "version": version,
+        "trie": compile_psl(lines),
+    }
+    with open(PSL_TRIE_PATH, "w", encoding="utf-8") as fp:
+        json.dump(data, fp, separators=(",", ":"), sort_keys=True)
+    print(f"Wrote {PSL_TRIE_PATH} (PSL version {version})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(_compile_main(sys.argv))
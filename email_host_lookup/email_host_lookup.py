@@ -4,164 +4,158 @@ email_host_lookup.py
 A CLI tool to detect an email hosting provider via multiple DNS and HTTP-based methods.
 """
 
-import dns.resolver
 import sys
-import ssl
-import urllib.request
-from typing import List, Tuple
+from typing import TYPE_CHECKING, Iterable, List, Optional
 
+from .domains import normalize_domain, organizational_domain
+from .metrics import timed
+from .resolver import resolve
+from .signatures import get_signatures
 
+if TYPE_CHECKING:
+    from .records import HostInfo
+
+
+def mx_hosts_from_answer(answers: Iterable) -> List[str]:
+    """Extract sorted MX exchange hostnames from an MX answer."""
+    return sorted(str(r.exchange).rstrip('.') for r in answers)
+
+
+def txt_from_answer(answers: Iterable) -> List[str]:
+    """Decode every TXT record of an answer into a single string."""
+    return [
+        b"".join(r.strings).decode("utf-8") if hasattr(r, "strings") else str(r)
+        for r in answers
+    ]
+
+
+def srv_entries_from_answer(srv: str, answers: Iterable) -> List[str]:
+    """Format SRV targets as `<srv name> → <target>` entries."""
+    return [f"{srv} → {str(r.target).rstrip('.').lower()}" for r in answers]
+
+
+def srv_names(domain: str) -> List[str]:
+    """Mail-related SRV names checked for the given domain."""
+    return [
+        f"_autodiscover._tcp.{domain}",
+        f"_imaps._tcp.{domain}",
+        f"_submission._tcp.{domain}",
+    ]
+
+
+def is_valid_email(address: str) -> bool:
+    """Basic shape check: an `@` that is neither the first nor the last character."""
+    return "@" in address and not address.startswith("@") and not address.endswith("@")
+
+
+@timed("mx")
 def get_mx_records(domain: str) -> List[str]:
     """Fetch MX records for the given domain."""
     try:
-        answers = dns.resolver.resolve(domain, "MX")
-        return sorted(str(r.exchange).rstrip('.') for r in answers)
+        return mx_hosts_from_answer(resolve(domain, "MX"))
     except Exception as e:
         raise Exception(f"Failed to resolve MX records for {domain}: {e}")
 
 
 def detect_provider(mx_hosts: List[str]) -> str:
     """Detect provider based on MX hostnames."""
-    for host in mx_hosts:
-        if "google.com" in host or "googlemail.com" in host:
-            return "Google Workspace"
-        elif "outlook.com" in host or "protection.outlook.com" in host:
-            return "Microsoft 365"
-        elif "yahoodns.net" in host:
-            return "Yahoo Mail"
-        elif "zoho.com" in host:
-            return "Zoho Mail"
-        elif "protonmail" in host or "proton.ch" in host:
-            return "ProtonMail"
-        elif "fastmail" in host or "messagingengine.com" in host:
-            return "Fastmail"
-    return "Unknown or Custom Provider"
+    found = get_signatures()["mx"].first_match(mx_hosts)
+    return found[1].label if found else "Unknown or Custom Provider"
 
 
+@timed("spf")
 def get_spf_record(domain: str) -> List[str]:
     """Fetch SPF (TXT) records for the given domain."""
     try:
-        answers = dns.resolver.resolve(domain, "TXT")
-        spf_records: List[str] = []
-        for r in answers:
-            txt = b"".join(r.strings).decode("utf-8") if hasattr(r, "strings") else str(r)
-            if txt.startswith("v=spf1"):
-                spf_records.append(txt)
-        return spf_records
+        return [txt for txt in txt_from_answer(resolve(domain, "TXT")) if txt.startswith("v=spf1")]
     except Exception as e:
         return [f"Error: {e}"]
 
 
 def detect_provider_by_spf(spf_records: List[str]) -> str:
     """Detect provider by analyzing SPF record contents."""
-    for txt in spf_records:
-        if "include:_spf.google.com" in txt:
-            return "Google Workspace (SPF)"
-        elif "include:spf.protection.outlook.com" in txt:
-            return "Microsoft 365 (SPF)"
-        elif "include:zoho.com" in txt:
-            return "Zoho Mail (SPF)"
-        elif "include:spf.mail.yahoo.com" in txt:
-            return "Yahoo Mail (SPF)"
-        elif "include:_spf.protonmail.ch" in txt:
-            return "ProtonMail (SPF)"
-        elif "include:spf.messagingengine.com" in txt:
-            return "Fastmail (SPF)"
-    return "Unknown or Custom Provider (SPF)"
+    found = get_signatures()["spf"].first_match(spf_records)
+    return found[1].label if found else "Unknown or Custom Provider (SPF)"
 
 
-def get_dmarc_record(domain: str) -> List[str]:
-    """Fetch DMARC (TXT) records for the given domain."""
+def has_dmarc_policy(dmarc_records: List[str]) -> bool:
+    """True if any record is a DMARC policy record."""
+    return any(txt[:8].lower() == "v=dmarc1" for txt in dmarc_records)
+
+
+def dmarc_fallback_domain(domain: str, dmarc_records: List[str]) -> Optional[str]:
+    """
+    Organizational domain to query when `domain` publishes no DMARC policy
+    (RFC 7489, section 6.6.3), or None if there is nothing to fall back to.
+    """
+    if has_dmarc_policy(dmarc_records):
+        return None
+    try:
+        org = organizational_domain(domain)
+    except ValueError:
+        return None
+    return org if org != normalize_domain(domain) else None
+
+
+def _dmarc_txt(domain: str) -> List[str]:
     try:
-        dmarc_domain = f"_dmarc.{domain}"
-        answers = dns.resolver.resolve(dmarc_domain, "TXT")
-        dmarc_records: List[str] = []
-        for r in answers:
-            txt = b"".join(r.strings).decode("utf-8") if hasattr(r, "strings") else str(r)
-            dmarc_records.append(txt)
-        return dmarc_records
+        return txt_from_answer(resolve(f"_dmarc.{domain}", "TXT"))
     except Exception as e:
         return [f"Error: {e}"]
 
 
+@timed("dmarc")
+def get_dmarc_record(domain: str) -> List[str]:
+    """
+    Fetch DMARC (TXT) records for the given domain, falling back to the
+    organizational domain's policy when the domain has none.
+    """
+    records = _dmarc_txt(domain)
+    org = dmarc_fallback_domain(domain, records)
+    if org is not None:
+        # The organizational domain is its own fallback, so one level is enough.
+        org_records = _dmarc_txt(org)
+        if has_dmarc_policy(org_records):
+            return org_records
+    return records
+
+
 def detect_provider_by_dmarc(dmarc_records: List[str]) -> str:
     """Detect provider by analyzing DMARC record contents."""
-    for txt in dmarc_records:
-        if "google.com" in txt:
-            return "Google Workspace (DMARC)"
-        elif "outlook.com" in txt:
-            return "Microsoft 365 (DMARC)"
-        elif "zoho.com" in txt:
-            return "Zoho Mail (DMARC)"
-        elif "yahoo.com" in txt:
-            return "Yahoo Mail (DMARC)"
-        elif "protonmail" in txt:
-            return "ProtonMail (DMARC)"
-        elif "fastmail" in txt:
-            return "Fastmail (DMARC)"
-    return "Unknown or Custom Provider (DMARC)"
+    found = get_signatures()["dmarc"].first_match(dmarc_records)
+    return found[1].label if found else "Unknown or Custom Provider (DMARC)"
 
 
 def detect_provider_by_autoconfig(domain: str) -> str:
     """
     Try Mozilla Autoconfig or Microsoft Autodiscover endpoints.
     Returns a provider hint or status if none respond.
+    The endpoints are probed concurrently (see `http_probe`).
     """
-    urls = [
-        f"https://autoconfig.{domain}/mail/config-v1.1.xml",
-        f"https://{domain}/.well-known/autoconfig/mail/config-v1.1.xml",
-        f"https://autodiscover.{domain}/autodiscover/autodiscover.xml",
-    ]
-    ctx = ssl.create_default_context()
-    for url in urls:
-        try:
-            with urllib.request.urlopen(url, context=ctx, timeout=5) as resp:
-                content = resp.read(4096).decode("utf-8", errors="ignore").lower()
-                if "google.com" in content:
-                    return f"Google Workspace (autoconfig: {url})"
-                elif "outlook.com" in content or "office365.com" in content:
-                    return f"Microsoft 365 (autodiscover: {url})"
-                elif "zoho.com" in content:
-                    return f"Zoho Mail (autoconfig: {url})"
-                elif "fastmail.com" in content or "messagingengine.com" in content:
-                    return f"Fastmail (autoconfig: {url})"
-                elif "protonmail" in content or "proton.ch" in content:
-                    return f"ProtonMail (autoconfig: {url})"
-                else:
-                    return f"Autoconfig present but provider unknown: {url}"
-        except Exception:
-            continue
-    return "No response from autoconfig/autodiscover endpoints"
+    from .http_probe import async_detect_provider_by_autoconfig, run_sync
+    return run_sync(async_detect_provider_by_autoconfig(domain))
 
 
 def detect_provider_by_srv(domain: str) -> str:
     """
     Check common mail-related SRV records for service discovery.
+    The SRV queries are sent concurrently through the asyncio engine.
     """
-    srv_names = [
-        f"_autodiscover._tcp.{domain}",
-        f"_imaps._tcp.{domain}",
-        f"_submission._tcp.{domain}",
-    ]
-    found: List[str] = []
-    for srv in srv_names:
-        try:
-            answers = dns.resolver.resolve(srv, "SRV")
-            for r in answers:
-                target = str(r.target).rstrip('.').lower()
-                found.append(f"{srv} → {target}")
-        except Exception:
-            continue
+    import asyncio
+    from .async_lookup import async_detect_provider_by_srv
+    return asyncio.run(async_detect_provider_by_srv(domain))
+
+
+def detect_provider_by_srv_entries(found: List[str]) -> str:
+    """Classify formatted SRV entries (see `srv_entries_from_answer`)."""
     if not found:
         return "No mail-related SRV records found"
     # Heuristic based on discovered targets
+    srv = get_signatures()["srv"]
     for entry in found:
-        if "google.com" in entry:
-            return f"Google Workspace (SRV: {entry})"
-        elif "outlook.com" in entry or "office365.com" in entry:
-            return f"Microsoft 365 (SRV: {entry})"
-        elif "zoho.com" in entry:
-            return f"Zoho Mail (SRV: {entry})"
+        rule = srv.match(entry.rsplit(" → ", 1)[-1])
+        if rule is not None:
+            return rule.label.format(entry=entry)
     return "Mail-related SRV record(s) found, provider unknown:\n  " + "\n  ".join(found)
 
 
@@ -169,108 +163,22 @@ def detect_provider_by_webfinger(domain: str) -> str:
     """
     Attempt a WebFinger lookup to discover account metadata.
     """
-    url = f"https://{domain}/.well-known/webfinger?resource=acct:user@{domain}"
-    ctx = ssl.create_default_context()
-    try:
-        with urllib.request.urlopen(url, context=ctx, timeout=5) as resp:
-            content = resp.read(4096).decode("utf-8", errors="ignore").lower()
-            if "google" in content:
-                return "Google (WebFinger)"
-            elif "microsoft" in content or "outlook" in content:
-                return "Microsoft (WebFinger)"
-            elif "zoho" in content:
-                return "Zoho (WebFinger)"
-            return "WebFinger present but provider unknown"
-    except Exception as e:
-        return f"No response from WebFinger endpoint: {e}"
-
-
-def get_email_host_info(domain: str) -> Tuple[
-    str,
-    List[str],
-    str,
-    List[str],
-    str,
-    List[str],
-    str
-]:
+    from .http_probe import async_detect_provider_by_webfinger, run_sync
+    return run_sync(async_detect_provider_by_webfinger(domain))
+
+
+def get_email_host_info(domain: str) -> "HostInfo":
     """
     Aggregate detection results from MX, SPF, DMARC methods.
+    Returns a `records.HostInfo`, which also unpacks like a 7-tuple.
+    Thin blocking wrapper around the asyncio engine, which queries all
+    record types for the domain concurrently.
     """
-    mx_records = get_mx_records(domain)
-    provider_mx = detect_provider(mx_records)
-
-    spf_records = get_spf_record(domain)
-    provider_spf = detect_provider_by_spf(spf_records)
-
-    dmarc_records = get_dmarc_record(domain)
-    provider_dmarc = detect_provider_by_dmarc(dmarc_records)
-
-    return (
-        domain,
-        mx_records,
-        provider_mx,
-        spf_records,
-        provider_spf,
-        dmarc_records,
-        provider_dmarc
-    )
+    import asyncio
+    from .async_lookup import async_get_email_host_info
+    return asyncio.run(async_get_email_host_info(domain))
 
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Usage: python email_host_lookup.py <email-address>")
-        sys.exit(1)
-
-    email_input = sys.argv[1]
-    if "@" not in email_input or email_input.startswith("@") or email_input.endswith("@"):
-        print(f"Invalid email address: {email_input}")
-        sys.exit(1)
-
-    domain_to_lookup = email_input.split("@")[-1]
-    print(f"Looking up email hosting information for: {email_input} (domain: {domain_to_lookup})...")
-
-    try:
-        (
-            resolved_domain,
-            mx_records_list,
-            provider_mx,
-            spf_records_list,
-            provider_spf,
-            dmarc_records_list,
-            provider_dmarc
-        ) = get_email_host_info(domain_to_lookup)
-
-        print(f"\nDomain: {resolved_domain}")
-
-        print(f"\n[MX Record Based]\n  Likely Mail Provider: {provider_mx}")
-        if mx_records_list:
-            print("  MX Records:")
-            for record in mx_records_list:
-                print(f"    - {record}")
-        else:
-            print("  No MX Records found.")
-
-        print(f"\n[SPF Record Based]\n  Likely Mail Provider: {provider_spf}")
-        if spf_records_list:
-            print("  SPF Records:")
-            for record in spf_records_list:
-                print(f"    - {record}")
-        else:
-            print("  No SPF Records found.")
-
-        print(f"\n[DMARC Record Based]\n  Likely Mail Provider: {provider_dmarc}")
-        if dmarc_records_list:
-            print("  DMARC Records:")
-            for record in dmarc_records_list:
-                print(f"    - {record}")
-        else:
-            print("  No DMARC Records found.")
-
-        print(f"\n[Autoconfig/Autodiscover Based]\n  {detect_provider_by_autoconfig(domain_to_lookup)}")
-        print(f"\n[SRV Record Based]\n  {detect_provider_by_srv(domain_to_lookup)}")
-        print(f"\n[WebFinger Based]\n  {detect_provider_by_webfinger(domain_to_lookup)}")
-
-    except Exception as e:
-        print(f"Error: {e}")
-        sys.exit(1)
+    from .cli import main
+    sys.exit(main())
@@ -2,7 +2,6 @@
 # Provides EmailHostLookupScreen for use in Textual apps and also runs as a standalone TUI if executed directly.
 
 from typing import Optional, TYPE_CHECKING
-import asyncio
 import sys
 
 if TYPE_CHECKING:
@@ -15,50 +14,118 @@ def get_email_host_lookup_screen() -> Optional["Screen"]:
     global _instance
     try:
         # Ensure all necessary imports for the screen are here
+        import asyncio
+        from rich.markup import escape
         from textual.screen import Screen
-        from textual.widgets import Input, Button, Static, RichLog
-        from textual.containers import Vertical
+        from textual.widgets import Input, Button, Static, RichLog, ProgressBar
+        from textual.containers import Horizontal, Vertical
         # import dns.resolver # No longer directly used here, moved to email_host_lookup.py
-        from .email_host_lookup import get_email_host_info # Import the core logic
+        from .async_lookup import stream_method_verdicts # Streams each method's verdict as it resolves
+        from .bulk import BulkStats, count_addresses, read_addresses, scan_addresses
+        from .domains import normalize_domain
+        from .email_host_lookup import is_valid_email
 
         class EmailHostLookupScreen(Screen):
             """Screen to input an email address and display its hosting provider."""
 
             BINDINGS = [("ctrl+w", "app.quit", "Quit")] # Correct binding
 
+            # Seconds between bulk panel refreshes; rows are batched in between.
+            BULK_REFRESH = 0.25
+
             def compose(self): # Full original compose
                 yield Vertical(
                     Static("Enter an email address to lookup its mail host:", id="prompt"),
                     Input(placeholder="user@example.com", id="email_input"),
                     Button("Lookup", id="lookup_button"),
-                    RichLog(highlight=True, id="output_log", max_lines=20) # Changed TextLog to RichLog
+                    RichLog(highlight=True, markup=True, id="output_log", max_lines=40), # Changed TextLog to RichLog
+                    Static("Or scan an address file (one address per line):", id="bulk_prompt"),
+                    Horizontal(
+                        Input(placeholder="addresses.txt", id="bulk_path"),
+                        Button("Scan file", id="bulk_button"),
+                        id="bulk_controls",
+                    ),
+                    ProgressBar(id="bulk_progress", show_eta=True),
+                    Static("", id="bulk_status"),
+                    RichLog(markup=True, id="bulk_log", max_lines=500),
                 )
 
             def on_button_pressed(self, event: Button.Pressed) -> None: # Full original method
                 if event.button.id == "lookup_button":
                     email_input = self.query_one("#email_input", Input).value
                     self.set_focus(None) # Important original line
-                    asyncio.create_task(self.lookup_and_display(email_input))
+                    # A new lookup replaces one still in progress.
+                    self.run_worker(self.lookup_and_display(email_input), group="lookup", exclusive=True)
+                elif event.button.id == "bulk_button":
+                    path = self.query_one("#bulk_path", Input).value.strip()
+                    self.set_focus(None)
+                    self.run_worker(self.scan_file(path), group="bulk", exclusive=True)
 
             async def lookup_and_display(self, email: str) -> None: # Full original method
                 output = self.query_one("#output_log", RichLog) # Changed TextLog to RichLog
                 output.clear()
 
-                if "@" not in email:
+                if not is_valid_email(email):
                     output.write("[red]Invalid email address[/red]")
                     return
+                try:
+                    domain = normalize_domain(email.split("@")[-1])
+                except ValueError as e:
+                    output.write(f"[red]Invalid email address: {escape(str(e))}[/red]")
+                    return
 
-                domain = email.split("@")[-1]
-                output.write(f"[bold]Looking up MX records for:[/bold] {domain}")
-
+                output.write(f"[bold]Looking up mail host for:[/bold] {escape(domain)}")
+                # Every method runs concurrently; each verdict is shown as soon as it arrives.
+                async for method, verdict, records in stream_method_verdicts(domain):
+                    color = "red" if verdict.startswith("Error") else "cyan"
+                    output.write(f"[{color}]{method}:[/{color}] {escape(verdict)}")
+                    if records:
+                        output.write(f"    [dim]{escape(', '.join(records))}[/dim]")
+
+            async def scan_file(self, path: str) -> None:
+                """Scan an address file, keeping the progress bar and throughput live."""
+                progress = self.query_one("#bulk_progress", ProgressBar)
+                status = self.query_one("#bulk_status", Static)
+                log = self.query_one("#bulk_log", RichLog)
+                log.clear()
+                if not path:
+                    status.update("[red]Enter the path of an address file.[/red]")
+                    return
                 try:
-                    # Use the imported function from email_host_lookup.py
-                    _, mx_hosts, provider = await get_email_host_info(domain)
-                    output.write(f"[green]MX Records:[/green] {', '.join(mx_hosts)}")
-                    output.write(f"[cyan]Likely mail provider:[/cyan] {provider}")
-                except Exception as e:
-                    output.write(f"[red]Failed to resolve: {e}[/red]") # Simplified error message
+                    # Counting runs in a thread so a huge file does not stall the UI.
+                    total = await asyncio.to_thread(count_addresses, path)
+                except OSError as e:
+                    status.update(f"[red]Cannot read {escape(path)}: {escape(str(e))}[/red]")
                     return
+                progress.update(total=total, progress=0)
+
+                stats = BulkStats()
+                loop = asyncio.get_running_loop()
+                pending = []
+                done = 0
+                last_refresh = loop.time()
+
+                def refresh(suffix: str = "") -> None:
+                    for line in pending:
+                        log.write(line)
+                    pending.clear()
+                    elapsed = max(stats.elapsed, 1e-6)
+                    progress.update(progress=done)
+                    status.update(
+                        f"{done}/{total} addresses, {stats.domains_resolved} domains "
+                        f"({stats.domains_resolved / elapsed * 60:.0f} domains/min), "
+                        f"{stats.domain_errors} errors, {stats.invalid} invalid{suffix}"
+                    )
+
+                # Rows arrive in completion order so slow domains never hold up the display.
+                async for row in scan_addresses(read_addresses(path), ordered=False, stats=stats):
+                    verdict = row.get("provider_mx") or row.get("error", "")
+                    pending.append(f"{escape(row['address'])}: {escape(verdict)}")
+                    done += 1
+                    if loop.time() - last_refresh >= self.BULK_REFRESH:
+                        refresh()
+                        last_refresh = loop.time()
+                refresh(f" [green]- done in {stats.elapsed:.1f}s[/green]")
 
         if _instance is None:
             _instance = EmailHostLookupScreen()
@@ -88,30 +155,56 @@ def get_email_host_lookup_screen() -> Optional["Screen"]:
 # is covered by tests in tests/test_key_bindings.py, invoked via pytest.
 
 # ==== Main entry point ====
-from textual.app import App, ComposeResult
-from textual.widgets import Header, Footer # Added import
-
-class EmailHostLookupApp(App): # Moved class definition
-    CSS = """
-    #prompt { margin-bottom: 1; }
-    #output_log { height: 7; }
-    """
-    def compose(self) -> ComposeResult:
-        yield Header()
-        screen = get_email_host_lookup_screen()
-        if screen is not None: # This condition is important
-            yield screen
-        else: # This is what happens if get_email_host_lookup_screen() returns None
-            from textual.widgets import Static
-            yield Static(
-                "Failed to create EmailHostLookupScreen. Check dependencies like 'dnspython'.",
-                id="error_message" # This Static widget does not have "#prompt"
-            )
-        yield Footer()
+# The app class is defined on first use, so importing this module (or the
+# package) does not load textual until the TUI is actually started.
+_app_class: Optional[type] = None
+
+
+def _build_app_class() -> type:
+    global _app_class
+    if _app_class is not None:
+        return _app_class
+    from textual.app import App, ComposeResult
+    from textual.widgets import Header, Footer # Added import
+
+    class EmailHostLookupApp(App): # Moved class definition
+        CSS = """
+        #prompt { margin-bottom: 1; }
+        #output_log { height: 10; }
+        #bulk_prompt { margin-top: 1; }
+        #bulk_controls { height: auto; }
+        #bulk_path { width: 1fr; }
+        #bulk_log { height: 1fr; }
+        """
+        def compose(self) -> ComposeResult:
+            yield Header()
+            screen = get_email_host_lookup_screen()
+            if screen is not None: # This condition is important
+                yield screen
+            else: # This is what happens if get_email_host_lookup_screen() returns None
+                from textual.widgets import Static
+                yield Static(
+                    "Failed to create EmailHostLookupScreen. Check dependencies like 'dnspython'.",
+                    id="error_message" # This Static widget does not have "#prompt"
+                )
+            yield Footer()
 
-if __name__ == "__main__":
+    _app_class = EmailHostLookupApp
+    return _app_class
+
+
+def __getattr__(name: str):
+    # PEP 562: `from email_host_lookup.email_host_lookup_screen import EmailHostLookupApp`
+    # builds the class lazily.
+    if name == "EmailHostLookupApp":
+        return _build_app_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+def main() -> int:
+    """Run the TUI; also reachable as `email-host-lookup --tui`."""
     try:
-        EmailHostLookupApp().run()
+        _build_app_class()().run()
     except ImportError as e:
         # This error handling is important for users trying to run the app directly
         # without having installed dependencies.
@@ -126,7 +219,12 @@ if __name__ == "__main__":
         else:
             print("An import error occurred. Ensure all dependencies are installed.")
         print(f"Original error: {e}")
-        sys.exit(1)
+        return 1
     except Exception as e:
         print(f"An unexpected error occurred while trying to run the EmailHostLookupApp: {e}")
-        sys.exit(1)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
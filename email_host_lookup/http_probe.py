@@ -0,0 +1,384 @@
+"""
+http_probe.py
+Concurrent HTTPS probes for autoconfig/autodiscover and WebFinger.
+
+All probes share one SSL context and a per-event-loop keep-alive connection
+pool.  The autoconfig URLs of a domain are raced concurrently and the
+losers are cancelled as soon as one answer names a provider.  Response
+bodies are stream-parsed through the signature matcher and reading stops
+at the first match.
+
+Unless a caller passes its own `timeout`, probes time out adaptively: a few
+times the recent p95 response time, between `MIN_TIMEOUT` and
+`DEFAULT_TIMEOUT` (see `latency.LatencyTracker`).
+"""
+
+import asyncio
+import codecs
+import ssl
+import time
+import weakref
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, NamedTuple, Optional, Tuple, TypeVar
+from urllib.parse import urljoin, urlsplit
+
+from .latency import LatencyTracker
+from .metrics import get_metrics, timed
+from .signatures import Rule, get_signatures
+
+DEFAULT_TIMEOUT = 5.0
+MIN_TIMEOUT = 1.0
+# Bytes of each body inspected, as with the original read(4096).
+BODY_LIMIT = 4096
+MAX_REDIRECTS = 3
+USER_AGENT = "email_host_lookup"
+
+T = TypeVar("T")
+Connection = Tuple[asyncio.StreamReader, asyncio.StreamWriter]
+AddressOverride = Callable[[str, int], Tuple[str, int]]
+
+_ssl_context: Optional[ssl.SSLContext] = None
+_address_override: Optional[AddressOverride] = None
+# Times of probes the server answered (with any status).
+_latency = LatencyTracker(MIN_TIMEOUT, DEFAULT_TIMEOUT)
+
+
+class HttpError(Exception):
+    """Non-success HTTP status or malformed response."""
+
+
+class ProbeResponse(NamedTuple):
+    url: str
+    status: int
+    rule: Optional[Rule]
+
+
+def get_ssl_context() -> ssl.SSLContext:
+    """Return the SSL context shared by every probe, creating it on first use."""
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = ssl.create_default_context()
+    return _ssl_context
+
+
+def set_ssl_context(context: Optional[ssl.SSLContext]) -> None:
+    """Replace the shared SSL context; None restores the default one."""
+    global _ssl_context
+    _ssl_context = context
+
+
+def set_address_override(override: Optional[AddressOverride]) -> None:
+    """
+    Route connections for `(host, port)` to another address, e.g. a local
+    stand-in server.  TLS still verifies the original host name.
+    """
+    global _address_override
+    _address_override = override
+
+
+class ConnectionPool:
+    """
+    Idle keep-alive HTTPS connections keyed by (host, port).  At most
+    `max_idle` connections are kept in total; the least recently used hosts
+    are closed first, so a bulk scan touching each host once stays bounded.
+    """
+
+    def __init__(self, max_idle_per_host: int = 4, max_idle: int = 64) -> None:
+        self.max_idle_per_host = max_idle_per_host
+        self.max_idle = max_idle
+        self._idle: "OrderedDict[Tuple[str, int], List[Connection]]" = OrderedDict()
+        self._idle_count = 0
+        self.opened = 0
+        self.reused = 0
+
+    async def acquire(self, host: str, port: int, fresh: bool = False) -> Tuple[Connection, bool]:
+        """Return `(connection, reused)`; `fresh` skips idle connections."""
+        idle = self._idle.get((host, port))
+        while idle and not fresh:
+            reader, writer = idle.pop()
+            self._idle_count -= 1
+            if not idle:
+                del self._idle[(host, port)]
+            if not writer.is_closing() and not reader.at_eof():
+                self.reused += 1
+                return (reader, writer), True
+            writer.close()
+        connect_host, connect_port = (
+            _address_override(host, port) if _address_override is not None else (host, port)
+        )
+        self.opened += 1
+        conn = await asyncio.open_connection(
+            connect_host, connect_port, ssl=get_ssl_context(), server_hostname=host
+        )
+        return conn, False
+
+    def release(self, host: str, port: int, conn: Connection, reusable: bool) -> None:
+        idle = self._idle.get((host, port), [])
+        if not reusable or len(idle) >= self.max_idle_per_host or conn[1].is_closing():
+            conn[1].close()
+            return
+        idle.append(conn)
+        self._idle[(host, port)] = idle
+        self._idle.move_to_end((host, port))
+        self._idle_count += 1
+        while self._idle_count > self.max_idle:
+            _, evicted = self._idle.popitem(last=False)
+            self._idle_count -= len(evicted)
+            for _, writer in evicted:
+                writer.close()
+
+    def close(self) -> None:
+        for idle in self._idle.values():
+            for _, writer in idle:
+                writer.close()
+        self._idle.clear()
+        self._idle_count = 0
+
+    async def aclose(self, timeout: float = 1.0) -> None:
+        """`close`, then wait (up to `timeout` seconds) for the connections to shut down."""
+        writers = [writer for idle in self._idle.values() for _, writer in idle]
+        self.close()
+        if writers:
+            await asyncio.wait([asyncio.ensure_future(writer.wait_closed()) for writer in writers], timeout=timeout)
+
+
+_pools: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, ConnectionPool]" = weakref.WeakKeyDictionary()
+
+
+def get_pool() -> ConnectionPool:
+    """Return the connection pool of the running event loop."""
+    loop = asyncio.get_running_loop()
+    pool = _pools.get(loop)
+    if pool is None:
+        pool = _pools[loop] = ConnectionPool()
+    return pool
+
+
+async def close_pool() -> None:
+    """Close the running event loop's pooled connections; call when its scan or server is done."""
+    pool = _pools.pop(asyncio.get_running_loop(), None)
+    if pool is not None:
+        await pool.aclose()
+
+
+async def _read_headers(reader: asyncio.StreamReader) -> Tuple[int, Dict[str, str]]:
+    status_line = await reader.readline()
+    while True:
+        parts = status_line.decode("latin-1").split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith("HTTP/"):
+            raise HttpError(f"Malformed status line: {status_line!r}")
+        status = int(parts[1])
+        headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        if status >= 200:
+            return status, headers
+        status_line = await reader.readline()  # skip 1xx interim responses
+
+
+async def _read_body(
+    reader: asyncio.StreamReader,
+    headers: Dict[str, str],
+    channel: str,
+    limit: int,
+) -> Tuple[Optional[Rule], bool]:
+    """
+    Stream the body through the matcher of `channel`.  Returns the matched
+    rule and whether the body was fully consumed (so the connection can be
+    reused).
+    """
+    matcher = get_signatures()[channel].stream()
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="ignore")
+    remaining = limit
+    chunked = headers.get("transfer-encoding", "").lower() == "chunked"
+    length = int(headers["content-length"]) if "content-length" in headers else None
+
+    def feed(data: bytes) -> bool:
+        nonlocal remaining
+        data = data[:remaining]
+        remaining -= len(data)
+        return matcher.feed(decoder.decode(data)) is not None or remaining <= 0
+
+    if chunked:
+        while True:
+            size = int((await reader.readline()).split(b";")[0].strip() or b"0", 16)
+            if size == 0:
+                await reader.readline()
+                return matcher.rule, True
+            chunk = await reader.readexactly(size)
+            await reader.readline()
+            if feed(chunk):
+                return matcher.rule, False
+    if length is None:
+        while True:
+            chunk = await reader.read(1024)
+            if not chunk or feed(chunk):
+                return matcher.rule, False
+    while length > 0:
+        chunk = await reader.read(min(length, 1024))
+        if not chunk:
+            raise HttpError("Connection closed before end of body")
+        length -= len(chunk)
+        if feed(chunk) and length > 0:
+            return matcher.rule, False
+    return matcher.rule, True
+
+
+async def fetch(
+    url: str,
+    channel: str,
+    limit: int = BODY_LIMIT,
+    max_redirects: int = MAX_REDIRECTS,
+) -> ProbeResponse:
+    """
+    GET `url` over the shared pool and classify its body with `channel`.
+    Redirects are followed; other non-2xx statuses raise HttpError.
+    """
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.enter("http")
+    start = time.monotonic()
+    try:
+        response = await _fetch(url, channel, limit, max_redirects)
+    except HttpError:
+        _latency.observe(time.monotonic() - start)
+        raise
+    except Exception:
+        if metrics is not None:
+            metrics.count_http(channel, "error")
+        raise
+    finally:
+        if metrics is not None:
+            metrics.exit("http")
+    _latency.observe(time.monotonic() - start)
+    return response
+
+
+def probe_timeout() -> float:
+    """The adaptive probe timeout currently in effect."""
+    return _latency.timeout()
+
+
+async def _fetch(url: str, channel: str, limit: int, max_redirects: int) -> ProbeResponse:
+    pool = get_pool()
+    redirects = 0
+    fresh = False
+    while True:
+        parts = urlsplit(url)
+        if parts.scheme != "https":
+            raise HttpError(f"Refusing non-HTTPS URL: {url}")
+        host = parts.hostname or ""
+        port = parts.port or 443
+        path = parts.path or "/"
+        if parts.query:
+            path += "?" + parts.query
+        (reader, writer), reused = await pool.acquire(host, port, fresh)
+        reusable = False
+        try:
+            writer.write(
+                f"GET {path} HTTP/1.1\r\nHost: {parts.netloc}\r\nUser-Agent: {USER_AGENT}\r\n"
+                "Accept: */*\r\nConnection: keep-alive\r\n\r\n".encode("latin-1")
+            )
+            await writer.drain()
+            try:
+                status, headers = await _read_headers(reader)
+            except (HttpError, ConnectionError):
+                if not reused:
+                    raise
+                # The server dropped an idle keep-alive connection; retry once on a new one.
+                fresh = True
+                continue
+            fresh = False
+            metrics = get_metrics()
+            if metrics is not None:
+                metrics.count_http(channel, f"{status // 100}xx")
+            if status in (301, 302, 303, 307, 308) and "location" in headers:
+                redirects += 1
+                if redirects > max_redirects:
+                    raise HttpError(f"Too many redirects: {url}")
+                url = urljoin(url, headers["location"])
+                continue
+            if not 200 <= status < 300:
+                length = int(headers.get("content-length", -1))
+                if 0 <= length <= limit:
+                    # Drain short error bodies so the connection stays reusable.
+                    await reader.readexactly(length)
+                    reusable = headers.get("connection", "").lower() != "close"
+                raise HttpError(f"HTTP Error {status}")
+            if status == 204:
+                reusable = True
+                return ProbeResponse(url, status, None)
+            rule, reusable = await _read_body(reader, headers, channel, limit)
+            reusable = reusable and headers.get("connection", "").lower() != "close"
+            return ProbeResponse(url, status, rule)
+        finally:
+            pool.release(host, port, (reader, writer), reusable)
+
+
+def run_sync(coro: Awaitable[T]) -> T:
+    """Run a probe coroutine on a fresh event loop, closing its pooled connections after."""
+    async def runner() -> T:
+        try:
+            return await coro
+        finally:
+            await close_pool()
+    return asyncio.run(runner())
+
+
+def autoconfig_urls(domain: str) -> List[str]:
+    """Autoconfig/autodiscover endpoints tried for the given domain."""
+    return [
+        f"https://autoconfig.{domain}/mail/config-v1.1.xml",
+        f"https://{domain}/.well-known/autoconfig/mail/config-v1.1.xml",
+        f"https://autodiscover.{domain}/autodiscover/autodiscover.xml",
+    ]
+
+
+@timed("autoconfig")
+async def async_detect_provider_by_autoconfig(domain: str, timeout: Optional[float] = None) -> str:
+    """
+    Race all autoconfig/autodiscover endpoints of the domain.  The first
+    response naming a provider wins and the other probes are cancelled;
+    otherwise the first endpoint (in URL order) that answered is reported.
+    """
+    urls = autoconfig_urls(domain)
+    timeout = timeout or probe_timeout()
+
+    async def probe(index: int) -> Tuple[int, ProbeResponse]:
+        return index, await asyncio.wait_for(fetch(urls[index], "autoconfig"), timeout)
+
+    tasks = [asyncio.ensure_future(probe(index)) for index in range(len(urls))]
+    answered: List[int] = []
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            try:
+                index, response = await next_done
+            except Exception:
+                continue
+            if response.rule is not None:
+                return response.rule.label.format(url=urls[index])
+            answered.append(index)
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    if answered:
+        return f"Autoconfig present but provider unknown: {urls[min(answered)]}"
+    return "No response from autoconfig/autodiscover endpoints"
+
+
+@timed("webfinger")
+async def async_detect_provider_by_webfinger(domain: str, timeout: Optional[float] = None) -> str:
+    """Attempt a WebFinger lookup to discover account metadata."""
+    url = f"https://{domain}/.well-known/webfinger?resource=acct:user@{domain}"
+    try:
+        response = await asyncio.wait_for(fetch(url, "webfinger"), timeout or probe_timeout())
+    except Exception as e:
+        return f"No response from WebFinger endpoint: {e}"
+    if response.rule is not None:
+        return response.rule.label
+    return "WebFinger present but provider unknown"
@@ -0,0 +1,232 @@
+"""
+ipprefix.py
+Provider detection from the IP addresses of a domain's MX hosts.
+
+A vanity MX name (`mx.customer.com`) hides which provider receives the
+mail, but its addresses usually do not.  The `mx_ip` channel of the
+signature table lists each provider's published mail prefixes (CIDR).
+They are compiled into a `PrefixTable`: per address family, the nested
+prefixes are flattened into sorted, non-overlapping ranges, so the
+longest matching prefix of an address is one binary search.  A batch of
+addresses is deduplicated and searched in sorted order, so each search
+only looks past the range the previous one ended in.
+
+An MX host's A and AAAA records are resolved once and its classification
+is kept in `MxAddressCache` for the shortest TTL of the answers, so the
+MX hosts that thousands of domains share cost one lookup per scan.
+"""
+
+import asyncio
+import ipaddress
+import socket
+import time
+from array import array
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+import dns.resolver
+
+from .resolver import observe_ttl, resolve_async, watch_ttls
+from .signatures import Rule, get_signatures
+
+_NO_MATCH = -1
+
+# Address families by IP version, and the number of addresses in each.
+_FAMILIES = ((4, socket.AF_INET), (6, socket.AF_INET6))
+_SIZES = {4: 1 << 32, 6: 1 << 128}
+
+# An MX host's addresses, each with the prefix rule it matched.
+HostAddresses = List[Tuple[str, Optional[Rule]]]
+
+
+def parse_address(value: str) -> Optional[Tuple[int, int]]:
+    """`(version, integer)` of an IP address string, or None if it is not one."""
+    for version, family in _FAMILIES:
+        try:
+            return version, int.from_bytes(socket.inet_pton(family, value), "big")
+        except (OSError, ValueError):
+            continue
+    return None
+
+
+class PrefixTable:
+    """
+    Longest-prefix match of IP addresses against CIDR prefixes mapped to
+    rule priorities.  Equal prefixes keep the best (lowest) priority.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]] = ()) -> None:
+        prefixes: Dict[int, Dict[Tuple[int, int], int]] = {4: {}, 6: {}}
+        for pattern, priority in patterns:
+            network = ipaddress.ip_network(pattern.strip(), strict=False)
+            first = int(network.network_address)
+            key = (first, first + network.num_addresses - 1)
+            known = prefixes[network.version].get(key)
+            if known is None or priority < known:
+                prefixes[network.version][key] = priority
+        # Per family: range start addresses, and each range's priority.
+        self._ranges = {version: self._flatten(found, _SIZES[version]) for version, found in prefixes.items()}
+
+    @staticmethod
+    def _flatten(prefixes: Dict[Tuple[int, int], int], size: int) -> Tuple[Sequence[int], array]:
+        starts: List[int] = [0]
+        values = array("i", [_NO_MATCH])
+
+        def mark(at: int, value: int) -> None:
+            # The range from `at` on belongs to `value`, until the next mark.
+            if starts[-1] == at:
+                values[-1] = value
+                if len(values) > 1 and values[-2] == value:
+                    starts.pop()
+                    values.pop()
+            elif values[-1] != value:
+                starts.append(at)
+                values.append(value)
+
+        # Enclosing prefixes come first; `open_` holds the ones still open.
+        open_: List[Tuple[int, int]] = []
+        for (first, last), priority in sorted(prefixes.items(), key=lambda item: (item[0][0], -item[0][1])):
+            while open_ and open_[-1][0] < first:
+                end, _ = open_.pop()
+                mark(end + 1, open_[-1][1] if open_ else _NO_MATCH)
+            mark(first, priority)
+            open_.append((last, priority))
+        while open_:
+            end, _ = open_.pop()
+            mark(end + 1, open_[-1][1] if open_ else _NO_MATCH)
+        if starts[-1] >= size:
+            starts.pop()
+            values.pop()
+        return starts, values
+
+    def __len__(self) -> int:
+        """Number of flattened ranges, gaps included."""
+        return sum(len(values) for _, values in self._ranges.values())
+
+    def search(self, address: str) -> int:
+        """Priority of the longest prefix containing `address`, or -1."""
+        parsed = parse_address(address)
+        if parsed is None:
+            return _NO_MATCH
+        starts, values = self._ranges[parsed[0]]
+        return values[bisect_right(starts, parsed[1]) - 1]
+
+    def search_many(self, addresses: Sequence[str]) -> List[int]:
+        """
+        `search` for a whole batch: each distinct address is parsed once,
+        then the addresses of a family are searched in sorted order, each
+        search starting from the range the previous one ended in.
+        """
+        queries: Dict[int, Dict[str, int]] = {4: {}, 6: {}}
+        for address in set(addresses):
+            parsed = parse_address(address)
+            if parsed is not None:
+                queries[parsed[0]][address] = parsed[1]
+        found: Dict[str, int] = {}
+        for version, parsed_addresses in queries.items():
+            starts, values = self._ranges[version]
+            position = 0
+            for address in sorted(parsed_addresses, key=parsed_addresses.__getitem__):
+                position = bisect_right(starts, parsed_addresses[address], position) - 1
+                found[address] = values[position]
+        return [found.get(address, _NO_MATCH) for address in addresses]
+
+
+async def _addresses(host: str, rdtype: str) -> Tuple[List[str], bool]:
+    """`(addresses, cacheable)` of one A/AAAA query; a missing record is an empty answer."""
+    try:
+        return [r.address for r in await resolve_async(host, rdtype)], True
+    except (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer):
+        return [], True
+    except Exception:
+        return [], False
+
+
+class MxAddressCache:
+    """
+    MX hosts' addresses and the prefix rules they match, kept for the
+    shortest TTL of the A/AAAA answers.  Concurrent lookups of one host
+    share a single resolution.
+    """
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self.max_entries = max_entries
+        # host -> (monotonic expiry, addresses)
+        self._entries: "OrderedDict[str, Tuple[float, HostAddresses]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Future[Tuple[float, HostAddresses]]"] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _resolve(self, host: str) -> Tuple[float, HostAddresses]:
+        with watch_ttls() as watch:
+            (v4, v4_ok), (v6, v6_ok) = await asyncio.gather(_addresses(host, "A"), _addresses(host, "AAAA"))
+        ttl = watch.ttl if v4_ok and v6_ok and watch.ttl is not None else 0.0
+        found = v4 + v6
+        return ttl, list(zip(found, get_signatures()["mx_ip"].classify_many(found)))
+
+    async def lookup(self, host: str) -> HostAddresses:
+        """Addresses of `host`, each with the `mx_ip` rule it matched (or None)."""
+        host = host.rstrip(".").lower()
+        entry = self._entries.get(host)
+        now = time.monotonic()
+        if entry is not None and entry[0] > now:
+            self._entries.move_to_end(host)
+            self.hits += 1
+            observe_ttl(entry[0] - now)
+            return entry[1]
+        future = self._inflight.get(host)
+        if future is None:
+            self.misses += 1
+            future = self._inflight[host] = asyncio.ensure_future(self._resolve(host))
+            future.add_done_callback(lambda _: self._inflight.pop(host, None))
+        else:
+            self.hits += 1
+        ttl, found = await asyncio.shield(future)
+        observe_ttl(ttl)
+        if ttl > 0:
+            self._entries[host] = (time.monotonic() + ttl, found)
+            self._entries.move_to_end(host)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return found
+
+
+_cache: Optional[MxAddressCache] = None
+
+
+def get_mx_address_cache() -> MxAddressCache:
+    """Return the shared MX host cache, creating it on first use."""
+    global _cache
+    if _cache is None:
+        _cache = MxAddressCache()
+    return _cache
+
+
+def set_mx_address_cache(cache: Optional[MxAddressCache]) -> None:
+    """Install an MX host cache; None starts a fresh default one on next use."""
+    global _cache
+    _cache = cache
+
+
+async def async_detect_provider_by_mx_ip(mx_hosts: List[str]) -> Tuple[str, List[str]]:
+    """
+    Classify MX hosts by their addresses: `(label, addresses)`.  The first
+    host (in `mx_hosts` order) with an address in a provider prefix wins.
+    """
+    cache = get_mx_address_cache()
+    hosts = [host.rstrip(".").lower() for host in mx_hosts if host.strip(".")]
+    results = await asyncio.gather(*(cache.lookup(host) for host in hosts))
+    addresses = []
+    label = None
+    for host, found in zip(hosts, results):
+        for address, rule in found:
+            addresses.append(address)
+            if label is None and rule is not None:
+                label = rule.label.format(entry=f"{host} → {address}")
+    if label is not None:
+        return label, addresses
+    return ("Unknown or Custom Provider (MX IP)" if addresses else "No MX host addresses found"), addresses
@@ -0,0 +1,70 @@
+"""
+latency.py
+Adaptive timeouts derived from observed latency percentiles.
+
+A fixed timeout is either too short for slow-but-alive servers or far too
+long for dead ones.  `LatencyTracker` keeps a sliding window of recent
+latencies and suggests a timeout a few times the tail quantile, so the
+wait for a dead server follows how fast the live ones actually are.
+"""
+
+import threading
+from collections import deque
+from typing import Deque, List, Optional
+
+# Re-sort the window after this many new samples (quantiles may lag slightly).
+_RESORT_EVERY = 16
+
+
+class LatencyTracker:
+    """
+    Sliding window of recent latencies (seconds).
+
+    `timeout()` is `multiplier` times the `quantile` of the window, clamped
+    to `[floor, ceiling]`; until `min_samples` have been seen it is the
+    ceiling, i.e. the old fixed timeout.
+    """
+
+    def __init__(
+        self,
+        floor: float,
+        ceiling: float,
+        quantile: float = 0.95,
+        multiplier: float = 3.0,
+        window: int = 256,
+        min_samples: int = 20,
+    ) -> None:
+        self.floor = min(floor, ceiling)
+        self.ceiling = ceiling
+        self.q = quantile
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self._samples: Deque[float] = deque(maxlen=window)
+        self._sorted: List[float] = []
+        self._unsorted = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def observe(self, seconds: float) -> None:
+        with self._lock:
+            self._samples.append(seconds)
+            self._unsorted += 1
+
+    def quantile(self, q: Optional[float] = None) -> Optional[float]:
+        """The `q` quantile of the window, or None while it has too few samples."""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return None
+            if self._unsorted >= _RESORT_EVERY or len(self._sorted) < self.min_samples:
+                self._sorted = sorted(self._samples)
+                self._unsorted = 0
+            ordered = self._sorted
+        return ordered[min(len(ordered) - 1, int((self.q if q is None else q) * len(ordered)))]
+
+    def timeout(self) -> float:
+        tail = self.quantile()
+        if tail is None:
+            return self.ceiling
+        return min(self.ceiling, max(self.floor, tail * self.multiplier))
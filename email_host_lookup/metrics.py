@@ -0,0 +1,363 @@
+"""
+metrics.py
+Optional instrumentation: per-method timing histograms, DNS query and HTTP
+probe counters, cache hit ratios and in-flight gauges.
+
+Instrumentation is off by default; every instrumented call site only checks
+whether a `Metrics` object is installed, so the disabled cost is one global
+lookup.  `enable_metrics()` installs one; its `snapshot()` is attached to
+bulk-run statistics, `prometheus()` renders the Prometheus text format (see
+`start_http_server`) and `PeriodicLogger` writes a one-line summary at a
+fixed interval.
+"""
+
+import functools
+import inspect
+import sys
+import threading
+import time
+from bisect import bisect_left
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional, TextIO, Tuple, TypeVar
+
+if TYPE_CHECKING:
+    from http.server import ThreadingHTTPServer
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+PREFIX = "email_host_lookup"
+# Histogram bucket upper bounds in seconds.
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram:
+    """Cumulative-bucket latency histogram in the Prometheus layout."""
+
+    __slots__ = ("counts", "count", "sum")
+
+    def __init__(self) -> None:
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.sum += seconds
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile (inf past the last bucket)."""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float("inf"),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean_ms": round(self.sum / self.count * 1000, 2) if self.count else 0.0,
+            "p50_ms": self.quantile(0.50) * 1000,
+            "p95_ms": self.quantile(0.95) * 1000,
+            "p99_ms": self.quantile(0.99) * 1000,
+        }
+
+
+def dns_outcome(exc: Optional[BaseException]) -> str:
+    """Classify a resolver result for the query counters."""
+    if exc is None:
+        return "noerror"
+    import dns.exception
+    import dns.resolver
+
+    if isinstance(exc, dns.resolver.NXDOMAIN):
+        return "nxdomain"
+    if isinstance(exc, dns.resolver.NoAnswer):
+        return "noanswer"
+    if isinstance(exc, dns.exception.Timeout):
+        return "timeout"
+    if isinstance(exc, dns.resolver.NoNameservers):
+        # Every server answered SERVFAIL (or REFUSED) or was unreachable.
+        return "servfail"
+    return "error"
+
+
+class Metrics:
+    """All counters of one process.  Updates are guarded by a single lock."""
+
+    def __init__(self, clock: Callable[[], float] = time.perf_counter) -> None:
+        self.clock = clock
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self.methods: Dict[str, Histogram] = {}
+        self.dns_latency: Dict[str, Histogram] = {}
+        self.dns_queries: Dict[Tuple[str, str], int] = {}
+        self.http_requests: Dict[Tuple[str, str], int] = {}
+        self.in_flight: Dict[str, int] = {}
+        self.peak_in_flight: Dict[str, int] = {}
+
+    def observe(self, method: str, seconds: float) -> None:
+        """Record the duration of one detection method call."""
+        with self._lock:
+            histogram = self.methods.get(method)
+            if histogram is None:
+                histogram = self.methods[method] = Histogram()
+            histogram.observe(seconds)
+
+    def count_query(self, rdtype: str, outcome: str, seconds: float) -> None:
+        """Record one upstream DNS query (cache hits are counted by the cache)."""
+        with self._lock:
+            key = (rdtype, outcome)
+            self.dns_queries[key] = self.dns_queries.get(key, 0) + 1
+            histogram = self.dns_latency.get(rdtype)
+            if histogram is None:
+                histogram = self.dns_latency[rdtype] = Histogram()
+            histogram.observe(seconds)
+
+    def count_http(self, channel: str, outcome: str) -> None:
+        """Record one HTTP probe request by its status code or error."""
+        with self._lock:
+            key = (channel, outcome)
+            self.http_requests[key] = self.http_requests.get(key, 0) + 1
+
+    def enter(self, kind: str) -> None:
+        """Mark one more `kind` operation (domains, dns, http) in flight."""
+        with self._lock:
+            current = self.in_flight.get(kind, 0) + 1
+            self.in_flight[kind] = current
+            if current > self.peak_in_flight.get(kind, 0):
+                self.peak_in_flight[kind] = current
+
+    def exit(self, kind: str) -> None:
+        with self._lock:
+            self.in_flight[kind] = self.in_flight.get(kind, 0) - 1
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return every metric as plain, JSON-serializable data."""
+        from .resolver import get_cache, get_pool
+
+        cache = get_cache()
+        pool = get_pool()
+        with self._lock:
+            outcomes: Dict[str, int] = {}
+            queries: Dict[str, int] = {}
+            for (rdtype, outcome), count in self.dns_queries.items():
+                queries[rdtype] = queries.get(rdtype, 0) + count
+                outcomes[outcome] = outcomes.get(outcome, 0) + count
+            http: Dict[str, int] = {}
+            for (_, outcome), count in self.http_requests.items():
+                http[outcome] = http.get(outcome, 0) + count
+            return {
+                "uptime": round(time.monotonic() - self.started, 3),
+                "methods": {name: h.summary() for name, h in sorted(self.methods.items())},
+                "dns": {
+                    "queries": queries,
+                    "outcomes": outcomes,
+                    "latency": {name: h.summary() for name, h in sorted(self.dns_latency.items())},
+                },
+                "http": http,
+                "cache": cache.stats() if cache is not None else None,
+                **({"upstreams": pool.stats()} if pool is not None else {}),
+                "in_flight": {
+                    kind: {"current": self.in_flight.get(kind, 0), "peak": peak}
+                    for kind, peak in sorted(self.peak_in_flight.items())
+                },
+            }
+
+    def prometheus(self) -> str:
+        """Render the metrics in the Prometheus text exposition format."""
+        from .resolver import get_cache, get_pool
+
+        lines = []
+
+        def header(name: str, kind: str, help_text: str) -> None:
+            lines.append(f"# HELP {PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}_{name} {kind}")
+
+        def histogram(name: str, label: str, histograms: Dict[str, Histogram]) -> None:
+            for value, h in sorted(histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS + (float("inf"),), h.counts):
+                    cumulative += count
+                    le = "+Inf" if bound == float("inf") else repr(bound)
+                    lines.append(f'{PREFIX}_{name}_bucket{{{label}="{value}",le="{le}"}} {cumulative}')
+                lines.append(f'{PREFIX}_{name}_sum{{{label}="{value}"}} {h.sum:.6f}')
+                lines.append(f'{PREFIX}_{name}_count{{{label}="{value}"}} {h.count}')
+
+        with self._lock:
+            header("method_duration_seconds", "histogram", "Time spent per detection method.")
+            histogram("method_duration_seconds", "method", self.methods)
+            header("dns_query_duration_seconds", "histogram", "Upstream DNS query latency by record type.")
+            histogram("dns_query_duration_seconds", "rdtype", self.dns_latency)
+            header("dns_queries_total", "counter", "Upstream DNS queries by record type and outcome.")
+            for (rdtype, outcome), count in sorted(self.dns_queries.items()):
+                lines.append(f'{PREFIX}_dns_queries_total{{rdtype="{rdtype}",outcome="{outcome}"}} {count}')
+            header("http_requests_total", "counter", "HTTP probe requests by channel and outcome.")
+            for (channel, outcome), count in sorted(self.http_requests.items()):
+                lines.append(f'{PREFIX}_http_requests_total{{channel="{channel}",outcome="{outcome}"}} {count}')
+            header("in_flight", "gauge", "Operations currently in flight.")
+            for kind, current in sorted(self.in_flight.items()):
+                lines.append(f'{PREFIX}_in_flight{{kind="{kind}"}} {current}')
+            header("in_flight_peak", "gauge", "Highest number of operations in flight at once.")
+            for kind, peak in sorted(self.peak_in_flight.items()):
+                lines.append(f'{PREFIX}_in_flight_peak{{kind="{kind}"}} {peak}')
+
+        cache = get_cache()
+        if cache is not None:
+            stats = cache.stats()
+            for key in ("hits", "negative_hits", "misses", "evictions", "expirations"):
+                header(f"dns_cache_{key}_total", "counter", f"DNS cache {key.replace('_', ' ')}.")
+                lines.append(f"{PREFIX}_dns_cache_{key}_total {stats[key]}")
+            header("dns_cache_entries", "gauge", "Entries held by the DNS cache.")
+            lines.append(f"{PREFIX}_dns_cache_entries {stats['entries']}")
+            header("dns_cache_hit_ratio", "gauge", "Share of DNS lookups answered from the cache.")
+            lines.append(f"{PREFIX}_dns_cache_hit_ratio {stats['hit_ratio']:.6f}")
+
+        pool = get_pool()
+        if pool is not None:
+            upstreams = pool.stats()
+            for name, kind, value, help_text in (
+                ("upstream_latency_seconds", "gauge", lambda u: u["latency_ms"] / 1000,
+                 "Smoothed answer time per upstream nameserver."),
+                ("upstream_error_ratio", "gauge", lambda u: u["error_rate"],
+                 "Smoothed failure rate per upstream nameserver."),
+                ("upstream_queries_total", "counter", lambda u: u["queries"],
+                 "Queries sent to each upstream nameserver."),
+                ("upstream_ejected", "gauge", lambda u: int(u["ejected"]),
+                 "1 while an upstream is skipped after repeated failures."),
+            ):
+                header(name, kind, help_text)
+                for upstream in upstreams:
+                    lines.append(f'{PREFIX}_{name}{{server="{upstream["server"]}"}} {value(upstream)}')
+        return "\n".join(lines) + "\n"
+
+    def log_line(self) -> str:
+        """One-line summary for periodic logging."""
+        snap = self.snapshot()
+        parts = [f"uptime={snap['uptime']:.0f}s"]
+        for name, summary in snap["methods"].items():
+            parts.append(f"{name}={summary['count']}/p95<={summary['p95_ms']:g}ms")
+        outcomes = snap["dns"]["outcomes"]
+        parts.append("dns=" + ",".join(f"{k}:{v}" for k, v in sorted(outcomes.items())) if outcomes else "dns=0")
+        if snap["cache"] is not None:
+            parts.append(f"cache_hit={snap['cache']['hit_ratio']:.1%}")
+        for kind, gauge in snap["in_flight"].items():
+            parts.append(f"{kind}_in_flight={gauge['current']}(peak {gauge['peak']})")
+        return " ".join(parts)
+
+
+_metrics: Optional[Metrics] = None
+
+
+def get_metrics() -> Optional[Metrics]:
+    """Return the installed metrics, or None while instrumentation is disabled."""
+    return _metrics
+
+
+def set_metrics(metrics: Optional[Metrics]) -> None:
+    """Install a metrics object; None disables instrumentation."""
+    global _metrics
+    _metrics = metrics
+
+
+def enable_metrics() -> Metrics:
+    """Install (if needed) and return the process-wide metrics."""
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def timed(method: str) -> Callable[[F], F]:
+    """
+    Decorator recording the duration of a (sync or async) detection method
+    under `method`; exceptions are timed too.
+    """
+
+    def decorate(fn: F) -> F:
+        if inspect.iscoroutinefunction(fn):
+
+            @functools.wraps(fn)
+            async def async_wrapper(*args: Any, **kwargs: Any) -> Any:
+                metrics = _metrics
+                if metrics is None:
+                    return await fn(*args, **kwargs)
+                start = metrics.clock()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    metrics.observe(method, metrics.clock() - start)
+
+            return async_wrapper  # type: ignore[return-value]
+
+        @functools.wraps(fn)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            metrics = _metrics
+            if metrics is None:
+                return fn(*args, **kwargs)
+            start = metrics.clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                metrics.observe(method, metrics.clock() - start)
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorate
+
+
+def start_http_server(port: int, addr: str = "127.0.0.1") -> "ThreadingHTTPServer":
+    """
+    Serve `/metrics` in the Prometheus text format from a daemon thread.
+    Call `shutdown()` on the returned server to stop it.
+    """
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    metrics = enable_metrics()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self) -> None:
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = metrics.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer((addr, port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    return server
+
+
+class PeriodicLogger:
+    """Write `Metrics.log_line()` to `stream` every `interval` seconds until stopped."""
+
+    def __init__(self, interval: float, stream: TextIO = sys.stderr) -> None:
+        self.metrics = enable_metrics()
+        self.interval = interval
+        self.stream = stream
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="metrics-log", daemon=True)
+
+    def start(self) -> "PeriodicLogger":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread.is_alive():
+            self._thread.join()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            print(f"[metrics] {self.metrics.log_line()}", file=self.stream, flush=True)
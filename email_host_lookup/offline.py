@@ -0,0 +1,431 @@
+"""
+offline.py
+Classification without network access, from zone files and passive-DNS dumps.
+
+`RecordIndex` stream-parses DNS data already on disk and keeps the MX, TXT
+and SRV records (everything the DNS classifiers ask for) in memory, keyed
+by owner name.  Installed with `resolver.set_source`, it answers every
+query the engine makes, so the usual MX/SPF/DMARC/SRV detection runs
+unchanged against it and no packet leaves the machine.
+
+Two input formats are understood:
+
+- RFC 1035 master ("zone") files: `$ORIGIN`, `$TTL`, relative and `@`
+  owners, blank owners continuing the previous one, parenthesised
+  multi-line records and `;` comments.
+- Passive-DNS exports as JSON lines (or one JSON array, decoded entry by
+  entry) with `rrname`,
+  `rrtype` and `rdata` (a string or a list of strings) and an optional
+  `ttl`, as written by DNSDB (also wrapped in `{"obj": ...}`) and the
+  CIRCL passive-DNS format.
+
+Files are memory-mapped and read line by line (`.gz` files are streamed
+through gzip instead); only lines of the three wanted types are parsed
+past their type field.  Names missing from the index answer NXDOMAIN, and
+names that only have other record types answer NoAnswer, so a dump that
+is not complete makes a domain look record-less rather than failing.
+"""
+
+import gzip
+import json
+import mmap
+import sys
+from itertools import chain
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+import dns.name
+import dns.rdataclass
+import dns.rdatatype
+import dns.resolver
+import dns.rrset
+from dns.rdtypes.ANY.MX import MX
+from dns.rdtypes.ANY.TXT import TXT
+from dns.rdtypes.IN.SRV import SRV
+
+INDEXED_TYPES = ("MX", "TXT", "SRV")
+DEFAULT_TTL = 3600
+
+_CLASSES = {"IN", "CH", "HS", "CS"}
+_TTL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+_PDNS_SUFFIXES = (".json", ".jsonl", ".ndjson")
+
+
+def parse_ttl(text: str) -> int:
+    """Parse a TTL in seconds or BIND units (`1h30m`, `2d`)."""
+    if text.isdigit():
+        return int(text)
+    total = number = 0
+    seen = False
+    for ch in text.lower():
+        if ch.isdigit():
+            number = number * 10 + int(ch)
+            seen = True
+        elif ch in _TTL_UNITS and seen:
+            total += number * _TTL_UNITS[ch]
+            number = 0
+            seen = False
+        else:
+            raise ValueError(f"Invalid TTL: {text}")
+    return total + number
+
+
+def absolute_name(name: str, origin: str) -> str:
+    """Lower-cased owner or target name without the trailing dot."""
+    if name == "@":
+        return origin
+    if name.endswith("."):
+        return name[:-1].lower()
+    return f"{name}.{origin}".lower() if origin else name.lower()
+
+
+def parse_txt(text: str) -> Tuple[bytes, ...]:
+    """Split TXT rdata into its character strings (quoted or bare, with `\\` escapes)."""
+    strings: List[bytes] = []
+    i, end = 0, len(text)
+    while i < end:
+        ch = text[i]
+        if ch.isspace():
+            i += 1
+            continue
+        quoted = ch == '"'
+        if quoted:
+            i += 1
+        out = bytearray()
+        while i < end:
+            ch = text[i]
+            if quoted and ch == '"':
+                i += 1
+                break
+            if not quoted and ch.isspace():
+                break
+            if ch == "\\" and i + 1 < end:
+                if text[i + 1:i + 4].isdigit():
+                    out.append(int(text[i + 1:i + 4]))
+                    i += 4
+                    continue
+                ch = text[i + 1]
+                i += 1
+            out += ch.encode("utf-8")
+            i += 1
+        strings.append(bytes(out))
+    return tuple(strings)
+
+
+def _outside_quotes(line: str) -> Iterator[Tuple[int, str]]:
+    """`(index, char)` of the characters of a line that are not inside a quoted string."""
+    quoted = escaped = False
+    for i, ch in enumerate(line):
+        if escaped:
+            escaped = False
+        elif ch == "\\":
+            escaped = True
+        elif ch == '"':
+            quoted = not quoted
+        elif not quoted:
+            yield i, ch
+
+
+def _strip_comment(line: str) -> str:
+    if ";" not in line:
+        return line
+    if '"' not in line:
+        return line[:line.index(";")]
+    for i, ch in _outside_quotes(line):
+        if ch == ";":
+            return line[:i]
+    return line
+
+
+def _paren_depth(line: str) -> int:
+    if '"' not in line:
+        return line.count("(") - line.count(")")
+    return sum(1 if ch == "(" else -1 for _, ch in _outside_quotes(line) if ch in "()")
+
+
+def _unparen(line: str) -> str:
+    if '"' not in line:
+        return line.replace("(", " ").replace(")", " ")
+    chars = list(line)
+    for i, ch in _outside_quotes(line):
+        if ch in "()":
+            chars[i] = " "
+    return "".join(chars)
+
+
+def _lines(path: str) -> Iterator[str]:
+    """Lines of a file, memory-mapped (or streamed for `.gz`), decoded leniently."""
+    if path.endswith(".gz"):
+        with gzip.open(path, "rb") as fp:
+            for raw in fp:
+                yield raw.decode("utf-8", "replace")
+        return
+    with open(path, "rb") as fp:
+        try:
+            mapped = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # empty file
+            return
+        with mapped:
+            for raw in iter(mapped.readline, b""):
+                yield raw.decode("utf-8", "replace")
+
+
+def zone_records(
+    lines: Iterable[str], origin: str = "", default_ttl: int = DEFAULT_TTL
+) -> Iterator[Tuple[str, int, str, str, str]]:
+    """
+    Yield `(owner, ttl, rdtype, rdata, origin)` for the MX/TXT/SRV records
+    of a zone file, `origin` being the one relative names in the rdata are
+    qualified with; other types are skipped without parsing their rdata.
+    """
+    origin = absolute_name(origin, "") if origin else ""
+    zone_ttl: Optional[int] = None
+    last_ttl = default_ttl
+    owner = origin
+    pending = ""
+    for raw in lines:
+        line = _strip_comment(raw)
+        if pending:
+            line = pending + " " + line
+            pending = ""
+        if "(" in line:
+            if _paren_depth(line) > 0:
+                pending = line.rstrip("\r\n")
+                continue
+            line = _unparen(line)
+        if not line.strip():
+            continue
+        if line.startswith("$"):
+            directive = line.split()
+            if directive[0].upper() == "$ORIGIN" and len(directive) > 1:
+                origin = absolute_name(directive[1], origin)
+            elif directive[0].upper() == "$TTL" and len(directive) > 1:
+                zone_ttl = parse_ttl(directive[1])
+            continue
+        tokens = line.split()
+        index = 0
+        if not line[0].isspace():
+            owner = absolute_name(tokens[0], origin)
+            index = 1
+        ttl: Optional[int] = None
+        while index < len(tokens) - 1:
+            token = tokens[index]
+            if token.upper() in _CLASSES:
+                index += 1
+            elif ttl is None and token[0].isdigit():
+                try:
+                    ttl = parse_ttl(token)
+                except ValueError:
+                    break
+                index += 1
+            else:
+                break
+        if index >= len(tokens):
+            continue
+        if ttl is not None:
+            last_ttl = ttl
+        rdtype = tokens[index].upper()
+        if rdtype not in INDEXED_TYPES:
+            continue
+        rdata = line.split(None, index + 1)[-1].strip() if index + 1 < len(tokens) else ""
+        yield owner, ttl if ttl is not None else zone_ttl if zone_ttl is not None else last_ttl, rdtype, rdata, origin
+
+
+def passive_dns_records(
+    lines: Iterable[str], default_ttl: int = DEFAULT_TTL
+) -> Iterator[Tuple[str, int, str, str, str]]:
+    """
+    Yield `(owner, ttl, rdtype, rdata, origin)` for the MX/TXT/SRV entries
+    of a passive-DNS export; its names are absolute, so `origin` is empty.
+    """
+    lines = iter(lines)
+    first = next((line for line in lines if line.strip()), "")
+    if first.lstrip().startswith("["):
+        # One JSON array rather than JSON lines.
+        entries: Iterable[Any] = _json_array(chain([first], lines))
+    else:
+        entries = _json_lines(chain([first], lines))
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        entry = entry.get("obj", entry)
+        rdtype = str(entry.get("rrtype", "")).upper()
+        if rdtype not in INDEXED_TYPES or "rrname" not in entry:
+            continue
+        owner = absolute_name(entry["rrname"], "")
+        ttl = int(entry.get("ttl", default_ttl))
+        rdata = entry.get("rdata", [])
+        for value in [rdata] if isinstance(rdata, str) else rdata:
+            yield owner, ttl, rdtype, value, ""
+
+
+def _json_lines(lines: Iterable[str]) -> Iterator[Any]:
+    for line in lines:
+        if line.strip():
+            try:
+                yield json.loads(line)
+            except ValueError:
+                continue
+
+
+def _json_array(lines: Iterable[str]) -> Iterator[Any]:
+    """
+    The entries of a JSON array, decoded one at a time as lines arrive, so
+    only the current line and entry are held rather than the whole export.
+    Decoding stops at the closing bracket or at an entry that never
+    completes.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    position = 0
+    opened = False
+    for line in lines:
+        buffer = buffer[position:] + line if position else buffer + line
+        position = 0
+        if opened and line.rstrip().rstrip(",")[-1:] not in ("}", "]"):
+            continue  # an entry (or its value) only ends on a closing bracket
+        while True:
+            while position < len(buffer) and buffer[position] in " \t\r\n,":
+                position += 1
+            if position == len(buffer):
+                break
+            if not opened:
+                opened = buffer[position] == "["
+                if not opened:
+                    return
+                position += 1
+                continue
+            if buffer[position] == "]":
+                return
+            try:
+                entry, position = decoder.raw_decode(buffer, position)
+            except ValueError:
+                break  # the entry continues on the next line
+            yield entry
+
+
+class RecordIndex:
+    """
+    In-memory MX/TXT/SRV records by owner name, answering queries like a
+    resolver (see the module docstring).
+    """
+
+    def __init__(self) -> None:
+        # owner -> [ttl, record, ...] per type; records are plain tuples.
+        self._mx: Dict[str, list] = {}
+        self._txt: Dict[str, list] = {}
+        self._srv: Dict[str, list] = {}
+        self._tables = {"MX": self._mx, "TXT": self._txt, "SRV": self._srv}
+        self.records = 0
+        self.skipped = 0
+        self.queries = 0
+
+    def __len__(self) -> int:
+        return self.records
+
+    def add(self, owner: str, rdtype: str, rdata: str, ttl: int = DEFAULT_TTL, origin: str = "") -> bool:
+        """
+        Index one record from its presentation-format rdata; relative
+        names in it are qualified with `origin`.  False if it was unusable.
+        """
+        try:
+            if rdtype == "MX":
+                preference, exchange = rdata.split()[:2]
+                record: tuple = (int(preference), sys.intern(absolute_name(exchange, origin)))
+            elif rdtype == "TXT":
+                # Passive-DNS exports often give TXT data unquoted: one string.
+                record = parse_txt(rdata) if '"' in rdata else (rdata.encode("utf-8"),)
+            elif rdtype == "SRV":
+                priority, weight, port, target = rdata.split()[:4]
+                record = (int(priority), int(weight), int(port), sys.intern(absolute_name(target, origin)))
+            else:
+                return False
+        except ValueError:
+            self.skipped += 1
+            return False
+        table = self._tables[rdtype]
+        entry = table.get(owner)
+        if entry is None:
+            table[sys.intern(owner)] = [ttl, record]
+        elif record not in entry[1:]:
+            entry.append(record)
+            entry[0] = min(entry[0], ttl)
+        else:
+            return False
+        self.records += 1
+        return True
+
+    def add_records(self, records: Iterable[Tuple[str, int, str, str, str]]) -> int:
+        """Index `(owner, ttl, rdtype, rdata, origin)` tuples; returns how many were new."""
+        added = 0
+        for owner, ttl, rdtype, rdata, origin in records:
+            if self.add(owner, rdtype, rdata, ttl, origin):
+                added += 1
+        return added
+
+    def load_zone(self, path: str, origin: str = "", default_ttl: int = DEFAULT_TTL) -> int:
+        """Index a zone file; `origin` applies until the file sets `$ORIGIN`."""
+        return self.add_records(zone_records(_lines(path), origin, default_ttl))
+
+    def load_passive_dns(self, path: str, default_ttl: int = DEFAULT_TTL) -> int:
+        """Index a passive-DNS export; entries without a `ttl` get `default_ttl`."""
+        return self.add_records(passive_dns_records(_lines(path), default_ttl))
+
+    def load(self, path: str, default_ttl: int = DEFAULT_TTL) -> int:
+        """Index a file, telling passive-DNS JSON from zone files by name or first character."""
+        name = path[:-3] if path.endswith(".gz") else path
+        if name.endswith(_PDNS_SUFFIXES) or _first_char(path) in ("{", "["):
+            return self.load_passive_dns(path, default_ttl)
+        return self.load_zone(path, default_ttl=default_ttl)
+
+    def resolve(self, qname: str, rdtype: str) -> dns.rrset.RRset:
+        """Answer a query from the index; raises NXDOMAIN/NoAnswer like the resolver."""
+        self.queries += 1
+        owner = qname.rstrip(".").lower()
+        table = self._tables.get(rdtype.upper())
+        entry = table.get(owner) if table is not None else None
+        if entry is None:
+            if any(owner in other for other in self._tables.values()):
+                raise dns.resolver.NoAnswer()
+            raise dns.resolver.NXDOMAIN(qnames=[dns.name.from_text(owner)])
+        return _rrset(owner, rdtype.upper(), entry)
+
+    async def resolve_async(self, qname: str, rdtype: str) -> dns.rrset.RRset:
+        return self.resolve(qname, rdtype)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "records": self.records,
+            "owners": {rdtype: len(table) for rdtype, table in self._tables.items()},
+            "skipped": self.skipped,
+            "queries": self.queries,
+        }
+
+
+def _first_char(path: str) -> str:
+    for line in _lines(path):
+        text = line.strip()
+        if text:
+            return text[0]
+    return ""
+
+
+def _rrset(owner: str, rdtype: str, entry: list) -> dns.rrset.RRset:
+    IN = dns.rdataclass.IN
+    if rdtype == "MX":
+        rdatas: list = [MX(IN, dns.rdatatype.MX, pref, dns.name.from_text(host)) for pref, host in entry[1:]]
+    elif rdtype == "TXT":
+        rdatas = [TXT(IN, dns.rdatatype.TXT, strings) for strings in entry[1:]]
+    else:
+        rdatas = [
+            SRV(IN, dns.rdatatype.SRV, priority, weight, port, dns.name.from_text(target))
+            for priority, weight, port, target in entry[1:]
+        ]
+    return dns.rrset.from_rdata_list(dns.name.from_text(owner), entry[0], rdatas)
+
+
+def load_index(paths: Iterable[str], default_ttl: int = DEFAULT_TTL) -> RecordIndex:
+    """Build one index from several zone files and passive-DNS exports."""
+    index = RecordIndex()
+    for path in paths:
+        index.load(path, default_ttl)
+    return index
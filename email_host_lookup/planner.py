@@ -0,0 +1,293 @@
+"""
+planner.py
+Cost-ordered detection with a combined, scored provider verdict.
+
+Detection methods differ wildly in cost: MX/SPF/DMARC are one or two DNS
+queries, SRV is three, and the HTTP probes need TLS handshakes to up to
+four hosts.  The planner runs them in stages of increasing cost and turns
+each method's `detect_provider_by_*` label into weighted evidence for a
+provider.  Confidence is the leader's weighted margin over the runner-up
+(capped at 1); as soon as it reaches the threshold, methods still running
+are cancelled and later stages are skipped.  Without a threshold ("full
+evidence") every method runs, all at once.
+
+`mx_ip` (MX host addresses against provider IP prefixes, see `ipprefix`)
+is optional: it only runs when asked for by name.  It `needs` the MX
+method's part: the MX hosts the planner already has (or is still
+fetching, when both run at once) are reused, not queried again.
+
+Each method's answers are watched for their TTLs, and the verdict's
+`expires` maps every method that ran to the epoch second its shortest
+record expires (`UNTIMED_TTL` from now for the HTTP probes, which have
+no TTL).  `rescan` uses it to refresh only what may have changed.
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from .async_lookup import (
+    async_detect_provider_by_spf_expanded,
+    async_detect_provider_by_srv,
+    async_get_dmarc_record,
+    async_get_mx_records,
+    async_get_spf_record,
+)
+from .email_host_lookup import detect_provider, detect_provider_by_dmarc
+from .resolver import observe_ttl, watch_ttls
+from .signatures import get_signatures
+
+Verdict = Dict[str, Any]
+# A method's contribution to the verdict dict, and its provider label.
+Part = Tuple[Verdict, str]
+
+DEFAULT_CONFIDENCE = 0.8
+
+# Seconds a result is trusted when its method saw no DNS TTL.
+UNTIMED_TTL = 86400
+
+
+async def _mx(domain: str) -> Part:
+    records = await async_get_mx_records(domain)
+    label = detect_provider(records)
+    return {"provider_mx": label, "mx_records": records}, label
+
+
+async def _spf(domain: str) -> Part:
+    records = await async_get_spf_record(domain)
+    label = await async_detect_provider_by_spf_expanded(domain, records)
+    return {"provider_spf": label, "spf_records": records}, label
+
+
+async def _dmarc(domain: str) -> Part:
+    records = await async_get_dmarc_record(domain)
+    label = detect_provider_by_dmarc(records)
+    return {"provider_dmarc": label, "dmarc_records": records}, label
+
+
+async def _srv(domain: str) -> Part:
+    label = await async_detect_provider_by_srv(domain)
+    return {"srv": label}, label
+
+
+async def _mx_ip(domain: str, mx: Optional[Verdict] = None) -> Part:
+    from .ipprefix import async_detect_provider_by_mx_ip
+
+    hosts = mx["mx_records"] if mx is not None else await async_get_mx_records(domain)
+    label, addresses = await async_detect_provider_by_mx_ip(hosts)
+    return {"mx_ip": label, "mx_addresses": addresses}, label
+
+
+async def _autoconfig(domain: str) -> Part:
+    from .http_probe import async_detect_provider_by_autoconfig
+
+    label = await async_detect_provider_by_autoconfig(domain)
+    return {"autoconfig": label}, label
+
+
+async def _webfinger(domain: str) -> Part:
+    from .http_probe import async_detect_provider_by_webfinger
+
+    label = await async_detect_provider_by_webfinger(domain)
+    return {"webfinger": label}, label
+
+
+class Method(NamedTuple):
+    """A detection method as the planner sees it."""
+
+    name: str  # also its signature channel
+    stage: int
+    # Rough cost relative to one DNS query; reported as the saving when skipped.
+    cost: float
+    # Evidence a provider gets when this method names it.
+    weight: float
+    # Called with the domain, plus the part of the `needs` method if it has one.
+    run: Callable[..., Awaitable[Part]]
+    # Verdict keys the method fills in; the first holds its label.
+    keys: Tuple[str, ...]
+    # Method whose part this one builds on, when the planner runs both.
+    needs: Optional[str] = None
+
+    def part_of(self, verdict: Verdict) -> Optional[Part]:
+        """This method's part of an earlier verdict, or None if it is not there."""
+        if self.keys[0] not in verdict:
+            return None
+        return {key: verdict[key] for key in self.keys if key in verdict}, verdict[self.keys[0]]
+
+
+METHODS: Dict[str, Method] = {
+    method.name: method
+    for method in (
+        Method("mx", 0, 1.0, 0.5, _mx, ("provider_mx", "mx_records")),
+        Method("dmarc", 0, 1.5, 0.15, _dmarc, ("provider_dmarc", "dmarc_records")),
+        Method("spf", 0, 2.0, 0.35, _spf, ("provider_spf", "spf_records")),
+        Method("srv", 1, 3.0, 0.3, _srv, ("srv",)),
+        Method("mx_ip", 1, 2.5, 0.4, _mx_ip, ("mx_ip", "mx_addresses"), needs="mx"),
+        Method("webfinger", 2, 8.0, 0.25, _webfinger, ("webfinger",)),
+        Method("autoconfig", 2, 12.0, 0.35, _autoconfig, ("autoconfig",)),
+    )
+}
+DNS_METHODS = ("mx", "spf", "dmarc")
+# Methods that need the network beyond DNS (unavailable offline).
+HTTP_METHODS = ("autoconfig", "webfinger")
+# Methods only run when named, not part of ALL_METHODS.
+OPTIONAL_METHODS = ("mx_ip",)
+ALL_METHODS = tuple(name for name in METHODS if name not in OPTIONAL_METHODS)
+
+
+def expiry(ttls: Dict[str, Optional[float]], now: Optional[float] = None) -> Dict[str, int]:
+    """Turn per-method TTLs (None: no DNS answer seen) into epoch expiry seconds."""
+    now = time.time() if now is None else now
+    return {name: int(now + (UNTIMED_TTL if ttl is None else ttl)) for name, ttl in ttls.items()}
+
+
+Watched = Tuple[Part, Optional[float]]
+
+
+async def _watched(method: Method, domain: str, needed: Optional[Awaitable[Watched]] = None) -> Watched:
+    with watch_ttls() as watch:
+        if needed is None:
+            part = await method.run(domain)
+        else:
+            # A result built on another method's records expires with them.
+            (dependency, _), ttl = await needed
+            if ttl is not None:
+                observe_ttl(ttl)
+            part = await method.run(domain, dependency)
+    return part, watch.ttl
+
+
+async def _ready(value: Watched) -> Watched:
+    return value
+
+
+def score(labels: Dict[str, str]) -> Tuple[Optional[str], float]:
+    """
+    Combine per-method labels (`{"mx": "Google Workspace", ...}`) into
+    `(provider, confidence)`; (None, 0.0) if no method named a provider.
+    """
+    table = get_signatures()
+    scores: Dict[str, float] = {}
+    for name, label in labels.items():
+        provider = table.provider_of(name, label)
+        if provider is not None:
+            scores[provider] = scores.get(provider, 0.0) + METHODS[name].weight
+    if not scores:
+        return None, 0.0
+    ranked = sorted(scores.items(), key=lambda item: -item[1])
+    leader, best = ranked[0]
+    runner_up = ranked[1][1] if len(ranked) > 1 else 0.0
+    return leader, round(min(1.0, best - runner_up), 3)
+
+
+class Planner:
+    """
+    Run `methods` for a domain in stages of increasing cost, stopping once
+    the scored verdict reaches `threshold` (None runs everything).
+    """
+
+    def __init__(
+        self,
+        methods: Iterable[str] = ALL_METHODS,
+        threshold: Optional[float] = DEFAULT_CONFIDENCE,
+    ) -> None:
+        self.methods = sorted((METHODS[name] for name in methods), key=lambda m: (m.stage, m.cost))
+        self.threshold = threshold
+
+    def _stages(self, known: Dict[str, Part]) -> List[List[Method]]:
+        methods = [method for method in self.methods if method.name not in known]
+        if self.threshold is None:
+            return [methods] if methods else []
+        stages: Dict[int, List[Method]] = {}
+        for method in methods:
+            stages.setdefault(method.stage, []).append(method)
+        return [stages[stage] for stage in sorted(stages)]
+
+    def _needed(
+        self, method: Method, verdict: Verdict, ttls: Dict[str, Optional[float]], started: Dict[str, Any]
+    ) -> Optional[Awaitable[Watched]]:
+        """The result `method` needs: a finished part, the task still producing it, or None."""
+        if method.needs is None:
+            return None
+        if method.needs in started:
+            return asyncio.shield(started[method.needs])
+        part = METHODS[method.needs].part_of(verdict)
+        if part is None:
+            return None
+        return _ready((part, ttls.get(method.needs)))
+
+    async def run(
+        self, domain: str, deadline: Optional[float] = None, known: Optional[Dict[str, Part]] = None
+    ) -> Verdict:
+        """
+        Return the verdict dict for `domain`: each finished method's keys,
+        plus `provider`, `confidence` and `expires`.  Methods cut short by
+        an early exit are listed in `skipped`, ones cut off by the
+        `deadline` (in seconds) in `partial`.  A failed record lookup fails
+        the domain.  Methods with a `known` part (see `Method.part_of`) are
+        not run again; their parts count as evidence but get no `expires`.
+        """
+        known = known or {}
+        until = time.monotonic() + deadline if deadline is not None else None
+        verdict: Verdict = {}
+        labels: Dict[str, str] = {}
+        ttls: Dict[str, Optional[float]] = {}
+        skipped: List[str] = []
+        partial: List[str] = []
+        for name, (part, label) in known.items():
+            verdict.update(part)
+            labels[name] = label
+        provider, confidence = score(labels)
+        stages = self._stages(known)
+        if known and self.threshold is not None and confidence >= self.threshold:
+            skipped = [method.name for stage in stages for method in stage]
+            stages = []
+        for index, stage in enumerate(stages):
+            started: Dict[str, "asyncio.Future[Watched]"] = {}
+            for method in stage:
+                started[method.name] = asyncio.ensure_future(
+                    _watched(method, domain, self._needed(method, verdict, ttls, started))
+                )
+            tasks = {task: name for name, task in started.items()}
+            pending = set(tasks)
+            try:
+                while pending:
+                    timeout = None if until is None else max(0.0, until - time.monotonic())
+                    done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        partial.extend(tasks[task] for task in pending)
+                        break
+                    for task in done:
+                        if task.exception() is not None:
+                            return {"error": str(task.exception())}
+                        (part, label), ttls[tasks[task]] = task.result()
+                        verdict.update(part)
+                        labels[tasks[task]] = label
+                    provider, confidence = score(labels)
+                    if self.threshold is not None and confidence >= self.threshold:
+                        skipped.extend(tasks[task] for task in pending)
+                        break
+            finally:
+                for task in pending:
+                    task.cancel()
+                await asyncio.gather(*pending, return_exceptions=True)
+            later = [method.name for rest in stages[index + 1:] for method in rest]
+            if partial:
+                partial.extend(later)
+                break
+            if self.threshold is not None and confidence >= self.threshold:
+                skipped.extend(later)
+                break
+        verdict["provider"] = provider
+        verdict["confidence"] = confidence
+        verdict["expires"] = expiry(ttls)
+        if skipped:
+            verdict["skipped"] = sorted(skipped)
+        if partial:
+            verdict["partial"] = sorted(partial)
+        return verdict
+
+
+def saved_cost(skipped: Iterable[str]) -> float:
+    """Relative cost of the methods an early exit skipped."""
+    return sum(METHODS[name].cost for name in skipped)
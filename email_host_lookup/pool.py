@@ -0,0 +1,352 @@
+"""
+pool.py
+A pool of upstream nameservers with per-server rate limits and health scoring.
+
+Each query goes to one server, chosen by "power of two choices": two
+eligible servers are sampled and the one with the lower expected cost
+wins.  A server's cost is its expected answer time (EWMA latency, with
+failures counted as a full timeout) scaled by the queries it already has
+in flight, so load drifts toward fast, healthy servers without starving
+the others of the samples that keep their scores current.
+
+Every server has a token bucket (`rate` queries/s, `burst` at once); a
+query waits for a token rather than exceed it.  Timeouts, SERVFAIL and
+REFUSED count against a server and the query is retried on another;
+NXDOMAIN and empty answers are real answers.  After `eject_after`
+consecutive failures a server is skipped for `cooldown` seconds.
+
+Timeouts adapt to the pool's observed answer times (see `latency`), and an
+asyncio query still unanswered at the pool's p95 is hedged: a duplicate
+goes to a second server and whichever answers first wins.
+
+Install a pool with `resolver.set_pool` (or `resolver.configure_nameservers`);
+all record lookups then go through it.
+"""
+
+import random
+import threading
+import time
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple
+
+import dns.exception
+import dns.resolver
+import dns.rrset
+
+from .latency import LatencyTracker
+
+if TYPE_CHECKING:
+    import dns.asyncresolver
+
+# Authoritative answers: the server did its job even though there is no record.
+ANSWER_ERRORS = (dns.resolver.NXDOMAIN, dns.resolver.NoAnswer, dns.resolver.YXDOMAIN)
+
+# Weight of the newest sample in the latency and error-rate averages.
+EWMA_ALPHA = 0.2
+
+
+class TokenBucket:
+    """Thread-safe token bucket; `take` reserves a token and says how long to wait for it."""
+
+    def __init__(self, rate: float, burst: Optional[float] = None) -> None:
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.burst = burst if burst is not None else max(1.0, rate)
+        self._tokens = self.burst
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token is free, without taking one."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return max(0.0, (1 - self._tokens) / self.rate)
+
+    def take(self) -> float:
+        """Reserve a token; returns the seconds the caller must wait before using it."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self._tokens -= 1
+            return max(0.0, -self._tokens / self.rate)
+
+
+class Upstream:
+    """One nameserver with its rate limit and health statistics."""
+
+    def __init__(
+        self,
+        address: str,
+        port: int = 53,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        timeout: float = 2.0,
+        lifetime: float = 5.0,
+    ) -> None:
+        self.address = address
+        self.port = port
+        self.timeout = timeout
+        self.lifetime = lifetime
+        self.bucket = TokenBucket(rate, burst) if rate else None
+        # Until it has answered, a server is assumed to be reasonably fast.
+        self.latency = min(0.05, timeout)
+        self.error_rate = 0.0
+        self.in_flight = 0
+        self.queries = 0
+        self.errors = 0
+        self.consecutive_errors = 0
+        self.ejected_until = 0.0
+        self._sync: Optional[dns.resolver.Resolver] = None
+        self._async: Optional["dns.asyncresolver.Resolver"] = None
+
+    @property
+    def name(self) -> str:
+        return self.address if self.port == 53 else f"{self.address}:{self.port}"
+
+    def _configure(self, res: Any) -> Any:
+        res.nameservers = [self.address]
+        res.port = self.port
+        res.timeout = self.timeout
+        res.lifetime = self.lifetime
+        return res
+
+    def sync_resolver(self) -> dns.resolver.Resolver:
+        if self._sync is None:
+            self._sync = self._configure(dns.resolver.Resolver(configure=False))
+        return self._sync
+
+    def async_resolver(self) -> "dns.asyncresolver.Resolver":
+        if self._async is None:
+            import dns.asyncresolver
+
+            self._async = self._configure(dns.asyncresolver.Resolver(configure=False))
+        return self._async
+
+    def cost(self) -> float:
+        """Expected seconds to an answer here, inflated by the queries already queued."""
+        expected = (1 - self.error_rate) * self.latency + self.error_rate * self.lifetime
+        return expected * (1 + self.in_flight)
+
+    def ejected(self, now: float) -> bool:
+        return now < self.ejected_until
+
+    def record(self, seconds: float, ok: bool, eject_after: int, cooldown: float) -> None:
+        self.queries += 1
+        self.error_rate += EWMA_ALPHA * ((0.0 if ok else 1.0) - self.error_rate)
+        if ok:
+            self.latency += EWMA_ALPHA * (seconds - self.latency)
+            self.consecutive_errors = 0
+            return
+        self.errors += 1
+        self.consecutive_errors += 1
+        if self.consecutive_errors >= eject_after:
+            self.ejected_until = time.monotonic() + cooldown
+            # Half-open: one more failure after the cooldown ejects it again.
+            self.consecutive_errors = eject_after - 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "server": self.name,
+            "latency_ms": round(self.latency * 1000, 3),
+            "error_rate": round(self.error_rate, 4),
+            "in_flight": self.in_flight,
+            "queries": self.queries,
+            "errors": self.errors,
+            "ejected": self.ejected(time.monotonic()),
+        }
+
+
+def parse_server(spec: str, default_port: int = 53) -> Tuple[str, int]:
+    """Split `addr`, `addr:port`, `[v6]:port` or a bare IPv6 address."""
+    if spec.startswith("["):
+        host, _, rest = spec[1:].partition("]")
+        return host, int(rest[1:]) if rest.startswith(":") else default_port
+    if spec.count(":") == 1:
+        host, port = spec.split(":")
+        return host, int(port)
+    return spec, default_port
+
+
+def system_nameservers() -> List[str]:
+    """Nameservers listed in /etc/resolv.conf (or the platform equivalent)."""
+    return [str(ns) for ns in dns.resolver.get_default_resolver().nameservers]
+
+
+class ResolverPool:
+    """Load-balance queries over `upstreams` (see the module docstring)."""
+
+    def __init__(
+        self,
+        upstreams: Sequence[Upstream],
+        attempts: int = 3,
+        eject_after: int = 5,
+        cooldown: float = 10.0,
+        hedge: bool = True,
+        min_timeout: float = 0.5,
+        seed: Optional[int] = None,
+    ) -> None:
+        if not upstreams:
+            raise ValueError("a resolver pool needs at least one upstream")
+        self.upstreams = list(upstreams)
+        self.attempts = attempts
+        self.eject_after = eject_after
+        self.cooldown = cooldown
+        self.hedge = hedge
+        # Answer times across the pool: the hedge delay and per-attempt timeout.
+        self.latency = LatencyTracker(min_timeout, max(u.lifetime for u in self.upstreams), quantile=0.99)
+        self.hedges = 0
+        self._rng = random.Random(seed)
+
+    @classmethod
+    def from_servers(
+        cls,
+        servers: Sequence[str],
+        port: int = 53,
+        rate: Optional[float] = None,
+        burst: Optional[float] = None,
+        timeout: float = 2.0,
+        lifetime: float = 5.0,
+        **kwargs: Any,
+    ) -> "ResolverPool":
+        """Build a pool from `addr[:port]` strings; "system" expands to resolv.conf."""
+        upstreams = []
+        for spec in servers:
+            for item in system_nameservers() if spec == "system" else [spec]:
+                address, server_port = parse_server(item, port)
+                upstreams.append(Upstream(address, server_port, rate, burst, timeout, lifetime))
+        return cls(upstreams, **kwargs)
+
+    def pick(self, tried: Sequence[Upstream] = ()) -> Optional[Upstream]:
+        """Choose the server for the next attempt, or None if every one was tried."""
+        candidates = [u for u in self.upstreams if u not in tried]
+        if not candidates:
+            return None
+        now = time.monotonic()
+        healthy = [u for u in candidates if not u.ejected(now)] or candidates
+        ready = [u for u in healthy if u.bucket is None or u.bucket.delay() == 0]
+        if not ready:
+            # Every bucket is empty: whichever refills first wins.
+            return min(healthy, key=lambda u: u.bucket.delay())  # type: ignore[union-attr]
+        if len(ready) > 2:
+            ready = self._rng.sample(ready, 2)
+        return min(ready, key=Upstream.cost)
+
+    def _finish(self, upstream: Upstream, start: float, ok: bool) -> None:
+        upstream.in_flight -= 1
+        seconds = time.monotonic() - start
+        upstream.record(seconds, ok, self.eject_after, self.cooldown)
+        if ok:
+            self.latency.observe(seconds)
+
+    def hedge_delay(self) -> Optional[float]:
+        """Seconds after which a second server is asked too (the pool's p95), if hedging."""
+        if not self.hedge or len(self.upstreams) < 2:
+            return None
+        return self.latency.quantile(0.95)
+
+    def _lifetime(self, upstream: Upstream) -> float:
+        return min(upstream.lifetime, self.latency.timeout())
+
+    def _query(self, upstream: Upstream, qname: str, rdtype: str) -> dns.rrset.RRset:
+        wait = upstream.bucket.take() if upstream.bucket is not None else 0.0
+        if wait:
+            time.sleep(wait)
+        upstream.in_flight += 1
+        start = time.monotonic()
+        try:
+            answer = upstream.sync_resolver().resolve(qname, rdtype, lifetime=self._lifetime(upstream))
+        except ANSWER_ERRORS:
+            self._finish(upstream, start, True)
+            raise
+        except dns.exception.DNSException:
+            self._finish(upstream, start, False)
+            raise
+        except BaseException:
+            upstream.in_flight -= 1
+            raise
+        self._finish(upstream, start, True)
+        return answer.rrset
+
+    async def _query_async(self, upstream: Upstream, qname: str, rdtype: str) -> dns.rrset.RRset:
+        import asyncio
+
+        wait = upstream.bucket.take() if upstream.bucket is not None else 0.0
+        if wait:
+            await asyncio.sleep(wait)
+        upstream.in_flight += 1
+        start = time.monotonic()
+        try:
+            answer = await upstream.async_resolver().resolve(qname, rdtype, lifetime=self._lifetime(upstream))
+        except ANSWER_ERRORS:
+            self._finish(upstream, start, True)
+            raise
+        except dns.exception.DNSException:
+            self._finish(upstream, start, False)
+            raise
+        except BaseException:
+            # Cancelled (e.g. the hedge won): the server is not to blame.
+            upstream.in_flight -= 1
+            raise
+        self._finish(upstream, start, True)
+        return answer.rrset
+
+    def resolve(self, qname: str, rdtype: str) -> dns.rrset.RRset:
+        """Blocking query; raises the last server failure if every attempt fails."""
+        tried: List[Upstream] = []
+        error: Optional[Exception] = None
+        while len(tried) < self.attempts:
+            upstream = self.pick(tried)
+            if upstream is None:
+                break
+            tried.append(upstream)
+            try:
+                return self._query(upstream, qname, rdtype)
+            except ANSWER_ERRORS:
+                raise
+            except dns.exception.DNSException as e:
+                error = e
+        raise error or dns.resolver.NoNameservers()
+
+    async def resolve_async(self, qname: str, rdtype: str) -> dns.rrset.RRset:
+        """
+        asyncio counterpart of `resolve`.  If the chosen server has not
+        answered by the hedge delay, the query is also sent to a second
+        server and the first answer wins.
+        """
+        import asyncio
+
+        tried: List[Upstream] = []
+        error: Optional[Exception] = None
+        while len(tried) < self.attempts:
+            upstream = self.pick(tried)
+            if upstream is None:
+                break
+            tried.append(upstream)
+            racers = [asyncio.ensure_future(self._query_async(upstream, qname, rdtype))]
+            try:
+                delay = self.hedge_delay()
+                if delay is not None and len(tried) < self.attempts:
+                    done, _ = await asyncio.wait(racers, timeout=delay)
+                    second = None if done else self.pick(tried)
+                    if second is not None:
+                        tried.append(second)
+                        self.hedges += 1
+                        racers.append(asyncio.ensure_future(self._query_async(second, qname, rdtype)))
+                for next_done in asyncio.as_completed(racers):
+                    try:
+                        return await next_done
+                    except ANSWER_ERRORS:
+                        raise
+                    except dns.exception.DNSException as e:
+                        error = e
+            finally:
+                for task in racers:
+                    task.cancel()
+                await asyncio.gather(*racers, return_exceptions=True)
+        raise error or dns.resolver.NoNameservers()
+
+    def stats(self) -> List[Dict[str, Any]]:
+        return [u.stats() for u in self.upstreams]
@@ -0,0 +1,338 @@
+"""
+records.py
+Compact result records: a typed host-info record and a columnar batch store.
+
+`HostInfo` is what `get_email_host_info` returns.  It has named, slotted
+fields and still unpacks and indexes like the 7-tuple it replaced.
+
+`ResultBatch` holds bulk scan rows without one dict per row.  Hostnames,
+provider labels and other verdict strings are interned into integer ids,
+and whole record lists become ids of interned id tuples (every Google
+Workspace domain shares one `aspmx.l.google.com, ...` list).  Verdicts are
+deduplicated the same way.  A row's `expires` map is interned apart from
+its verdict, as a tuple of `(method, epoch)` pairs, so verdicts still
+dedupe when their records expire at different times; each distinct
+(verdict, expiry) pair is stored once.  A row is then an address plus a
+domain id and a pair id in typed arrays, a few dozen bytes instead of a
+dict with its strings.  `write` exports JSONL or CSV by rendering each distinct verdict
+once and splicing it into every row that shares it.
+"""
+
+import json
+import math
+from array import array
+from typing import Any, Dict, Hashable, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+# Verdict keys a batch keeps, in the bulk CSV column order.
+TEXT_FIELDS = (
+    "provider",
+    "provider_mx",
+    "provider_spf",
+    "provider_dmarc",
+    "srv",
+    "autoconfig",
+    "webfinger",
+    "mx_ip",
+    "error",
+)
+LIST_FIELDS = ("mx_records", "spf_records", "dmarc_records", "skipped", "partial", "mx_addresses")
+VERDICT_FIELDS = (
+    "provider",
+    "confidence",
+    "provider_mx",
+    "provider_spf",
+    "provider_dmarc",
+    "mx_records",
+    "spf_records",
+    "dmarc_records",
+    "srv",
+    "autoconfig",
+    "webfinger",
+    "mx_ip",
+    "skipped",
+    "partial",
+    "error",
+)
+# Keys kept for JSONL exports (a `--rescan` needs them) but not CSV columns.
+JSONL_FIELDS = ("mx_addresses", "expires")
+
+# Id of a key the verdict does not have (distinct from a None value).
+ABSENT = 0
+
+
+class HostInfo:
+    """MX, SPF and DMARC findings for one domain."""
+
+    __slots__ = (
+        "domain",
+        "mx_records",
+        "provider_mx",
+        "spf_records",
+        "provider_spf",
+        "dmarc_records",
+        "provider_dmarc",
+    )
+
+    def __init__(
+        self,
+        domain: str,
+        mx_records: List[str],
+        provider_mx: str,
+        spf_records: List[str],
+        provider_spf: str,
+        dmarc_records: List[str],
+        provider_dmarc: str,
+    ) -> None:
+        self.domain = domain
+        self.mx_records = mx_records
+        self.provider_mx = provider_mx
+        self.spf_records = spf_records
+        self.provider_spf = provider_spf
+        self.dmarc_records = dmarc_records
+        self.provider_dmarc = provider_dmarc
+
+    def __iter__(self) -> Iterator[Any]:
+        return (getattr(self, name) for name in self.__slots__)
+
+    def __len__(self) -> int:
+        return len(self.__slots__)
+
+    def __getitem__(self, index: Any) -> Any:
+        return tuple(self)[index]
+
+    def __eq__(self, other: object) -> bool:
+        if isinstance(other, (HostInfo, tuple)):
+            return tuple(self) == tuple(other)
+        return NotImplemented
+
+    __hash__ = None  # type: ignore[assignment]
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"HostInfo({fields})"
+
+    def verdict(self) -> Dict[str, Any]:
+        """The bulk-row verdict keys for these findings."""
+        return {
+            "provider_mx": self.provider_mx,
+            "provider_spf": self.provider_spf,
+            "provider_dmarc": self.provider_dmarc,
+            "mx_records": self.mx_records,
+            "spf_records": self.spf_records,
+            "dmarc_records": self.dmarc_records,
+        }
+
+
+class InternTable:
+    """Maps hashable values to dense integer ids; id 0 is reserved for ABSENT."""
+
+    def __init__(self) -> None:
+        self._ids: Dict[Hashable, int] = {}
+        self.values: List[Any] = [None]
+
+    def intern(self, value: Hashable) -> int:
+        found = self._ids.get(value)
+        if found is None:
+            found = self._ids[value] = len(self.values)
+            self.values.append(value)
+        return found
+
+    def __getitem__(self, ident: int) -> Any:
+        return self.values[ident]
+
+    def __len__(self) -> int:
+        return len(self.values) - 1
+
+
+class ResultBatch:
+    """Columnar store of `(address, domain, verdict)` rows (see the module docstring)."""
+
+    def __init__(self) -> None:
+        self.strings = InternTable()
+        # Record lists: an interned tuple of string ids.
+        self.lists = InternTable()
+        # Rows.
+        self._addresses = bytearray()
+        self._address_ends = array("Q")
+        self._domains = array("I")
+        self._entries = array("I")
+        # `expires` maps: an interned tuple of (method string id, epoch second).
+        self.expiries = InternTable()
+        # Distinct (verdict id, expiry id) pairs the rows point at.
+        self._entry_ids: Dict[Tuple[int, int], int] = {}
+        self._entry_verdicts = array("I")
+        self._entry_expires = array("I")
+        # Distinct verdicts, one column per key.
+        self._verdict_ids: Dict[Tuple[Any, ...], int] = {}
+        self._text = {name: array("I") for name in TEXT_FIELDS}
+        self._list = {name: array("I") for name in LIST_FIELDS}
+        self._confidence = array("d")
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def verdicts(self) -> int:
+        """Number of distinct verdicts stored."""
+        return len(self._confidence)
+
+    def _intern_verdict(self, verdict: Dict[str, Any]) -> int:
+        strings = self.strings
+        text = tuple(strings.intern(verdict[name]) if name in verdict else ABSENT for name in TEXT_FIELDS)
+        lists = tuple(
+            self.lists.intern(tuple(map(strings.intern, verdict[name]))) if name in verdict else ABSENT
+            for name in LIST_FIELDS
+        )
+        confidence = verdict.get("confidence")
+        key = (text, lists, confidence)
+        found = self._verdict_ids.get(key)
+        if found is None:
+            found = self._verdict_ids[key] = len(self._confidence)
+            for name, ident in zip(TEXT_FIELDS, text):
+                self._text[name].append(ident)
+            for name, ident in zip(LIST_FIELDS, lists):
+                self._list[name].append(ident)
+            self._confidence.append(math.nan if confidence is None else confidence)
+        return found
+
+    def append(self, address: str, domain: Optional[str], verdict: Dict[str, Any]) -> None:
+        """Add a row; verdict keys other than VERDICT_FIELDS and JSONL_FIELDS are not kept."""
+        self._addresses += address.encode("utf-8")
+        self._address_ends.append(len(self._addresses))
+        self._domains.append(self.strings.intern(domain))
+        expires = verdict.get("expires")
+        key = (
+            self._intern_verdict(verdict),
+            ABSENT if expires is None
+            else self.expiries.intern(tuple((self.strings.intern(name), at) for name, at in expires.items())),
+        )
+        entry = self._entry_ids.get(key)
+        if entry is None:
+            entry = self._entry_ids[key] = len(self._entry_verdicts)
+            self._entry_verdicts.append(key[0])
+            self._entry_expires.append(key[1])
+        self._entries.append(entry)
+
+    def extend(self, rows: Iterable[Dict[str, Any]]) -> None:
+        """Add scan row dicts (`address`, `domain` and the verdict keys)."""
+        for row in rows:
+            self.append(row["address"], row["domain"], row)
+
+    def address(self, index: int) -> str:
+        start = self._address_ends[index - 1] if index else 0
+        return self._addresses[start:self._address_ends[index]].decode("utf-8")
+
+    def domain(self, index: int) -> Optional[str]:
+        return self.strings[self._domains[index]]
+
+    def verdict(self, ident: int) -> Dict[str, Any]:
+        """
+        Rebuild distinct verdict `ident` as a dict, keys in VERDICT_FIELDS
+        order, then `mx_addresses` if it has them.
+        """
+        values: Dict[str, Any] = {}
+        for name in VERDICT_FIELDS:
+            if name == "confidence":
+                confidence = self._confidence[ident]
+                if not math.isnan(confidence):
+                    values[name] = confidence
+                continue
+            column = self._text.get(name)
+            if column is not None:
+                if column[ident] != ABSENT:
+                    values[name] = self.strings[column[ident]]
+                continue
+            items = self._list[name][ident]
+            if items != ABSENT:
+                values[name] = [self.strings[item] for item in self.lists[items]]
+        items = self._list["mx_addresses"][ident]
+        if items != ABSENT:
+            values["mx_addresses"] = [self.strings[item] for item in self.lists[items]]
+        return values
+
+    def expires(self, ident: int) -> Optional[Dict[str, int]]:
+        """Rebuild interned `expires` map `ident`, or None for ABSENT."""
+        if ident == ABSENT:
+            return None
+        return {self.strings[name]: at for name, at in self.expiries[ident]}
+
+    def row(self, index: int) -> Dict[str, Any]:
+        row: Dict[str, Any] = {"address": self.address(index), "domain": self.domain(index)}
+        entry = self._entries[index]
+        row.update(self.verdict(self._entry_verdicts[entry]))
+        expires = self.expires(self._entry_expires[entry])
+        if expires is not None:
+            row["expires"] = expires
+        return row
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Rows as dicts; prefer `write` for exports."""
+        return (self.row(index) for index in range(len(self)))
+
+    @property
+    def nbytes(self) -> int:
+        """Bytes held by the row and verdict columns (the intern tables excluded)."""
+        columns = [self._address_ends, self._domains, self._entries, self._entry_verdicts, self._entry_expires]
+        columns.append(self._confidence)
+        columns += self._text.values()
+        columns += self._list.values()
+        return len(self._addresses) + sum(column.itemsize * len(column) for column in columns)
+
+    def _rows(self) -> Iterator[Tuple[str, int, int, int]]:
+        addresses = self._addresses
+        start = 0
+        verdicts, expiries = self._entry_verdicts, self._entry_expires
+        for end, domain, entry in zip(self._address_ends, self._domains, self._entries):
+            yield addresses[start:end].decode("utf-8"), domain, verdicts[entry], expiries[entry]
+            start = end
+
+    def write(self, fp: TextIO, fmt: str = "jsonl", header: bool = True) -> None:
+        """
+        Export every row as JSONL or CSV, in the bulk output format (JSON
+        keys follow the CSV column order, then JSONL_FIELDS, so the file can
+        feed a `--rescan`).  Each distinct verdict, domain and expiry map is
+        rendered once, however many rows share it.
+        """
+        if fmt == "jsonl":
+            self._write_jsonl(fp)
+        elif fmt == "csv":
+            self._write_csv(fp, header)
+        else:
+            raise ValueError(f"Unsupported output format: {fmt}")
+
+    def _write_jsonl(self, fp: TextIO) -> None:
+        domains: Dict[int, str] = {}
+        verdicts: Dict[int, str] = {}
+        expiries: Dict[int, str] = {ABSENT: ""}
+        for address, domain, verdict, expires in self._rows():
+            rendered_domain = domains.get(domain)
+            if rendered_domain is None:
+                rendered_domain = domains[domain] = json.dumps(self.strings[domain], ensure_ascii=False)
+            rendered = verdicts.get(verdict)
+            if rendered is None:
+                body = json.dumps(self.verdict(verdict), ensure_ascii=False)[1:-1]
+                rendered = verdicts[verdict] = f", {body}" if body else ""
+            rendered_expires = expiries.get(expires)
+            if rendered_expires is None:
+                rendered_expires = expiries[expires] = f', "expires": {json.dumps(self.expires(expires))}'
+            fp.write(
+                f'{{"address": {json.dumps(address, ensure_ascii=False)}, "domain": {rendered_domain}'
+                f"{rendered}{rendered_expires}}}\n"
+            )
+
+    def _write_csv(self, fp: TextIO, header: bool) -> None:
+        import csv
+
+        writer = csv.writer(fp)
+        if header:
+            writer.writerow(("address", "domain") + VERDICT_FIELDS)
+        cells: Dict[int, List[Any]] = {}
+        for address, domain, verdict, _ in self._rows():
+            flat = cells.get(verdict)
+            if flat is None:
+                values = self.verdict(verdict)
+                flat = cells[verdict] = [
+                    " | ".join(values[name]) if isinstance(values.get(name), list) else values.get(name)
+                    for name in VERDICT_FIELDS
+                ]
+            writer.writerow([address, self.strings[domain], *flat])
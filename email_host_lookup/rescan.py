@@ -0,0 +1,205 @@
+"""
+rescan.py
+Incremental rescans of an earlier bulk result file.
+
+A JSONL result file records, per row, each method's `expires` time: when
+the shortest DNS record behind its verdict runs out (see `planner`).  A
+rescan reads that file as its input and, for every domain, keeps the
+methods whose records are still valid and re-runs only the expired ones,
+plus every method of a domain that errored or was cut short.  A domain
+with nothing expired costs no queries at all, so the work done is
+proportional to what could have changed.  Methods an early exit skipped
+(see `planner`) stay skipped while the records that decided it are still
+valid; once one of those expires, the domain is refreshed in full.
+
+Refreshed domains whose provider verdicts moved (say from Google
+Workspace to Microsoft 365) are reported as a diff stream, one JSON object
+per domain:
+
+    {"domain": "example.com", "changed": {"provider_mx": ["Google Workspace", "Microsoft 365"]}}
+
+The refreshed rows form a new result file for the next rescan.
+"""
+
+import asyncio
+import json
+import sys
+import time
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple, Union
+
+from .bulk import BulkStats, RowWriter, close_http_pool, scan_addresses
+from .planner import DNS_METHODS, Part, Planner, Verdict
+
+# Verdict keys compared between the previous and the refreshed verdict.
+DIFF_FIELDS = ("provider", "provider_mx", "provider_spf", "provider_dmarc", "srv", "autoconfig", "webfinger", "mx_ip")
+
+
+def read_results(source: Union[str, TextIO]) -> Iterator[Dict[str, Any]]:
+    """Yield the rows of a JSONL result file (a path, `-` for stdin, or an open file)."""
+    if isinstance(source, str):
+        if source == "-":
+            yield from read_results(sys.stdin)
+            return
+        with open(source, encoding="utf-8") as fp:
+            yield from read_results(fp)
+        return
+    for line in source:
+        if line.strip():
+            yield json.loads(line)
+
+
+def diff_verdicts(old: Verdict, new: Verdict) -> Dict[str, List[Any]]:
+    """`{field: [old, new]}` for the DIFF_FIELDS both verdicts have and that differ."""
+    if "error" in old or "error" in new:
+        return {}
+    return {
+        field: [old[field], new[field]]
+        for field in DIFF_FIELDS
+        if field in old and field in new and old[field] != new[field]
+    }
+
+
+class Rescan(Planner):
+    """
+    Refresh the verdicts of a previous result file (see the module
+    docstring).  A rescan is the `planner` and the `reuse` hook of the
+    `bulk.scan_addresses` run over `rows()`: `reuse` keeps domains with
+    nothing expired, and `run` re-runs only a domain's expired methods.
+    Changed verdicts are passed to `on_change` as diff records.
+    """
+
+    def __init__(
+        self,
+        rows: Iterable[Dict[str, Any]],
+        methods: Iterable[str] = DNS_METHODS,
+        on_change: Optional[Callable[[Dict[str, Any]], None]] = None,
+        grace: float = 0.0,
+        now: Optional[float] = None,
+    ) -> None:
+        super().__init__(methods, threshold=None)
+        self._rows = rows
+        self.on_change = on_change
+        # Seconds added to every expiry: fewer queries, possibly staler verdicts.
+        self.grace = grace
+        self.now = time.time() if now is None else now
+        # Previous verdicts and their still-valid parts, by domain being refreshed.
+        self._refreshing: Dict[str, Tuple[Verdict, Dict[str, Part]]] = {}
+        self.fresh = 0
+        self.refreshed = 0
+        self.changed = 0
+        self.methods_reused = 0
+        self.methods_run = 0
+
+    def rows(self) -> Iterator[Tuple[str, Verdict]]:
+        """The previous file's `(address, verdict)` pairs, in order, for `scan_addresses`."""
+        for row in self._rows:
+            yield row["address"], {key: value for key, value in row.items() if key not in ("address", "domain")}
+
+    def _known(self, verdict: Verdict) -> Dict[str, Part]:
+        """Parts of `verdict` whose records have not expired yet."""
+        if "error" in verdict:
+            return {}
+        expires = verdict.get("expires", {})
+        known = {}
+        for method in self.methods:
+            if expires.get(method.name, 0) + self.grace <= self.now or method.name in verdict.get("partial", ()):
+                continue
+            part = method.part_of(verdict)
+            if part is not None:
+                known[method.name] = part
+        return known
+
+    def reuse(self, domain: str, previous: Verdict) -> Optional[Verdict]:
+        """
+        `scan_addresses` hook: the previous verdict if nothing in it has
+        expired, else None and `domain` is refreshed by `run`.
+        """
+        known = self._known(previous)
+        skipped = set(previous.get("skipped", ())) if known else set()
+        if all(method.name in known or method.name in skipped for method in self.methods):
+            self.fresh += 1
+            self.methods_reused += len(known)
+            return previous
+        self._refreshing[domain] = (previous, known)
+        return None
+
+    async def run(
+        self, domain: str, deadline: Optional[float] = None, known: Optional[Dict[str, Part]] = None
+    ) -> Verdict:
+        # `known` comes from the previous verdict handed over to `reuse`.
+        previous, known = self._refreshing.pop(domain, ({}, {}))
+        self.methods_reused += len(known)
+        self.methods_run += len(self.methods) - len(known)
+        verdict = await super().run(domain, deadline, known)
+        if "error" not in verdict and known:
+            verdict["expires"] = {
+                **{name: previous["expires"][name] for name in known},
+                **verdict["expires"],
+            }
+        self.refreshed += 1
+        changed = diff_verdicts(previous, verdict)
+        if changed:
+            self.changed += 1
+            if self.on_change is not None:
+                self.on_change({"domain": domain, "changed": changed})
+        return verdict
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "fresh": self.fresh,
+            "refreshed": self.refreshed,
+            "changed": self.changed,
+            "methods_reused": self.methods_reused,
+            "methods_run": self.methods_run,
+        }
+
+
+async def run_rescan_async(
+    previous: Iterable[Dict[str, Any]],
+    out: TextIO,
+    diff_out: TextIO,
+    concurrency: int = 100,
+    methods: Iterable[str] = DNS_METHODS,
+    grace: float = 0.0,
+    flush_every: int = 1000,
+    **kwargs: Any,
+) -> Tuple[BulkStats, Rescan]:
+    """
+    Rescan the rows of a previous result file, writing the refreshed rows
+    (JSONL, in the same order) to `out` and the diff stream to `diff_out`.
+    Keyword arguments are passed to `scan_addresses`.
+    """
+    def changed(record: Dict[str, Any]) -> None:
+        diff_out.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    rescan = Rescan(previous, methods, on_change=changed, grace=grace)
+    stats = BulkStats()
+    writer = RowWriter(out, "jsonl")
+    written = 0
+    rows = scan_addresses(
+        rescan.rows(),
+        concurrency=concurrency,
+        stats=stats,
+        planner=rescan,
+        reuse=rescan.reuse,
+        **kwargs,
+    )
+    try:
+        async for row in rows:
+            writer.write(row)
+            written += 1
+            if written % flush_every == 0:
+                out.flush()
+                diff_out.flush()
+    finally:
+        out.flush()
+        diff_out.flush()
+        await close_http_pool()
+    return stats, rescan
+
+
+def run_rescan(
+    previous: Iterable[Dict[str, Any]], out: TextIO, diff_out: TextIO, **kwargs: Any
+) -> Tuple[BulkStats, Rescan]:
+    """Blocking wrapper around `run_rescan_async`."""
+    return asyncio.run(run_rescan_async(previous, out, diff_out, **kwargs))
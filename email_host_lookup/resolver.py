@@ -0,0 +1,225 @@
+"""
+resolver.py
+Shared DNS entry points used by both the blocking and the asyncio lookup paths.
+
+Every record query in the package goes through `resolve` (blocking) or
+`resolve_async` (asyncio), so behaviour added here applies to all detection
+methods at once.  Both return the answer's RRset and raise the usual
+dnspython exceptions (NXDOMAIN, NoAnswer, LifetimeTimeout, ...) on failure.
+Answers, including NXDOMAIN/NoAnswer, are served from a shared
+`DnsCache` when one is installed (the default).  Cache misses go to the
+local record source when one is installed (`offline.RecordIndex`: no
+network at all), else to the upstream `pool.ResolverPool` when one is
+installed, or else to the system resolver.
+
+While a `watch_ttls` block is active, the shortest TTL among the answers
+(and RFC 2308 negative TTLs) it resolved is recorded, so a verdict can say
+how long its records stay valid.
+"""
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import TYPE_CHECKING, Any, Iterator, List, Optional
+
+import dns.resolver
+import dns.rrset
+
+from .dns_cache import DnsCache, negative_ttl
+from .metrics import dns_outcome, get_metrics
+
+_cache: Optional[DnsCache] = DnsCache()
+if TYPE_CHECKING:
+    from .offline import RecordIndex
+    from .pool import ResolverPool
+
+# Upstream pool for all queries; None means dnspython's system default.
+_pool: Optional["ResolverPool"] = None
+
+
+class TtlWatch:
+    """Shortest TTL, in seconds, of the answers resolved under a `watch_ttls` block."""
+
+    __slots__ = ("ttl",)
+
+    def __init__(self) -> None:
+        self.ttl: Optional[float] = None
+
+    def observe(self, ttl: float) -> None:
+        if self.ttl is None or ttl < self.ttl:
+            self.ttl = ttl
+
+
+_watch: ContextVar[Optional[TtlWatch]] = ContextVar("ttl_watch", default=None)
+
+
+@contextmanager
+def watch_ttls() -> Iterator[TtlWatch]:
+    """
+    Record answer TTLs in the current context, including tasks started
+    from it inside the block.
+    """
+    watch = TtlWatch()
+    token = _watch.set(watch)
+    try:
+        yield watch
+    finally:
+        _watch.reset(token)
+
+
+def _note_ttl(value: Any, remaining: Optional[float] = None) -> None:
+    """Feed an answer (or NXDOMAIN/NoAnswer error) to the active watch."""
+    watch = _watch.get()
+    if watch is None:
+        return
+    ttl = negative_ttl(value) if isinstance(value, Exception) else value.ttl
+    if ttl is not None:
+        # A cached answer is only valid for what is left of its TTL.
+        watch.observe(ttl if remaining is None else min(ttl, remaining))
+
+
+def observe_ttl(ttl: float) -> None:
+    """Feed the TTL of a result derived from earlier answers to the active watch."""
+    watch = _watch.get()
+    if watch is not None:
+        watch.observe(ttl)
+
+
+# Local records answering every query instead of the network.
+_source: Optional["RecordIndex"] = None
+
+
+def get_cache() -> Optional[DnsCache]:
+    """Return the shared answer cache, or None if caching is disabled."""
+    return _cache
+
+
+def set_cache(cache: Optional[DnsCache]) -> None:
+    """Install a new shared answer cache; None disables caching."""
+    global _cache
+    _cache = cache
+
+
+def get_pool() -> Optional["ResolverPool"]:
+    """Return the installed upstream pool, or None for the system resolver."""
+    return _pool
+
+
+def set_pool(pool: Optional["ResolverPool"]) -> None:
+    """Send all queries through `pool`; None restores the system resolver."""
+    global _pool
+    _pool = pool
+
+
+def get_source() -> Optional["RecordIndex"]:
+    """Return the installed local record source, or None when queries use the network."""
+    return _source
+
+
+def set_source(source: Optional["RecordIndex"]) -> None:
+    """Answer all queries from `source` (see `offline`); None goes back to the network."""
+    global _source
+    _source = source
+
+
+def configure_nameservers(
+    nameservers: Optional[List[str]],
+    port: int = 53,
+    timeout: float = 2.0,
+    lifetime: float = 5.0,
+    rate: Optional[float] = None,
+) -> None:
+    """
+    Send all queries to `nameservers` (e.g. a local stand-in server) instead
+    of the servers in /etc/resolv.conf; None restores the system default.
+    Entries may carry their own port (`addr:port`); `rate` caps the queries
+    per second sent to each server.
+    """
+    if not nameservers:
+        set_pool(None)
+        return
+    from .pool import ResolverPool
+
+    set_pool(ResolverPool.from_servers(nameservers, port, rate, timeout=timeout, lifetime=lifetime))
+
+
+def resolve(qname: str, rdtype: str) -> dns.rrset.RRset:
+    """Resolve `qname`/`rdtype` with the blocking resolver."""
+    cache = _cache
+    if cache is not None:
+        found, value = cache.lookup(qname, rdtype)
+        if found:
+            if _watch.get() is not None:
+                _note_ttl(value, cache.remaining(qname, rdtype))
+            if isinstance(value, Exception):
+                raise value
+            return value
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.enter("dns")
+        start = metrics.clock()
+    outcome = "cancelled"
+    try:
+        if _source is not None:
+            rrset = _source.resolve(qname, rdtype)
+        elif _pool is not None:
+            rrset = _pool.resolve(qname, rdtype)
+        else:
+            rrset = dns.resolver.resolve(qname, rdtype).rrset
+        outcome = "noerror"
+    except Exception as e:
+        outcome = dns_outcome(e)
+        _note_ttl(e)
+        if cache is not None:
+            cache.store_error(qname, rdtype, e)
+        raise
+    finally:
+        if metrics is not None:
+            metrics.exit("dns")
+            metrics.count_query(rdtype, outcome, metrics.clock() - start)
+    _note_ttl(rrset)
+    if cache is not None:
+        cache.store_answer(qname, rdtype, rrset)
+    return rrset
+
+
+async def resolve_async(qname: str, rdtype: str) -> dns.rrset.RRset:
+    """Resolve `qname`/`rdtype` with the asyncio resolver."""
+    # Imported here so blocking-only runs never load the asyncio resolver.
+    import dns.asyncresolver
+
+    cache = _cache
+    if cache is not None:
+        found, value = cache.lookup(qname, rdtype)
+        if found:
+            if _watch.get() is not None:
+                _note_ttl(value, cache.remaining(qname, rdtype))
+            if isinstance(value, Exception):
+                raise value
+            return value
+    metrics = get_metrics()
+    if metrics is not None:
+        metrics.enter("dns")
+        start = metrics.clock()
+    outcome = "cancelled"
+    try:
+        if _source is not None:
+            rrset = await _source.resolve_async(qname, rdtype)
+        elif _pool is not None:
+            rrset = await _pool.resolve_async(qname, rdtype)
+        else:
+            rrset = (await dns.asyncresolver.resolve(qname, rdtype)).rrset
+        outcome = "noerror"
+    except Exception as e:
+        outcome = dns_outcome(e)
+        _note_ttl(e)
+        if cache is not None:
+            cache.store_error(qname, rdtype, e)
+        raise
+    finally:
+        if metrics is not None:
+            metrics.exit("dns")
+            metrics.count_query(rdtype, outcome, metrics.clock() - start)
+    _note_ttl(rrset)
+    if cache is not None:
+        cache.store_answer(qname, rdtype, rrset)
+    return rrset
@@ -0,0 +1,338 @@
+"""
+service.py
+Long-running HTTP/JSON lookup service built on asyncio streams (stdlib only).
+
+    GET  /lookup?domain=example.com       one verdict (or ?address=user@example.com)
+    POST /lookup                          {"domains": [...], "addresses": [...]}
+                                          -> {"results": [row, ...]} in request order
+    GET  /health                          liveness and current load
+    GET  /stats                           service counters, DNS cache and metrics
+
+Rows have the same shape as bulk scan rows.  Concurrent requests for one
+domain share a single in-flight lookup ("singleflight"), and a finished
+verdict is answered from memory until its earliest record expires (see
+`planner`; errors are kept for `error_ttl`).  The resolver's cache and pool
+are process-wide, so DNS state carries over from request to request.
+
+Load is bounded instead of queued without limit: at most `concurrency`
+lookups run at once and at most `max_pending` are admitted, running or
+waiting.  A request that needs more new lookups than there is room for is
+refused as a whole with 503 and `Retry-After`, before any of its lookups
+start.  Batches are capped at `max_batch` entries and bodies at `max_body`
+bytes.
+"""
+
+import asyncio
+import json
+import time
+from collections import OrderedDict
+from http import HTTPStatus
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+from urllib.parse import parse_qs, urlsplit
+
+from .bulk import DomainBudget, Verdict, _row, address_domain, close_http_pool, lookup_domain
+from .domains import normalize_domain, organizational_domain
+from .planner import Planner
+
+# Longest request head (request line and headers) accepted.
+MAX_HEAD = 16 * 1024
+
+
+class Overloaded(Exception):
+    """Raised when a request needs more lookups than `max_pending` leaves room for."""
+
+
+class LookupService:
+    """Shared lookup state and the HTTP front end (see the module docstring)."""
+
+    def __init__(
+        self,
+        concurrency: int = 100,
+        max_pending: Optional[int] = None,
+        max_batch: int = 1000,
+        max_body: int = 1 << 20,
+        probes: bool = False,
+        planner: Optional[Planner] = None,
+        deadline: Optional[float] = None,
+        org_domains: bool = False,
+        verdict_cache_size: int = 100_000,
+        error_ttl: float = 60.0,
+        idle_timeout: float = 30.0,
+    ) -> None:
+        if concurrency < 1:
+            raise ValueError("concurrency must be at least 1")
+        self.concurrency = concurrency
+        self.max_pending = max_pending or concurrency * 10
+        # A batch of nothing but new domains must fit into an idle service.
+        self.max_batch = min(max_batch, self.max_pending)
+        self.max_body = max_body
+        self.probes = probes
+        self.planner = planner
+        self.budget = DomainBudget(deadline) if deadline else None
+        self.org_domains = org_domains
+        self.verdict_cache_size = verdict_cache_size
+        self.error_ttl = error_ttl
+        self.idle_timeout = idle_timeout
+        self._semaphore = asyncio.Semaphore(concurrency)
+        self._inflight: Dict[str, "asyncio.Task[Verdict]"] = {}
+        # domain -> (epoch expiry, verdict), least recently used first.
+        self._verdicts: "OrderedDict[str, Tuple[float, Verdict]]" = OrderedDict()
+        self.requests = 0
+        self.lookups = 0
+        self.coalesced = 0
+        self.cache_hits = 0
+        self.rejected = 0
+
+    # Lookups
+
+    def _cached(self, domain: str, now: float) -> Optional[Verdict]:
+        entry = self._verdicts.get(domain)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._verdicts[domain]
+            return None
+        self._verdicts.move_to_end(domain)
+        return entry[1]
+
+    def _remember(self, domain: str, verdict: Verdict) -> None:
+        expires = verdict.get("expires")
+        if expires and "error" not in verdict and "partial" not in verdict:
+            until = float(min(expires.values()))
+        else:
+            until = time.time() + self.error_ttl
+        self._verdicts[domain] = (until, verdict)
+        self._verdicts.move_to_end(domain)
+        if len(self._verdicts) > self.verdict_cache_size:
+            self._verdicts.popitem(last=False)
+
+    async def _lookup(self, domain: str) -> Verdict:
+        try:
+            async with self._semaphore:
+                verdict = await lookup_domain(domain, self.probes, self.budget, self.planner)
+            self._remember(domain, verdict)
+            return verdict
+        finally:
+            del self._inflight[domain]
+
+    def claim(self, domains: Sequence[str]) -> Dict[str, Union[Verdict, "asyncio.Task[Verdict]"]]:
+        """
+        Map each domain to its cached verdict or to the (possibly shared)
+        lookup task.  Raises Overloaded, starting nothing, if the new lookups
+        would exceed `max_pending`.
+        """
+        now = time.time()
+        claims: Dict[str, Union[Verdict, "asyncio.Task[Verdict]"]] = {}
+        new: List[str] = []
+        for domain in dict.fromkeys(domains):
+            cached = self._cached(domain, now)
+            if cached is not None:
+                self.cache_hits += 1
+                claims[domain] = cached
+            elif domain in self._inflight:
+                self.coalesced += 1
+                claims[domain] = self._inflight[domain]
+            else:
+                new.append(domain)
+        if len(self._inflight) + len(new) > self.max_pending:
+            self.rejected += 1
+            raise Overloaded(f"{len(self._inflight)} lookups pending")
+        for domain in new:
+            self.lookups += 1
+            claims[domain] = self._inflight[domain] = asyncio.ensure_future(self._lookup(domain))
+        return claims
+
+    async def lookup_many(self, domains: Sequence[str]) -> List[Verdict]:
+        """Verdicts for `domains`, in order; a client going away does not cancel shared lookups."""
+        claims = self.claim(domains)
+        tasks = [claim for claim in claims.values() if isinstance(claim, asyncio.Future)]
+        if tasks:
+            await asyncio.shield(asyncio.gather(*tasks))
+        results = {
+            domain: claim.result() if isinstance(claim, asyncio.Future) else claim
+            for domain, claim in claims.items()
+        }
+        return [results[domain] for domain in domains]
+
+    async def lookup(self, domain: str) -> Verdict:
+        return (await self.lookup_many([domain]))[0]
+
+    def stats(self) -> Dict[str, Any]:
+        from .metrics import get_metrics
+        from .resolver import get_cache
+
+        cache = get_cache()
+        metrics = get_metrics()
+        return {
+            "requests": self.requests,
+            "lookups": self.lookups,
+            "coalesced": self.coalesced,
+            "cache_hits": self.cache_hits,
+            "rejected": self.rejected,
+            "in_flight": len(self._inflight),
+            "max_pending": self.max_pending,
+            "verdicts_cached": len(self._verdicts),
+            "dns_cache": cache.stats() if cache is not None else None,
+            **({"metrics": metrics.snapshot()} if metrics is not None else {}),
+        }
+
+    # HTTP
+
+    def _rows(
+        self, domains: Iterable[Any], addresses: Iterable[Any]
+    ) -> Tuple[List[Dict[str, Any]], List[str]]:
+        """Row skeletons in request order and the lookup domain of each (invalid ones: "")."""
+        rows: List[Dict[str, Any]] = []
+        keys: List[str] = []
+        for value in domains:
+            try:
+                domain = normalize_domain(str(value))
+                if self.org_domains:
+                    domain = organizational_domain(domain)
+            except ValueError:
+                rows.append({"domain": value, "error": "Invalid domain"})
+                keys.append("")
+                continue
+            rows.append({"domain": domain})
+            keys.append(domain)
+        for value in addresses:
+            domain = address_domain(str(value), self.org_domains)
+            rows.append(_row(str(value), domain, {} if domain else {"error": "Invalid email address"}))
+            keys.append(domain or "")
+        return rows, keys
+
+    async def _answer(self, rows: List[Dict[str, Any]], keys: List[str]) -> List[Dict[str, Any]]:
+        wanted = [key for key in keys if key]
+        verdicts = dict(zip(wanted, await self.lookup_many(wanted)))
+        for row, key in zip(rows, keys):
+            if key:
+                row.update(verdicts[key])
+        return rows
+
+    async def dispatch(self, method: str, target: str, body: bytes) -> Tuple[int, Any]:
+        """Handle one request; returns `(status, JSON payload)`."""
+        url = urlsplit(target)
+        if url.path == "/health":
+            if method != "GET":
+                return 405, {"error": "Use GET"}
+            status = "overloaded" if len(self._inflight) >= self.max_pending else "ok"
+            return 200, {"status": status, "in_flight": len(self._inflight), "max_pending": self.max_pending}
+        if url.path == "/stats":
+            return (200, self.stats()) if method == "GET" else (405, {"error": "Use GET"})
+        if url.path != "/lookup":
+            return 404, {"error": "Not found"}
+        if method == "GET":
+            query = parse_qs(url.query)
+            rows, keys = self._rows(query.get("domain", [])[:1], query.get("address", [])[:1])
+            if len(rows) != 1:
+                return 400, {"error": "Give exactly one of domain= or address="}
+            if not keys[0]:
+                return 400, rows[0]
+            return 200, (await self._answer(rows, keys))[0]
+        if method == "POST":
+            try:
+                request = json.loads(body or b"{}")
+                domains = request.get("domains", [])
+                addresses = request.get("addresses", [])
+                if not isinstance(domains, list) or not isinstance(addresses, list):
+                    raise ValueError("domains and addresses must be lists")
+            except (ValueError, AttributeError) as e:
+                return 400, {"error": f"Bad request body: {e}"}
+            if len(domains) + len(addresses) > self.max_batch:
+                return 413, {"error": f"At most {self.max_batch} entries per batch"}
+            rows, keys = self._rows(domains, addresses)
+            return 200, {"results": await self._answer(rows, keys)}
+        return 405, {"error": "Use GET or POST"}
+
+    async def handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        """Serve one connection (HTTP/1.1 with keep-alive)."""
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), self.idle_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._respond(writer, 431, {"error": "Request head too large"}, False)
+                    return
+                request_line, *header_lines = head.decode("latin-1").split("\r\n")
+                try:
+                    method, target, version = request_line.split(" ", 2)
+                    headers = {
+                        name.strip().lower(): value.strip()
+                        for name, _, value in (line.partition(":") for line in header_lines if line)
+                    }
+                    length = int(headers.get("content-length") or 0)
+                    if length < 0:
+                        raise ValueError(f"negative Content-Length {length}")
+                except ValueError:
+                    await self._respond(writer, 400, {"error": "Malformed request"}, False)
+                    return
+                if length > self.max_body:
+                    await self._respond(writer, 413, {"error": f"Body larger than {self.max_body} bytes"}, False)
+                    return
+                try:
+                    body = await reader.readexactly(length) if length else b""
+                except (asyncio.IncompleteReadError, ConnectionError):
+                    return
+                self.requests += 1
+                extra: Dict[str, str] = {}
+                try:
+                    status, payload = await self.dispatch(method, target, body)
+                except Overloaded as e:
+                    status, payload = 503, {"error": f"Service overloaded ({e}); retry later"}
+                    extra["Retry-After"] = "1"
+                except Exception as e:
+                    status, payload = 500, {"error": str(e)}
+                keep_alive = version.strip() == "HTTP/1.1" and headers.get("connection", "").lower() != "close"
+                await self._respond(writer, status, payload, keep_alive, extra)
+                if not keep_alive:
+                    return
+        finally:
+            writer.close()
+
+    async def _respond(
+        self,
+        writer: asyncio.StreamWriter,
+        status: int,
+        payload: Any,
+        keep_alive: bool,
+        extra: Optional[Dict[str, str]] = None,
+    ) -> None:
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json; charset=utf-8",
+            "Content-Length": str(len(body)),
+            "Connection": "keep-alive" if keep_alive else "close",
+            **(extra or {}),
+        }
+        head = f"HTTP/1.1 {status} {HTTPStatus(status).phrase}\r\n"
+        head += "".join(f"{name}: {value}\r\n" for name, value in headers.items())
+        writer.write(head.encode("latin-1") + b"\r\n" + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8053) -> asyncio.AbstractServer:
+        """Start listening; the returned server is already serving."""
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_HEAD)
+
+    async def close(self) -> None:
+        """Release what the lookups pooled (HTTPS connections); call once the server has stopped."""
+        await close_http_pool()
+
+
+def run_service(host: str = "127.0.0.1", port: int = 8053, **kwargs: Any) -> None:
+    """Serve until interrupted; keyword arguments configure the `LookupService`."""
+
+    async def main() -> None:
+        service = LookupService(**kwargs)
+        server = await service.start(host, port)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await service.close()
+
+    asyncio.run(main())
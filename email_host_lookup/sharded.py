@@ -0,0 +1,514 @@
+"""
+sharded.py
+Multi-process bulk scanning for address lists too large for one event loop.
+
+Normalized domains are sharded by hash across worker processes.  Each
+worker runs its own asyncio lookup loop and DNS cache, so all lookups for
+a domain happen in one process.  The parent reads the input, deduplicates
+domains, and merges the verdicts back into a single row stream in input
+(or completion) order, with the same rows and stats as
+`bulk.scan_addresses`.
+
+Workers ignore SIGINT.  The first Ctrl-C makes the parent stop reading
+input and drain: rows already read still get their verdicts, so an
+input-ordered run ends on a clean, resumable prefix.  A second Ctrl-C
+aborts.
+"""
+
+import asyncio
+import multiprocessing
+import os
+import signal
+import threading
+import time
+import zlib
+from collections import OrderedDict, deque
+from multiprocessing.connection import wait
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    Callable,
+    Deque,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    TextIO,
+    Tuple,
+)
+
+from .bulk import (
+    _INVALID,
+    BulkStats,
+    DomainBudget,
+    RowWriter,
+    Verdict,
+    _row,
+    address_domain,
+    close_http_pool,
+    lookup_domain,
+    rewind_output,
+    save_checkpoint,
+)
+from .planner import Planner
+
+if TYPE_CHECKING:
+    from .store import VerdictStore
+
+# Seconds a worker may hold finished verdicts before sending them back.
+FLUSH_INTERVAL = 0.02
+
+# A row whose verdict is None is still waiting for its domain.
+_Entry = List[Any]
+
+
+class WorkerConfig(NamedTuple):
+    """Settings each shard worker applies before it starts resolving."""
+
+    concurrency: int = 100
+    cache_size: int = 100_000
+    # Soft cap: a worker whose RSS exceeds it retires and is replaced.
+    memory_limit_mb: Optional[float] = None
+    probes: bool = False
+    signatures_path: Optional[str] = None
+    batch_size: int = 64
+    # Upstream pool for the worker (see `resolver.configure_nameservers`).
+    nameservers: Optional[Tuple[str, ...]] = None
+    server_qps: Optional[float] = None
+    # Per-domain budget in seconds (see `bulk.DomainBudget`).
+    deadline: Optional[float] = None
+    # Methods and confidence threshold of a `planner.Planner`, if one is used.
+    plan_methods: Optional[Tuple[str, ...]] = None
+    plan_threshold: Optional[float] = None
+
+
+def _rss_bytes() -> int:
+    """Resident set size of this process (peak RSS where /proc is missing)."""
+    try:
+        with open("/proc/self/statm") as fp:
+            return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        try:
+            import resource
+        except ImportError:
+            return 0
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _worker_main(
+    tasks: "multiprocessing.Queue[Optional[List[str]]]",
+    conn: Any,
+    config: WorkerConfig,
+    initializer: Optional[Callable[..., None]],
+    initargs: Sequence[Any],
+) -> None:
+    # Ctrl-C reaches the whole process group; the parent decides how to drain.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    from .dns_cache import DnsCache
+    from .resolver import configure_nameservers, set_cache
+
+    if config.signatures_path:
+        from .signatures import load_signatures, set_signatures
+
+        set_signatures(load_signatures(config.signatures_path))
+    set_cache(DnsCache(max_entries=config.cache_size) if config.cache_size > 0 else None)
+    if config.nameservers:
+        configure_nameservers(list(config.nameservers), rate=config.server_qps)
+    if initializer is not None:
+        initializer(*initargs)
+    try:
+        retired = asyncio.run(_serve(tasks, conn, config))
+        conn.send(("done", retired))
+    finally:
+        conn.close()
+
+
+async def _serve(
+    tasks: "multiprocessing.Queue[Optional[List[str]]]", conn: Any, config: WorkerConfig
+) -> bool:
+    """Resolve domain batches from `tasks` until the end marker; True if retired early."""
+    loop = asyncio.get_running_loop()
+    inbox: "asyncio.Queue[Optional[List[str]]]" = asyncio.Queue()
+
+    def read() -> None:
+        while True:
+            batch = tasks.get()
+            try:
+                loop.call_soon_threadsafe(inbox.put_nowait, batch)
+            except RuntimeError:  # the loop is gone: this worker retired
+                return
+            if batch is None:
+                return
+
+    # A daemon thread rather than the executor, so a retiring worker does
+    # not wait on a blocked `tasks.get()` while shutting down.
+    threading.Thread(target=read, name="shard-reader", daemon=True).start()
+
+    limit = config.memory_limit_mb * 2**20 if config.memory_limit_mb else None
+    budget = DomainBudget(config.deadline) if config.deadline else None
+    planner = Planner(config.plan_methods, config.plan_threshold) if config.plan_methods else None
+    semaphore = asyncio.Semaphore(config.concurrency)
+    outbox: List[Tuple[str, Verdict]] = []
+    running: Set["asyncio.Task[None]"] = set()
+    resolved = 0
+
+    def flush() -> None:
+        if outbox:
+            conn.send(("rows", list(outbox)))
+            outbox.clear()
+
+    async def resolve(domain: str) -> None:
+        nonlocal resolved
+        try:
+            try:
+                verdict = await lookup_domain(domain, config.probes, budget, planner)
+            finally:
+                semaphore.release()
+        except Exception as e:
+            # A failed lookup is an error row, never a domain left unanswered.
+            verdict = {"error": str(e) or type(e).__name__}
+        resolved += 1
+        outbox.append((domain, verdict))
+        if len(outbox) >= config.batch_size:
+            flush()
+
+    async def ticker() -> None:
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            flush()
+
+    flusher = asyncio.ensure_future(ticker())
+    retired = False
+    try:
+        while not retired:
+            batch = await inbox.get()
+            if batch is None:
+                break
+            for domain in batch:
+                # Every worker resolves something before it may retire, so
+                # a cap below the interpreter's own footprint still progresses.
+                if limit is not None and resolved and _rss_bytes() > limit:
+                    retired = True
+                    break
+                await semaphore.acquire()
+                task = asyncio.ensure_future(resolve(domain))
+                running.add(task)
+                task.add_done_callback(running.discard)
+        if running:
+            await asyncio.wait(set(running))
+    finally:
+        flusher.cancel()
+        await close_http_pool()
+    flush()
+    return retired
+
+
+class _Shard:
+    """One worker process with its task queue, result pipe and unanswered domains."""
+
+    def __init__(
+        self,
+        ctx: Any,
+        index: int,
+        config: WorkerConfig,
+        initializer: Optional[Callable[..., None]],
+        initargs: Sequence[Any],
+    ) -> None:
+        self.index = index
+        self.tasks: "multiprocessing.Queue[Optional[List[str]]]" = ctx.Queue()
+        self.conn, sender = ctx.Pipe(duplex=False)
+        self.process = ctx.Process(
+            target=_worker_main,
+            args=(self.tasks, sender, config, initializer, initargs),
+            name=f"email-host-lookup-shard-{index}",
+            daemon=True,
+        )
+        self.process.start()
+        sender.close()
+        self.outstanding: Set[str] = set()
+        self.buffer: List[str] = []
+        self.closed = False
+        self.done: Optional[bool] = None  # the worker's "retired" flag once it finished
+
+    def submit(self, domain: str, batch_size: int) -> None:
+        self.outstanding.add(domain)
+        self.buffer.append(domain)
+        if len(self.buffer) >= batch_size:
+            self.flush()
+
+    def flush(self) -> None:
+        if self.buffer:
+            self.tasks.put(self.buffer)
+            self.buffer = []
+
+    def close(self) -> None:
+        """Send the end marker; the worker finishes what it has and exits."""
+        if not self.closed:
+            self.flush()
+            self.tasks.put(None)
+            self.closed = True
+
+    def release(self, timeout: float = 5.0) -> None:
+        """Reap the process and drop the queue and pipe."""
+        self.process.join(timeout)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.tasks.cancel_join_thread()
+        self.tasks.close()
+        self.conn.close()
+
+
+class ShardedScanner:
+    """
+    Scan addresses with `workers` processes (default: one per CPU).
+
+    `config` is applied in every worker; `initializer(*initargs)` runs there
+    afterwards, e.g. to point the resolver at other nameservers.  At most
+    `config.concurrency` domains are resolved at once per worker, and
+    `max_pending` caps rows waiting for a verdict in the parent.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        config: Optional[WorkerConfig] = None,
+        ordered: bool = True,
+        max_pending: Optional[int] = None,
+        verdict_cache_size: int = 100_000,
+        stats: Optional[BulkStats] = None,
+        store: Optional["VerdictStore"] = None,
+        org_domains: bool = False,
+        initializer: Optional[Callable[..., None]] = None,
+        initargs: Sequence[Any] = (),
+    ) -> None:
+        self.workers = workers or os.cpu_count() or 1
+        self.config = config or WorkerConfig()
+        if self.workers < 1 or self.config.concurrency < 1:
+            raise ValueError("workers and concurrency must be at least 1")
+        self.ordered = ordered
+        self.max_pending = max_pending or self.config.concurrency * self.workers * 10
+        self.verdict_cache_size = verdict_cache_size
+        self.stats = stats or BulkStats()
+        self.store = store
+        self.org_domains = org_domains
+        self.initializer = initializer
+        self.initargs = initargs
+        self.draining = False
+        # Workers replaced after retiring over the memory cap or crashing.
+        self.restarts = 0
+        self.crashes = 0
+        self._ctx = multiprocessing.get_context("spawn")
+        self._shards: List[_Shard] = []
+        self._verdicts: "OrderedDict[str, Verdict]" = OrderedDict()
+        self._waiting: Dict[str, List[_Entry]] = {}
+        self._window: Deque[_Entry] = deque()
+        self._ready: Deque[_Entry] = deque()
+        self._waiting_count = 0
+
+    def drain(self) -> None:
+        """Stop reading input; rows already read are still completed."""
+        self.draining = True
+
+    def scan(self, addresses: Iterable[str]) -> Iterator[Dict[str, Any]]:
+        """Classify `addresses`, yielding one row dict per address."""
+        stats = self.stats
+        previous = self._install_sigint()
+        self._shards = [self._spawn(i) for i in range(self.workers)]
+        try:
+            for address in addresses:
+                if self.draining:
+                    stats.interrupted = True
+                    break
+                stats.addresses += 1
+                domain = address_domain(address, self.org_domains)
+                entry: _Entry = [address, domain, None]
+                if domain is None:
+                    stats.invalid += 1
+                    entry[2] = _INVALID
+                elif domain in self._verdicts:
+                    stats.deduplicated += 1
+                    self._verdicts.move_to_end(domain)
+                    entry[2] = self._verdicts[domain]
+                elif domain in self._waiting:
+                    stats.deduplicated += 1
+                    self._waiting[domain].append(entry)
+                elif self.store is not None and (stored := self.store.get(domain)) is not None:
+                    stats.store_hits += 1
+                    entry[2] = stored
+                    self._remember(domain, stored)
+                else:
+                    self._waiting[domain] = [entry]
+                    self._shard_for(domain).submit(domain, self.config.batch_size)
+
+                if self.ordered:
+                    self._window.append(entry)
+                elif entry[2] is None:
+                    self._waiting_count += 1
+                else:
+                    self._ready.append(entry)
+                yield from self._emit()
+                while self._pending() >= self.max_pending:
+                    self._receive()
+                    yield from self._emit()
+
+            for shard in self._shards:
+                shard.close()
+            while self._pending():
+                self._receive()
+                yield from self._emit()
+        finally:
+            if previous is not None:
+                signal.signal(signal.SIGINT, previous)
+            for shard in self._shards:
+                shard.release(timeout=5.0 if shard.closed else 0)
+            stats.finished = time.monotonic()
+
+    def _install_sigint(self) -> Any:
+        if threading.current_thread() is not threading.main_thread():
+            return None
+
+        def handler(signum: int, frame: Any) -> None:
+            if self.draining:
+                raise KeyboardInterrupt
+            self.drain()
+
+        return signal.signal(signal.SIGINT, handler)
+
+    def _spawn(self, index: int) -> _Shard:
+        return _Shard(self._ctx, index, self.config, self.initializer, self.initargs)
+
+    def _shard_for(self, domain: str) -> _Shard:
+        return self._shards[zlib.crc32(domain.encode()) % self.workers]
+
+    def _pending(self) -> int:
+        return len(self._window) if self.ordered else self._waiting_count
+
+    def _remember(self, domain: str, verdict: Verdict) -> None:
+        self._verdicts[domain] = verdict
+        if len(self._verdicts) > self.verdict_cache_size:
+            self._verdicts.popitem(last=False)
+
+    def _emit(self) -> Iterator[Dict[str, Any]]:
+        if self.ordered:
+            while self._window and self._window[0][2] is not None:
+                yield _row(*self._window.popleft())
+        else:
+            while self._ready:
+                yield _row(*self._ready.popleft())
+
+    def _settle(self, shard: _Shard, domain: str, verdict: Verdict, resolved: bool = True) -> None:
+        shard.outstanding.discard(domain)
+        entries = self._waiting.pop(domain, None)
+        if entries is None:
+            return
+        if resolved:
+            self.stats.count_verdict(verdict)
+            if self.store is not None:
+                self.store.put(domain, verdict)
+        else:
+            self.stats.domain_errors += 1
+        self._remember(domain, verdict)
+        for entry in entries:
+            entry[2] = verdict
+        if not self.ordered:
+            self._waiting_count -= len(entries)
+            self._ready.extend(entries)
+
+    def _receive(self, timeout: float = 0.5) -> None:
+        """Wait for verdicts from any worker and apply them."""
+        for shard in self._shards:
+            shard.flush()
+        by_conn = {shard.conn: shard for shard in self._shards}
+        for conn in wait(list(by_conn), timeout):
+            shard = by_conn[conn]
+            try:
+                kind, payload = conn.recv()
+            except EOFError:
+                self._replace(shard)
+                continue
+            if kind == "rows":
+                for domain, verdict in payload:
+                    self._settle(shard, domain, verdict)
+            else:
+                shard.done = payload
+
+    def _fail(self, shard: _Shard, message: str) -> None:
+        """Settle every domain `shard` has not answered with an error verdict."""
+        error = {"error": message}
+        for domain in list(shard.outstanding):
+            self._settle(shard, domain, error, resolved=False)
+
+    def _replace(self, shard: _Shard) -> None:
+        """Handle a worker that has exited, starting a successor if needed."""
+        shard.release()
+        if shard.done is False:
+            # Finished: anything it left unanswered fails rather than stall the scan.
+            self._fail(shard, "Shard worker finished without a verdict")
+            self._shards.remove(shard)
+            return
+        if shard.done is None:
+            # Crashed: its unanswered domains fail rather than crash the next worker too.
+            self.crashes += 1
+            if self.crashes > 3 * self.workers:
+                raise RuntimeError(f"shard workers keep exiting (last exit code {shard.process.exitcode})")
+            self._fail(shard, f"Shard worker exited with code {shard.process.exitcode}")
+            if shard.closed:
+                self._shards.remove(shard)
+                return
+        self.restarts += 1
+        successor = self._spawn(shard.index)
+        self._shards[self._shards.index(shard)] = successor
+        for domain in shard.outstanding:
+            successor.submit(domain, self.config.batch_size)
+        if shard.closed:
+            successor.close()
+
+
+def run_sharded(
+    addresses: Iterable[str],
+    out: TextIO,
+    fmt: str = "jsonl",
+    flush_every: int = 1000,
+    run_id: Optional[str] = None,
+    resume_from: int = 0,
+    **kwargs: Any,
+) -> BulkStats:
+    """
+    `bulk.run_bulk` with a `ShardedScanner` (keyword arguments go to it).
+    A drained run is checkpointed as unfinished, so the same `run_id` resumes it.
+    """
+    from itertools import islice
+
+    store = kwargs.get("store")
+    ordered = kwargs.get("ordered", True)
+    if run_id is not None and (store is None or not ordered):
+        raise ValueError("resumable runs need a store and input-ordered output")
+    if resume_from and run_id is not None:
+        rewind_output(out, store.resume_offset(run_id))
+    scanner = ShardedScanner(**kwargs)
+    writer = RowWriter(out, fmt, header=resume_from == 0)
+    written = resume_from
+    completed = False
+    try:
+        for row in scanner.scan(islice(addresses, resume_from, None)):
+            writer.write(row)
+            written += 1
+            if written % flush_every == 0:
+                if run_id is not None:
+                    save_checkpoint(store, run_id, written, out)
+                else:
+                    out.flush()
+        completed = not scanner.draining
+    finally:
+        if run_id is not None:
+            save_checkpoint(store, run_id, written, out, finished=completed)
+        else:
+            out.flush()
+            if store is not None:
+                store.flush()
+    return scanner.stats
@@ -0,0 +1,281 @@
+"""
+signatures.py
+Data-driven provider signatures compiled into multi-pattern matchers.
+
+The signature table (`signatures.json` by default) lists, per detection
+channel (mx, spf, dmarc, autoconfig, srv, webfinger, mx_ip), an ordered
+list of rules.  Hostname channels are compiled into a reversed-label suffix
+trie; free-text channels (TXT records, HTTP bodies) into an Aho-Corasick
+automaton; IP address channels into a `ipprefix.PrefixTable` of CIDR
+prefixes.  Each string is scanned once regardless of the number of
+patterns, and when several rules match the earliest rule in the table wins,
+which preserves the precedence of the original if/elif chains (for IP
+prefixes the longest matching prefix wins first).  A channel's
+matcher is compiled the first time it is used, so a run that only checks
+MX hosts never builds the text automata.
+"""
+
+import json
+import os
+from typing import TYPE_CHECKING, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple, Union
+
+if TYPE_CHECKING:
+    from .ipprefix import PrefixTable
+
+DEFAULT_SIGNATURES_PATH = os.path.join(os.path.dirname(__file__), "signatures.json")
+
+_NO_MATCH = -1
+
+
+class Rule(NamedTuple):
+    """One provider signature of a channel."""
+
+    provider: str
+    label: str
+    patterns: Tuple[str, ...]
+
+
+class SuffixTrie:
+    """Trie over reversed DNS labels mapping domain suffixes to rule priorities."""
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]] = ()) -> None:
+        self._root: Dict[str, list] = {}
+        for pattern, priority in patterns:
+            self.add(pattern, priority)
+
+    def add(self, suffix: str, priority: int) -> None:
+        node = self._root
+        entry: Optional[list] = None
+        for label in reversed(suffix.strip(".").lower().split(".")):
+            entry = node.get(label)
+            if entry is None:
+                entry = node[label] = [{}, _NO_MATCH]
+            node = entry[0]
+        if entry is not None and (entry[1] == _NO_MATCH or priority < entry[1]):
+            entry[1] = priority
+
+    def search(self, hostname: str) -> int:
+        """Return the best (lowest) priority of any suffix of `hostname`, or -1."""
+        best = _NO_MATCH
+        node = self._root
+        for label in reversed(hostname.rstrip(".").lower().split(".")):
+            entry = node.get(label)
+            if entry is None:
+                break
+            if entry[1] != _NO_MATCH and (best == _NO_MATCH or entry[1] < best):
+                best = entry[1]
+            node = entry[0]
+        return best
+
+
+class AhoCorasick:
+    """
+    Aho-Corasick automaton over lower-cased text mapping substrings to rule
+    priorities.  Transitions are precomputed into a full DFA so scanning is
+    one dict lookup per character.
+    """
+
+    def __init__(self, patterns: Iterable[Tuple[str, int]] = ()) -> None:
+        goto: List[Dict[str, int]] = [{}]
+        out: List[int] = [_NO_MATCH]
+        for pattern, priority in patterns:
+            state = 0
+            for ch in pattern.lower():
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = len(goto)
+                    goto[state][ch] = nxt
+                    goto.append({})
+                    out.append(_NO_MATCH)
+                state = nxt
+            if out[state] == _NO_MATCH or priority < out[state]:
+                out[state] = priority
+
+        # Breadth-first construction of failure links, folding outputs and
+        # missing transitions of each state's failure state into the state.
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])]
+        delta.extend({} for _ in range(len(goto) - 1))
+        queue = list(goto[0].values())
+        head = 0
+        while head < len(queue):
+            state = queue[head]
+            head += 1
+            f = fail[state]
+            if out[f] != _NO_MATCH and (out[state] == _NO_MATCH or out[f] < out[state]):
+                out[state] = out[f]
+            transitions = dict(delta[f])
+            transitions.update(goto[state])
+            delta[state] = transitions
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[f].get(ch, 0)
+                queue.append(nxt)
+        self._delta = delta
+        self._out = out
+
+    def search(self, text: str) -> int:
+        """Return the best (lowest) priority of any pattern in `text`, or -1."""
+        delta = self._delta
+        out = self._out
+        best = _NO_MATCH
+        state = 0
+        for ch in text.lower():
+            state = delta[state].get(ch, 0)
+            found = out[state]
+            if found != _NO_MATCH and (best == _NO_MATCH or found < best):
+                best = found
+                if best == 0:
+                    break
+        return best
+
+    def scan(self, text: str, state: int = 0) -> Tuple[int, int]:
+        """
+        Streaming scan: feed `text` starting from `state` and stop at the
+        first match.  Returns `(state, priority)`, priority -1 if none yet.
+        """
+        delta = self._delta
+        out = self._out
+        for ch in text.lower():
+            state = delta[state].get(ch, 0)
+            if out[state] != _NO_MATCH:
+                return state, out[state]
+        return state, _NO_MATCH
+
+
+class ChannelMatcher:
+    """Compiled rules of one detection channel."""
+
+    def __init__(self, kind: str, rules: Sequence[Rule]) -> None:
+        if kind not in ("suffix", "substring", "prefix"):
+            raise ValueError(f"Unknown signature match kind: {kind}")
+        self.kind = kind
+        self.rules = list(rules)
+        self._compiled: Optional[Union[SuffixTrie, AhoCorasick, "PrefixTable"]] = None
+
+    @property
+    def _engine(self) -> Union[SuffixTrie, AhoCorasick, "PrefixTable"]:
+        engine = self._compiled
+        if engine is None:
+            patterns = [(p, i) for i, rule in enumerate(self.rules) for p in rule.patterns]
+            if self.kind == "prefix":
+                from .ipprefix import PrefixTable
+
+                engine = self._compiled = PrefixTable(patterns)
+            else:
+                engine = self._compiled = SuffixTrie(patterns) if self.kind == "suffix" else AhoCorasick(patterns)
+        return engine
+
+    def match(self, value: str) -> Optional[Rule]:
+        """Return the winning rule for a single string."""
+        priority = self._engine.search(value)
+        return self.rules[priority] if priority != _NO_MATCH else None
+
+    def first_match(self, values: Iterable[str]) -> Optional[Tuple[str, Rule]]:
+        """Return `(value, rule)` for the first value that matches any rule."""
+        search = self._engine.search
+        for value in values:
+            priority = search(value)
+            if priority != _NO_MATCH:
+                return value, self.rules[priority]
+        return None
+
+    def classify_many(self, values: Iterable[str]) -> List[Optional[Rule]]:
+        """
+        Classify a whole batch of strings (e.g. every MX host of a scan) in
+        one pass; repeated strings are matched only once.  IP prefix
+        channels match the whole batch in one sorted sweep.
+        """
+        engine = self._engine
+        if not isinstance(engine, (SuffixTrie, AhoCorasick)):
+            values = list(values)
+            return [self.rules[p] if p != _NO_MATCH else None for p in engine.search_many(values)]
+        search = engine.search
+        seen: Dict[str, int] = {}
+        results: List[Optional[Rule]] = []
+        for value in values:
+            priority = seen.get(value)
+            if priority is None:
+                priority = seen[value] = search(value)
+            results.append(self.rules[priority] if priority != _NO_MATCH else None)
+        return results
+
+    def stream(self) -> "StreamMatcher":
+        """Incremental matcher for bodies read chunk by chunk."""
+        if not isinstance(self._engine, AhoCorasick):
+            raise TypeError("only substring channels can be streamed")
+        return StreamMatcher(self)
+
+
+class StreamMatcher:
+    """Feeds chunks through a substring channel until the first match."""
+
+    def __init__(self, channel: ChannelMatcher) -> None:
+        self._channel = channel
+        self._state = 0
+        self.rule: Optional[Rule] = None
+
+    def feed(self, chunk: str) -> Optional[Rule]:
+        if self.rule is None:
+            self._state, priority = self._channel._engine.scan(chunk, self._state)
+            if priority != _NO_MATCH:
+                self.rule = self._channel.rules[priority]
+        return self.rule
+
+
+class SignatureTable:
+    """All compiled channels of a signature table."""
+
+    def __init__(self, channels: Dict[str, ChannelMatcher]) -> None:
+        self.channels = channels
+
+    def __getitem__(self, channel: str) -> ChannelMatcher:
+        return self.channels[channel]
+
+    def provider_of(self, channel: str, label: str) -> Optional[str]:
+        """
+        Map a verdict label produced by `channel` back to its rule's
+        provider; labels with `{url}`/`{entry}` placeholders match on the
+        text before the placeholder.  None for unknown/custom verdicts.
+        """
+        matcher = self.channels.get(channel)
+        if matcher is None:
+            return None
+        for rule in matcher.rules:
+            prefix, placeholder, _ = rule.label.partition("{")
+            if label.startswith(prefix) if placeholder else label == rule.label:
+                return rule.provider
+        return None
+
+    @classmethod
+    def from_dict(cls, data: dict) -> "SignatureTable":
+        channels = {}
+        for name, spec in data["channels"].items():
+            rules = [
+                Rule(rule["provider"], rule.get("label", rule["provider"]), tuple(rule["patterns"]))
+                for rule in spec["rules"]
+            ]
+            channels[name] = ChannelMatcher(spec.get("match", "substring"), rules)
+        return cls(channels)
+
+
+def load_signatures(path: str = DEFAULT_SIGNATURES_PATH) -> SignatureTable:
+    """Load and compile a signature table from a JSON file."""
+    with open(path, encoding="utf-8") as fp:
+        return SignatureTable.from_dict(json.load(fp))
+
+
+_signatures: Optional[SignatureTable] = None
+
+
+def get_signatures() -> SignatureTable:
+    """Return the active signature table, compiling the default one on first use."""
+    global _signatures
+    if _signatures is None:
+        _signatures = load_signatures()
+    return _signatures
+
+
+def set_signatures(table: Optional[SignatureTable]) -> None:
+    """Install a signature table for all detectors; None restores the default."""
+    global _signatures
+    _signatures = table
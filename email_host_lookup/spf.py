@@ -0,0 +1,201 @@
+"""
+spf.py
+Recursive SPF `include:`/`redirect=` expansion over a memoized include graph.
+
+Every SPF record fetched while expanding is kept in a graph shared by the
+whole run, together with the flattened subtree below it, so popular
+includes such as `_spf.google.com` are resolved and expanded once per scan
+rather than once per domain.  Expansion follows RFC 7208: at most 10
+DNS-querying terms per evaluation (section 4.6.4) and include loops are
+reported as errors.  The limit is a budget handed down the include graph:
+expansion stops as soon as it is spent, so a deep or wide graph costs a
+dozen fetches at most, not one per record it could reach.
+"""
+
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+from .email_host_lookup import detect_provider_by_spf, txt_from_answer
+from .resolver import resolve_async
+
+MAX_DNS_LOOKUPS = 10
+# Mechanisms and modifiers that cost a DNS lookup (RFC 7208, section 4.6.4).
+_LOOKUP_TERMS = ("include", "a", "mx", "ptr", "exists")
+
+
+class SpfNode(NamedTuple):
+    """A parsed SPF record: its include targets, redirect and lookup cost."""
+
+    includes: Tuple[str, ...]
+    redirect: Optional[str]
+    lookups: int
+    error: Optional[str] = None
+
+
+class SpfTree(NamedTuple):
+    """A flattened include subtree: every reachable domain in evaluation order."""
+
+    domains: Tuple[str, ...]
+    lookups: int
+    error: Optional[str] = None
+
+
+def parse_spf(record: str) -> SpfNode:
+    """Extract include targets, the redirect target and the lookup count of a record."""
+    includes: List[str] = []
+    redirect: Optional[str] = None
+    lookups = 0
+    for term in record.split()[1:]:
+        name, sep, value = term.lstrip("+-~?").partition(":")
+        name = name.lower()
+        if name.startswith("redirect="):
+            redirect = name.split("=", 1)[1].rstrip(".") or None
+            lookups += 1
+        elif name.split("/", 1)[0] in _LOOKUP_TERMS:
+            lookups += 1
+            # Macro-expanded targets depend on the sender and cannot be followed.
+            if name == "include" and sep and "%" not in value:
+                includes.append(value.rstrip(".").lower())
+    return SpfNode(tuple(includes), redirect, lookups)
+
+
+class SpfGraph:
+    """
+    Memoized include graph.  SPF records are fetched once per domain (even
+    when many lookups want them at the same time) and flattened subtrees are
+    cached; entries older than `max_age` seconds are refetched.
+    """
+
+    def __init__(self, max_lookups: int = MAX_DNS_LOOKUPS, max_entries: int = 100_000, max_age: float = 3600) -> None:
+        self.max_lookups = max_lookups
+        self.max_entries = max_entries
+        self.max_age = max_age
+        self._nodes: "OrderedDict[str, Tuple[float, SpfNode]]" = OrderedDict()
+        self._trees: Dict[str, SpfTree] = {}
+        self._inflight: Dict[str, "asyncio.Future[SpfNode]"] = {}
+        # Subtrees being flattened, by (domain, lookup budget).
+        self._building: Dict[Tuple[str, int], "asyncio.Future[SpfTree]"] = {}
+        self.fetches = 0
+
+    async def node(self, domain: str) -> SpfNode:
+        """Return the parsed SPF record of `domain`, fetching it at most once."""
+        cached = self._nodes.get(domain)
+        if cached is not None and time.monotonic() - cached[0] < self.max_age:
+            self._nodes.move_to_end(domain)
+            return cached[1]
+        pending = self._inflight.get(domain)
+        if pending is None:
+            # The fetch finishes (and is cached) even if every caller is cancelled.
+            pending = self._inflight[domain] = asyncio.ensure_future(self._fetch(domain))
+            pending.add_done_callback(lambda done: self._fetched(domain, done))
+        return await asyncio.shield(pending)
+
+    def _fetched(self, domain: str, future: "asyncio.Future[SpfNode]") -> None:
+        self._inflight.pop(domain, None)
+        if future.cancelled() or future.exception() is not None:
+            return
+        self._nodes[domain] = (time.monotonic(), future.result())
+        self._trees.pop(domain, None)
+        while len(self._nodes) > self.max_entries:
+            evicted, _ = self._nodes.popitem(last=False)
+            self._trees.pop(evicted, None)
+
+    async def _fetch(self, domain: str) -> SpfNode:
+        self.fetches += 1
+        try:
+            records = [txt for txt in txt_from_answer(await resolve_async(domain, "TXT")) if txt.startswith("v=spf1")]
+        except Exception as e:
+            return SpfNode((), None, 0, f"{domain}: {e}")
+        if not records:
+            return SpfNode((), None, 0, f"{domain}: no SPF record")
+        node = parse_spf(records[0])
+        if len(records) > 1:
+            node = node._replace(error=f"{domain}: multiple SPF records")
+        return node
+
+    async def tree(self, domain: str, path: Tuple[str, ...] = (), budget: Optional[int] = None) -> SpfTree:
+        """
+        Flatten the include subtree below `domain`, spending at most
+        `budget` DNS lookups (default `max_lookups`).  A subtree over budget
+        is cut short and counts more lookups than `budget`.  Concurrent
+        callers share one flattening.
+        """
+        if domain in path:
+            return SpfTree((), 0, f"include loop at {domain}")
+        budget = self.max_lookups if budget is None else budget
+        node = await self.node(domain)
+        cached = self._trees.get(domain)
+        if cached is not None:
+            return cached
+        key = (domain, budget)
+        pending = self._building.get(key)
+        if pending is None:
+            pending = self._building[key] = asyncio.ensure_future(self._build(domain, node, path, budget))
+            pending.add_done_callback(lambda _: self._building.pop(key, None))
+        return await asyncio.shield(pending)
+
+    async def _build(self, domain: str, node: SpfNode, path: Tuple[str, ...], budget: int) -> SpfTree:
+        tree = await self._combine(node, path + (domain,), budget)
+        # Only a whole subtree holds for every budget.
+        if tree.lookups <= budget:
+            self._trees[domain] = tree
+        return tree
+
+    async def _combine(self, node: SpfNode, path: Tuple[str, ...], budget: int) -> SpfTree:
+        domains: List[str] = []
+        lookups = node.lookups
+        error = node.error
+        if lookups > budget:
+            return SpfTree((), lookups, error)
+        children = node.includes + ((node.redirect,) if node.redirect else ())
+        # Fetch the children's records together, then flatten them in order,
+        # each with what its earlier siblings left of the budget.
+        await asyncio.gather(*(self.node(child) for child in children if child not in path))
+        for child in children:
+            subtree = await self.tree(child, path, budget - lookups)
+            domains.append(child)
+            domains.extend(subtree.domains)
+            lookups += subtree.lookups
+            error = error or subtree.error
+            if lookups > budget:
+                break
+        return SpfTree(tuple(domains), lookups, error)
+
+    async def expand(self, domain: str, record: Optional[str] = None) -> SpfTree:
+        """
+        Expand the SPF policy of `domain` (using `record` if it was already
+        fetched) and flag policies exceeding the DNS lookup limit.  Expansion
+        stops at the first lookup past the limit, so the reported count is
+        where it stopped.
+        """
+        node = parse_spf(record) if record is not None else await self.node(domain)
+        tree = await self._combine(node, (domain,), self.max_lookups)
+        if tree.lookups > self.max_lookups and tree.error is None:
+            tree = tree._replace(error=f"exceeds the limit of {self.max_lookups} DNS lookups ({tree.lookups})")
+        return tree
+
+
+_graph = SpfGraph()
+
+
+def get_spf_graph() -> SpfGraph:
+    """Return the include graph shared by the current run."""
+    return _graph
+
+
+def set_spf_graph(graph: SpfGraph) -> None:
+    """Start a new shared include graph, e.g. at the beginning of a scan."""
+    global _graph
+    _graph = graph
+
+
+async def async_detect_provider_by_spf_tree(domain: str, spf_records: Sequence[str]) -> Tuple[str, SpfTree]:
+    """
+    Classify the provider from the fully expanded include tree of the
+    domain's SPF record.  Returns the verdict and the expansion.
+    """
+    record = next((txt for txt in spf_records if txt.startswith("v=spf1")), None)
+    tree = await get_spf_graph().expand(domain, record)
+    return detect_provider_by_spf([f"include:{target}" for target in tree.domains]), tree
@@ -0,0 +1,161 @@
+"""
+store.py
+Persistent SQLite store of per-domain verdicts for warm restarts.
+
+Each row holds the full bulk verdict of a domain (MX/SPF/DMARC results and,
+when probed, the SRV/autoconfig/WebFinger verdicts) together with its
+expiry time.  Writes are buffered and committed in batched transactions,
+and per-run checkpoints let an interrupted bulk scan resume where it
+stopped.  A checkpoint also records the size of the output file, so rows
+written after it by a killed run can be cut off before resuming.
+"""
+
+import json
+import sqlite3
+import time
+from typing import Any, Dict, Optional
+
+Verdict = Dict[str, Any]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS verdicts (
+    domain TEXT PRIMARY KEY,
+    verdict TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    rows_done INTEGER NOT NULL,
+    finished INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL,
+    output_offset INTEGER
+);
+"""
+
+
+class VerdictStore:
+    """
+    SQLite-backed verdict store.
+
+    `ttl` is how long a verdict stays fresh at most: one with an `expires`
+    map goes stale when its first record expires.  Verdicts carrying an
+    `error` (or cut short by a deadline, `partial`) use the shorter
+    `error_ttl` so they are retried sooner.  Pending
+    writes are committed every `batch_size` puts or `flush_interval`
+    seconds, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        ttl: float = 86400,
+        error_ttl: float = 3600,
+        batch_size: int = 500,
+        flush_interval: float = 2.0,
+    ) -> None:
+        self.path = path
+        self.ttl = ttl
+        self.error_ttl = error_ttl
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._conn = sqlite3.connect(path)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(_SCHEMA)
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(runs)")}
+        if "output_offset" not in columns:
+            # Stores created before checkpoints recorded the output size.
+            with self._conn:
+                self._conn.execute("ALTER TABLE runs ADD COLUMN output_offset INTEGER")
+        self._pending: Dict[str, tuple] = {}
+        self._last_flush = time.monotonic()
+        self.hits = 0
+        self.misses = 0
+
+    def __enter__(self) -> "VerdictStore":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+    def get(self, domain: str, now: Optional[float] = None) -> Optional[Verdict]:
+        """Return the stored verdict for `domain` if it has not expired."""
+        now = time.time() if now is None else now
+        pending = self._pending.get(domain)
+        if pending is not None:
+            row: Optional[tuple] = (pending[1], pending[2])
+        else:
+            row = self._conn.execute(
+                "SELECT verdict, expires_at FROM verdicts WHERE domain = ?", (domain,)
+            ).fetchone()
+        if row is None or row[1] <= now:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, domain: str, verdict: Verdict, ttl: Optional[float] = None) -> None:
+        """Queue a verdict for writing; it is committed with the next batch."""
+        now = time.time()
+        if ttl is None:
+            ttl = self.error_ttl if "error" in verdict or "partial" in verdict else self.ttl
+            expires = verdict.get("expires")
+            if expires:
+                ttl = min(ttl, max(0.0, min(expires.values()) - now))
+        self._pending[domain] = (domain, json.dumps(verdict, ensure_ascii=False), now + ttl, now)
+        if len(self._pending) >= self.batch_size or now - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        """Commit all pending verdicts in a single transaction."""
+        self._last_flush = time.monotonic()
+        if not self._pending:
+            return
+        with self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO verdicts (domain, verdict, expires_at, updated_at) VALUES (?, ?, ?, ?)",
+                self._pending.values(),
+            )
+        self._pending.clear()
+
+    def purge_expired(self, now: Optional[float] = None) -> int:
+        """Delete expired verdicts; returns the number removed."""
+        now = time.time() if now is None else now
+        self.flush()
+        with self._conn:
+            return self._conn.execute("DELETE FROM verdicts WHERE expires_at <= ?", (now,)).rowcount
+
+    def resume_position(self, run_id: str) -> int:
+        """Rows already written by an unfinished run, or 0 for a new/finished run."""
+        row = self._conn.execute(
+            "SELECT rows_done, finished FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None or row[1]:
+            return 0
+        return row[0]
+
+    def resume_offset(self, run_id: str) -> Optional[int]:
+        """Output size at an unfinished run's last checkpoint, or None if not recorded."""
+        row = self._conn.execute(
+            "SELECT output_offset, finished FROM runs WHERE run_id = ?", (run_id,)
+        ).fetchone()
+        if row is None or row[1]:
+            return None
+        return row[0]
+
+    def checkpoint(
+        self, run_id: str, rows_done: int, finished: bool = False, output_offset: Optional[int] = None
+    ) -> None:
+        """Record run progress; pending verdicts are committed first."""
+        self.flush()
+        with self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO runs (run_id, rows_done, finished, updated_at, output_offset) "
+                "VALUES (?, ?, ?, ?, ?)",
+                (run_id, rows_done, int(finished), time.time(), output_offset),
+            )
+
+    def close(self) -> None:
+        self.flush()
+        self._conn.close()
@@ -0,0 +1,80 @@
+# tests/test_async_lookup.py
+import asyncio
+
+import dns.resolver
+import dns.rrset
+import pytest
+
+from email_host_lookup import async_lookup
+from email_host_lookup.email_host_lookup import detect_provider_by_srv, get_email_host_info
+
+ZONE = {
+    ("example.com", "MX"): ["10 aspmx.l.google.com.", "20 alt1.aspmx.l.google.com."],
+    ("example.com", "TXT"): ['"v=spf1 include:_spf.google.com ~all"', '"site-verification=abc"'],
+    ("_dmarc.example.com", "TXT"): ['"v=DMARC1; p=none; rua=mailto:reports@google.com"'],
+    ("_imaps._tcp.example.com", "SRV"): ["0 1 993 imap.zoho.com."],
+}
+
+
+def fake_resolver(delay: float = 0.0, in_flight=None):
+    async def resolve_async(qname: str, rdtype: str):
+        if in_flight is not None:
+            in_flight["now"] += 1
+            in_flight["max"] = max(in_flight["max"], in_flight["now"])
+        try:
+            await asyncio.sleep(delay)
+            key = (qname.replace("other", "example"), rdtype)
+            if key not in ZONE:
+                raise dns.resolver.NXDOMAIN()
+            return dns.rrset.from_text_list(qname + ".", 300, "IN", rdtype, ZONE[key])
+        finally:
+            if in_flight is not None:
+                in_flight["now"] -= 1
+    return resolve_async
+
+
+def test_get_email_host_info_queries_concurrently(monkeypatch):
+    monkeypatch.setattr(async_lookup, "resolve_async", fake_resolver(delay=0.2))
+    loop = asyncio.new_event_loop()
+    try:
+        start = loop.time()
+        info = loop.run_until_complete(async_lookup.async_get_email_host_info("example.com"))
+        elapsed = loop.time() - start
+    finally:
+        loop.close()
+    assert elapsed < 0.4
+    assert info == (
+        "example.com",
+        ["alt1.aspmx.l.google.com", "aspmx.l.google.com"],
+        "Google Workspace",
+        ["v=spf1 include:_spf.google.com ~all"],
+        "Google Workspace (SPF)",
+        ["v=DMARC1; p=none; rua=mailto:reports@google.com"],
+        "Google Workspace (DMARC)",
+    )
+
+
+def test_sync_wrappers(monkeypatch):
+    monkeypatch.setattr(async_lookup, "resolve_async", fake_resolver())
+    assert get_email_host_info("example.com")[2] == "Google Workspace"
+    assert detect_provider_by_srv("example.com").startswith("Zoho Mail (SRV: _imaps._tcp.example.com")
+
+
+def test_mx_failure_raises(monkeypatch):
+    monkeypatch.setattr(async_lookup, "resolve_async", fake_resolver())
+    with pytest.raises(Exception, match="Failed to resolve MX records for missing.test"):
+        get_email_host_info("missing.test")
+
+
+@pytest.mark.asyncio
+async def test_lookup_many_bounds_concurrency(monkeypatch):
+    in_flight = {"now": 0, "max": 0}
+    monkeypatch.setattr(async_lookup, "resolve_async", fake_resolver(delay=0.01, in_flight=in_flight))
+    domains = ["example.com", "other.com", "missing.test"] * 10
+    results = [item async for item in async_lookup.lookup_many(domains, concurrency=4)]
+
+    assert len(results) == len(domains)
+    # Three record queries per domain, at most four domains at a time.
+    assert in_flight["max"] <= 12
+    failures = [domain for domain, info in results if isinstance(info, Exception)]
+    assert failures == ["missing.test"] * 10
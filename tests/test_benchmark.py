@@ -0,0 +1,41 @@
+# tests/test_benchmark.py
+import asyncio
+
+from benchmarks import run
+from benchmarks.standins import StandInServers, SyntheticZone
+from email_host_lookup import http_probe, resolver
+
+
+def test_standin_zone_drives_every_detection_method():
+    zone = SyntheticZone(24, nxdomain_rate=0.1, seed=3)
+    with StandInServers(zone, seed=3) as servers:
+        run.configure_client(servers.dns_port, servers.https_port, dns_timeout=0.5)
+        resolver.set_cache(resolver.DnsCache())
+        try:
+            level = asyncio.run(run.run_level(zone.domains, zone.expected, concurrency=8))
+        finally:
+            resolver.configure_nameservers(None)
+            http_probe.set_ssl_context(None)
+            http_probe.set_address_override(None)
+    assert level["domains_per_sec"] > 0 and level["cpu_ms_per_domain"] > 0
+    for method, stats in level["latency_ms"].items():
+        assert stats["p50"] <= stats["p95"] <= stats["p99"]
+        assert stats.get("wrong", 0) == 0, method
+    assert level["latency_ms"]["mx"]["errors"] == zone.nxdomains
+
+
+def test_compare_flags_regressions():
+    level = {
+        "concurrency": 10,
+        "domains_per_sec": 100.0,
+        "latency_ms": {"mx": {"p50": 10.0, "p95": 20.0, "p99": 30.0, "errors": 0, "wrong": 0}},
+        "cpu_ms_per_domain": 5.0,
+        "peak_rss_kb": 50_000,
+    }
+    baseline = {"params": {"domains": 10}, "levels": [level]}
+    slower = dict(level, domains_per_sec=60.0, cpu_ms_per_domain=7.0,
+                  latency_ms={"mx": dict(level["latency_ms"]["mx"], p95=40.0, wrong=3)})
+    assert run.compare({"params": {"domains": 10}, "levels": [level]}, baseline) == []
+    problems = run.compare({"params": {"domains": 10}, "levels": [slower]}, baseline)
+    assert len(problems) == 4
+    assert run.compare({"params": {"domains": 20}, "levels": [level]}, baseline)
@@ -0,0 +1,146 @@
+# tests/test_bulk.py
+import asyncio
+import csv
+import io
+import json
+
+import pytest
+
+from email_host_lookup import bulk, planner
+
+
+def fake_engine(calls):
+    async def async_get_email_host_info(domain):
+        calls.append(domain)
+        # Later domains resolve first, so completion order differs from input order.
+        await asyncio.sleep(0.05 if domain == "slow.example" else 0.0)
+        if domain == "broken.example":
+            raise Exception(f"Failed to resolve MX records for {domain}: NXDOMAIN")
+        return (domain, [f"mx.{domain}"], "Google Workspace", [], "Unknown or Custom Provider (SPF)",
+                [], "Unknown or Custom Provider (DMARC)")
+    return async_get_email_host_info
+
+
+ADDRESSES = [
+    "a@slow.example",
+    "b@fast.example",
+    "not-an-address",
+    "c@slow.example",
+    "d@broken.example",
+    "e@fast.example",
+]
+
+
+async def collect(**kwargs):
+    stats = bulk.BulkStats()
+    rows = [row async for row in bulk.scan_addresses(iter(ADDRESSES), stats=stats, **kwargs)]
+    return rows, stats
+
+
+@pytest.mark.asyncio
+async def test_scan_dedupes_and_keeps_input_order(monkeypatch):
+    calls = []
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_engine(calls))
+    rows, stats = await collect(concurrency=2)
+
+    assert [row["address"] for row in rows] == ADDRESSES
+    assert sorted(calls) == ["broken.example", "fast.example", "slow.example"]
+    assert stats.deduplicated == 2 and stats.invalid == 1 and stats.domain_errors == 1
+    assert rows[2]["error"] == "Invalid email address"
+    assert rows[3]["mx_records"] == ["mx.slow.example"]
+    assert rows[4]["error"].startswith("Failed to resolve MX records for broken.example")
+
+
+@pytest.mark.asyncio
+async def test_scan_completion_order(monkeypatch):
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_engine([]))
+    rows, _ = await collect(concurrency=3, ordered=False)
+
+    assert rows[0]["address"] == "not-an-address"
+    assert [row["address"] for row in rows[-2:]] == ["a@slow.example", "c@slow.example"]
+
+    rows, _ = await collect(concurrency=3, ordered=False, max_pending=1)
+    assert sorted(row["address"] for row in rows) == sorted(ADDRESSES)
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("ordered", [True, False])
+async def test_failing_planner_or_store_becomes_an_error_row(monkeypatch, ordered):
+    class FailingPlanner(planner.Planner):
+        async def run(self, domain, deadline=None, known=None):
+            if domain == "broken.example":
+                raise RuntimeError("planner blew up")
+            return {"provider_mx": "Google Workspace"}
+
+    class FailingStore:
+        def get(self, domain):
+            return None
+
+        def put(self, domain, verdict):
+            if domain == "fast.example":
+                raise OSError("disk full")
+
+    rows, stats = await asyncio.wait_for(
+        collect(ordered=ordered, planner=FailingPlanner(), store=FailingStore()), timeout=2
+    )
+    errors = {row["address"]: row.get("error") for row in rows}
+    assert sorted(errors) == sorted(ADDRESSES)
+    assert errors["d@broken.example"] == "planner blew up"
+    assert errors["b@fast.example"] == errors["e@fast.example"] == "disk full"
+    assert errors["a@slow.example"] is None and stats.domain_errors == 2
+
+
+def test_run_bulk_writes_jsonl_and_csv(monkeypatch):
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_engine([]))
+    out = io.StringIO()
+    bulk.run_bulk(bulk.read_addresses(io.StringIO("\n".join(ADDRESSES) + "\n# comment\n")), out)
+    lines = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [line["address"] for line in lines] == ADDRESSES
+
+    out = io.StringIO()
+    bulk.run_bulk(iter(ADDRESSES), out, fmt="csv")
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert rows[0]["provider_mx"] == "Google Workspace"
+    assert rows[0]["mx_records"] == "mx.slow.example"
+
+
+@pytest.mark.asyncio
+async def test_deadline_marks_unfinished_methods_partial(monkeypatch):
+    async def mx(domain):
+        return [f"mx.{domain}"]
+
+    async def spf(domain):
+        return []
+
+    async def dmarc(domain):
+        if domain == "slow.example":
+            await asyncio.sleep(10)
+        return []
+
+    monkeypatch.setattr(planner, "async_get_mx_records", mx)
+    monkeypatch.setattr(planner, "async_get_spf_record", spf)
+    monkeypatch.setattr(planner, "async_get_dmarc_record", dmarc)
+    rows, stats = await asyncio.wait_for(collect(deadline=0.2), 2.0)
+
+    slow = rows[0]
+    assert slow["partial"] == ["dmarc"] and slow["mx_records"] == ["mx.slow.example"]
+    assert "provider_dmarc" not in slow
+    assert "partial" not in rows[1] and rows[1]["provider_dmarc"]
+    assert stats.partial == 1
+
+
+def test_domain_budget_adapts_to_typical_lookups():
+    budget = bulk.DomainBudget(30.0)
+    assert budget.seconds() == 30.0
+    for _ in range(50):
+        budget.observe(0.5, {})
+    budget.observe(60.0, {"partial": ["mx"]})
+    assert budget.seconds() == pytest.approx(1.5)
+
+
+def test_collect_batch_keeps_rows_columnar(monkeypatch):
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_engine([]))
+    batch = bulk.collect_batch(iter(ADDRESSES))
+    assert [row["address"] for row in batch] == ADDRESSES
+    assert batch.row(0)["mx_records"] == ["mx.slow.example"]
+    assert batch.verdicts == 4  # slow, fast, broken and the invalid address
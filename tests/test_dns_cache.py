@@ -0,0 +1,99 @@
+# tests/test_dns_cache.py
+import dns.message
+import dns.resolver
+import dns.rrset
+import pytest
+
+from email_host_lookup import resolver
+from email_host_lookup.dns_cache import DnsCache, negative_ttl
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+def mx_rrset(name, ttl=300):
+    return dns.rrset.from_text(name + ".", ttl, "IN", "MX", "10 aspmx.l.google.com.")
+
+
+def nxdomain(name, soa_ttl=3600, soa_minimum=120):
+    response = dns.message.make_response(dns.message.make_query(name, "MX"))
+    response.authority.append(
+        dns.rrset.from_text("example.", soa_ttl, "IN", "SOA", f"ns. host. 1 7200 900 1209600 {soa_minimum}")
+    )
+    qname = dns.name.from_text(name)
+    return dns.resolver.NXDOMAIN(qnames=[qname], responses={qname: response})
+
+
+def test_positive_answers_honour_ttl():
+    clock = FakeClock()
+    cache = DnsCache(clock=clock)
+    cache.store_answer("Example.com.", "mx", mx_rrset("example.com", ttl=300))
+
+    found, rrset = cache.lookup("example.com", "MX")
+    assert found and rrset[0].exchange.to_text() == "aspmx.l.google.com."
+    clock.now += 301
+    assert cache.lookup("example.com", "MX") == (False, None)
+    assert cache.stats()["hits"] == 1 and cache.stats()["expirations"] == 1
+
+
+def test_negative_answers_use_soa_minimum():
+    clock = FakeClock()
+    cache = DnsCache(clock=clock)
+    exc = nxdomain("missing.example.")
+    assert negative_ttl(exc) == 120
+    assert cache.store_error("missing.example", "MX", exc)
+    assert not cache.store_error("slow.example", "MX", dns.resolver.LifetimeTimeout(timeout=1.0, errors=[]))
+
+    clock.now += 119
+    found, cached = cache.lookup("missing.example", "MX")
+    assert found and cached is not exc and str(cached) == str(exc)
+    assert cached.__traceback__ is None
+    clock.now += 2
+    assert cache.lookup("missing.example", "MX") == (False, None)
+    assert cache.stats()["negative_hits"] == 1
+
+
+def test_lru_eviction_by_entries_and_bytes():
+    cache = DnsCache(max_entries=2)
+    for name in ("a.example", "b.example"):
+        cache.store_answer(name, "MX", mx_rrset(name))
+    cache.lookup("a.example", "MX")
+    cache.store_answer("c.example", "MX", mx_rrset("c.example"))
+    assert cache.lookup("b.example", "MX")[0] is False
+    assert cache.lookup("a.example", "MX")[0] and cache.lookup("c.example", "MX")[0]
+    assert cache.evictions == 1
+
+    cache = DnsCache(max_bytes=600)
+    for name in ("a.example", "b.example", "c.example"):
+        cache.store_answer(name, "MX", mx_rrset(name))
+    assert len(cache) == 2 and cache.bytes <= 600
+
+
+def test_resolver_serves_repeats_from_cache(monkeypatch):
+    calls = []
+
+    class Answer:
+        def __init__(self, rrset):
+            self.rrset = rrset
+
+    def fake_resolve(qname, rdtype):
+        calls.append((qname, rdtype))
+        if qname.startswith("missing"):
+            raise nxdomain(qname + ".")
+        return Answer(mx_rrset(qname))
+
+    monkeypatch.setattr(resolver.dns.resolver, "resolve", fake_resolve)
+    cache = DnsCache()
+    monkeypatch.setattr(resolver, "_cache", cache)
+
+    for _ in range(3):
+        assert len(resolver.resolve("example.com", "MX")) == 1
+        with pytest.raises(dns.resolver.NXDOMAIN):
+            resolver.resolve("missing.example", "MX")
+    assert calls == [("example.com", "MX"), ("missing.example", "MX")]
+    assert cache.stats()["hit_ratio"] == pytest.approx(4 / 6, abs=1e-3)
@@ -0,0 +1,65 @@
+# tests/test_domains.py
+import dns.resolver
+import dns.rrset
+import pytest
+
+from email_host_lookup import async_lookup, bulk
+from email_host_lookup.domains import normalize_domain, organizational_domain, public_suffix
+
+
+def test_normalize_domain():
+    assert normalize_domain(" EXAMPLE.co.jp. ") == "example.co.jp"
+    assert normalize_domain("Bücher.Example") == "xn--bcher-kva.example"
+    assert normalize_domain("xn--bcher-kva.example") == "xn--bcher-kva.example"
+    for bad in ("", ".", "a..b", "x" * 64 + ".com"):
+        with pytest.raises(ValueError):
+            normalize_domain(bad)
+
+
+def test_organizational_domain_uses_public_suffix_list():
+    assert organizational_domain("mail.sub.example.co.jp") == "example.co.jp"
+    assert organizational_domain("EXAMPLE.co.jp.") == "example.co.jp"
+    assert organizational_domain("a.b.example.com") == "example.com"
+    assert public_suffix("foo.city.kawasaki.jp") == "kawasaki.jp"  # exception rule
+    assert public_suffix("foo.bar.kawasaki.jp") == "bar.kawasaki.jp"  # wildcard rule
+    assert organizational_domain("example.unknowntld") == "example.unknowntld"
+    assert organizational_domain("co.jp") == "co.jp"
+
+
+@pytest.mark.asyncio
+async def test_dmarc_falls_back_to_organizational_domain(monkeypatch):
+    queries = []
+
+    async def resolve_async(qname, rdtype):
+        queries.append(qname)
+        if qname == "_dmarc.example.co.jp":
+            return dns.rrset.from_text(qname + ".", 300, "IN", "TXT", '"v=DMARC1; p=reject; rua=mailto:d@google.com"')
+        raise dns.resolver.NXDOMAIN()
+
+    monkeypatch.setattr(async_lookup, "resolve_async", resolve_async)
+    records = await async_lookup.async_get_dmarc_record("mail.sub.example.co.jp")
+    assert records == ["v=DMARC1; p=reject; rua=mailto:d@google.com"]
+    assert queries == ["_dmarc.mail.sub.example.co.jp", "_dmarc.example.co.jp"]
+
+    queries.clear()
+    records = await async_lookup.async_get_dmarc_record("other.co.jp")
+    assert records[0].startswith("Error:") and queries == ["_dmarc.other.co.jp"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_dedupes_on_normalized_names(monkeypatch):
+    calls = []
+
+    async def async_get_email_host_info(domain):
+        calls.append(domain)
+        return (domain, [], "Unknown or Custom Provider", [], "", [], "")
+
+    monkeypatch.setattr(bulk, "async_get_email_host_info", async_get_email_host_info)
+    addresses = ["a@EXAMPLE.co.jp", "b@example.co.jp.", "c@mail.sub.example.co.jp", "d@bad..name"]
+    rows = [row async for row in bulk.scan_addresses(iter(addresses))]
+    assert calls == ["example.co.jp", "mail.sub.example.co.jp"]
+    assert rows[3]["error"] == "Invalid email address"
+
+    calls.clear()
+    rows = [row async for row in bulk.scan_addresses(iter(addresses), org_domains=True)]
+    assert calls == ["example.co.jp"]
@@ -0,0 +1,126 @@
+# tests/test_http_probe.py
+import asyncio
+import io
+import os
+import ssl
+
+import pytest
+import pytest_asyncio
+
+from email_host_lookup import bulk, http_probe, planner
+
+CERT = os.path.join(os.path.dirname(__file__), "data", "localhost.pem")
+
+# (host, path) -> (delay, status, body chunks)
+ROUTES = {
+    ("autoconfig.race.example.test", "/mail/config-v1.1.xml"): (1.0, 200, [b"<server>imap.google.com</server>"]),
+    ("autodiscover.race.example.test", "/autodiscover/autodiscover.xml"): (0.0, 200, [b"<Url>outlook.office365.com</Url>"]),
+    ("plain.example.test", "/.well-known/autoconfig/mail/config-v1.1.xml"): (0.0, 200, [b"<clientConfig/>"]),
+    ("autodiscover.plain.example.test", "/autodiscover/autodiscover.xml"): (0.0, 302, []),
+    ("plain.example.test", "/.well-known/webfinger"): (0.0, 200, [b'{"subject": "acct:user@plain.example.test"}']),
+    ("chunked.example.test", "/.well-known/webfinger"): (0.0, 200, [b'{"links": [', b'{"href": "https://login.microsoft', b'online.com"}]}']),
+}
+
+
+async def handle(reader, writer):
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode().partition(":")
+                headers[name.strip().lower()] = value.strip()
+            path = request_line.split()[1].decode().split("?")[0]
+            delay, status, chunks = ROUTES.get((headers["host"], path), (0.0, 404, [b"not found"]))
+            await asyncio.sleep(delay)
+            if status == 302:
+                writer.write(b"HTTP/1.1 302 Found\r\nLocation: https://plain.example.test/.well-known/autoconfig/"
+                             b"mail/config-v1.1.xml\r\nContent-Length: 0\r\n\r\n")
+            elif len(chunks) > 1:
+                writer.write(b"HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n")
+                for chunk in chunks:
+                    writer.write(b"%x\r\n%s\r\n" % (len(chunk), chunk))
+                writer.write(b"0\r\n\r\n")
+            else:
+                body = b"".join(chunks)
+                writer.write(b"HTTP/1.1 %d X\r\nContent-Length: %d\r\n\r\n%s" % (status, len(body), body))
+            await writer.drain()
+    except (ConnectionError, ssl.SSLError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+@pytest_asyncio.fixture
+async def https_server():
+    server_ctx = ssl.create_default_context(ssl.Purpose.CLIENT_AUTH)
+    server_ctx.load_cert_chain(CERT)
+    server = await asyncio.start_server(handle, "127.0.0.1", 0, ssl=server_ctx)
+    port = server.sockets[0].getsockname()[1]
+    http_probe.set_ssl_context(ssl.create_default_context(cafile=CERT))
+    http_probe.set_address_override(lambda host, _: ("127.0.0.1", port))
+    try:
+        yield server
+    finally:
+        http_probe.set_address_override(None)
+        http_probe.set_ssl_context(None)
+        await http_probe.close_pool()
+        server.close()
+        await server.wait_closed()
+
+
+@pytest.mark.asyncio
+async def test_autoconfig_race_returns_first_conclusive_answer(https_server):
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    verdict = await http_probe.async_detect_provider_by_autoconfig("race.example.test")
+    assert verdict == "Microsoft 365 (autodiscover: https://autodiscover.race.example.test/autodiscover/autodiscover.xml)"
+    assert loop.time() - start < 0.8  # the slow autoconfig probe was cancelled, not awaited
+
+
+@pytest.mark.asyncio
+async def test_autoconfig_unknown_and_missing(https_server):
+    assert await http_probe.async_detect_provider_by_autoconfig("plain.example.test") == (
+        "Autoconfig present but provider unknown: https://plain.example.test/.well-known/autoconfig/mail/config-v1.1.xml"
+    )
+    assert await http_probe.async_detect_provider_by_autoconfig("nothing.example.test") == (
+        "No response from autoconfig/autodiscover endpoints"
+    )
+
+
+@pytest.mark.asyncio
+async def test_webfinger_streams_chunks_and_reuses_connections(https_server):
+    assert await http_probe.async_detect_provider_by_webfinger("chunked.example.test") == "Microsoft (WebFinger)"
+    pool = http_probe.get_pool()
+    opened = pool.opened
+    for _ in range(3):
+        verdict = await http_probe.async_detect_provider_by_webfinger("plain.example.test")
+        assert verdict == "WebFinger present but provider unknown"
+        verdict = await http_probe.async_detect_provider_by_webfinger("nothing.example.test")
+        assert verdict == "No response from WebFinger endpoint: HTTP Error 404"
+    # One connection per host; fully read bodies keep it alive for the next probe.
+    assert pool.opened - opened == 2 and pool.reused == 4
+
+
+@pytest.mark.asyncio
+async def test_pool_keeps_a_bounded_number_of_idle_connections(https_server):
+    pool = http_probe.get_pool()
+    pool.max_idle = 1
+    for domain in ("plain.example.test", "nothing.example.test"):
+        await http_probe.async_detect_provider_by_webfinger(domain)
+    assert list(pool._idle) == [("nothing.example.test", 443)]
+
+
+@pytest.mark.asyncio
+async def test_bulk_run_closes_the_loops_pooled_connections(https_server):
+    pool = http_probe.get_pool()
+    out = io.StringIO()
+    await bulk.run_bulk_async(["user@plain.example.test"], out, planner=planner.Planner(["webfinger"], threshold=None))
+    assert "WebFinger present" in out.getvalue()
+    assert pool.opened == 1 and not pool._idle
+    assert asyncio.get_running_loop() not in http_probe._pools
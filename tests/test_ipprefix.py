@@ -0,0 +1,90 @@
+# tests/test_ipprefix.py
+import ipaddress
+import random
+import time
+
+import dns.rrset
+import dns.resolver
+import pytest
+
+from email_host_lookup import ipprefix, planner, resolver
+from email_host_lookup.ipprefix import PrefixTable
+
+
+def test_longest_prefix_wins_and_batches_match_single_lookups():
+    rng = random.Random(7)
+    patterns = [("0.0.0.0/0", 9), ("2001:db8::/32", 3), ("2001:db8:1::/48", 4)]
+    for priority in range(200):
+        length = rng.choice((8, 12, 16, 20, 24, 32))
+        address = ipaddress.ip_address(rng.getrandbits(8) << 24 | rng.getrandbits(24))
+        patterns.append((f"{address}/{length}", priority % 8))
+    table = PrefixTable(patterns)
+    networks = [(ipaddress.ip_network(p, strict=False), priority) for p, priority in patterns]
+
+    def naive(address):
+        matches = [(n.prefixlen, -priority) for n, priority in networks if address in n]
+        return -max(matches)[1] if matches else -1
+
+    queries = [str(ipaddress.ip_address(rng.getrandbits(32))) for _ in range(500)]
+    queries += [str(n.network_address + 1) for n, _ in networks if n.version == 4]
+    queries += ["2001:db8:1::25", "2001:db8:2::25", "2001:db9::1", "not an address"]
+    expected = [naive(ipaddress.ip_address(q)) if q != "not an address" else -1 for q in queries]
+    assert [table.search(q) for q in queries] == expected
+    assert table.search_many(queries) == expected
+    assert len(table) < 3 * len(patterns)
+
+
+class Source:
+    """Offline source serving A/AAAA records; every query is logged."""
+
+    def __init__(self, records):
+        self.records = records
+        self.queries = []
+
+    async def resolve_async(self, qname, rdtype):
+        self.queries.append((qname, rdtype))
+        found = self.records.get((qname, rdtype))
+        if found is None:
+            raise dns.resolver.NoAnswer()
+        return dns.rrset.from_text(qname + ".", found[0], "IN", rdtype, *found[1:])
+
+
+@pytest.mark.asyncio
+async def test_vanity_mx_hosts_are_classified_by_address_once_per_scan(monkeypatch):
+    source = Source({
+        ("mx.vanity.example", "A"): (300, "192.0.2.10", "74.125.24.27"),
+        ("mx.vanity.example", "AAAA"): (600, "2607:f8b0:4004:c07::1b"),
+        ("mail.other.example", "A"): (300, "198.51.100.1"),
+    })
+    monkeypatch.setattr(resolver, "_cache", None)
+    monkeypatch.setattr(resolver, "_source", source)
+    monkeypatch.setattr(ipprefix, "_cache", ipprefix.MxAddressCache())
+
+    mx_queries = []
+
+    async def mx_records(domain):
+        mx_queries.append(domain)
+        return {"a.example": ["mx.vanity.example"], "b.example": ["MX.vanity.example."],
+                "c.example": ["mail.other.example"]}[domain]
+
+    monkeypatch.setattr(planner, "async_get_mx_records", mx_records)
+    plan = planner.Planner(["mx", "mx_ip"], threshold=None)
+    first, second, other = [await plan.run(domain) for domain in ("a.example", "b.example", "c.example")]
+
+    assert first["provider_mx"] == "Unknown or Custom Provider"
+    assert first["mx_ip"] == "Google Workspace (MX IP: mx.vanity.example → 74.125.24.27)"
+    assert first["mx_addresses"] == ["192.0.2.10", "74.125.24.27", "2607:f8b0:4004:c07::1b"]
+    assert first["provider"] == "Google Workspace"
+    assert 0 < first["expires"]["mx_ip"] - time.time() <= 300
+    assert second["mx_ip"] == first["mx_ip"] and second["expires"]["mx_ip"] <= first["expires"]["mx_ip"]
+    assert other["mx_ip"] == "Unknown or Custom Provider (MX IP)" and other["provider"] is None
+
+    # The shared host was resolved once; a missing AAAA counts as an answer.
+    assert sorted(source.queries) == [
+        ("mail.other.example", "A"), ("mail.other.example", "AAAA"),
+        ("mx.vanity.example", "A"), ("mx.vanity.example", "AAAA"),
+    ]
+    assert ipprefix.get_mx_address_cache().hits == 1
+    # mx_ip reused the MX hosts of the mx method running alongside it.
+    assert mx_queries == ["a.example", "b.example", "c.example"]
+    assert "mx_ip" not in planner.ALL_METHODS
@@ -0,0 +1,83 @@
+# tests/test_lookup_app.py
+import asyncio
+
+import pytest
+
+from email_host_lookup import async_lookup, bulk, email_host_lookup_screen, http_probe
+
+
+def log_text(log):
+    return "\n".join(line.text for line in log.lines)
+
+
+async def fast_mx(domain):
+    return ["aspmx.l.google.com"]
+
+
+async def slow_webfinger(domain):
+    await asyncio.sleep(0.5)
+    return "Google (WebFinger)"
+
+
+async def no_records(domain):
+    return []
+
+
+async def unknown_probe(domain):
+    return "No response"
+
+
+@pytest.fixture
+def fresh_screen(monkeypatch):
+    monkeypatch.setattr(email_host_lookup_screen, "_instance", None)
+    monkeypatch.setattr(async_lookup, "async_get_mx_records", fast_mx)
+    monkeypatch.setattr(async_lookup, "async_get_spf_record", no_records)
+    monkeypatch.setattr(async_lookup, "async_get_dmarc_record", no_records)
+    monkeypatch.setattr(async_lookup, "async_detect_provider_by_srv", unknown_probe)
+    monkeypatch.setattr(http_probe, "async_detect_provider_by_autoconfig", unknown_probe)
+    monkeypatch.setattr(http_probe, "async_detect_provider_by_webfinger", slow_webfinger)
+
+
+@pytest.mark.asyncio
+async def test_lookup_streams_each_method_as_it_resolves(fresh_screen):
+    from textual.widgets import Input, RichLog
+
+    app = email_host_lookup_screen.EmailHostLookupApp()
+    async with app.run_test(headless=True, size=(100, 50)) as pilot:
+        app.query_one("#email_input", Input).value = "user@Example.COM"
+        app.query_one("#lookup_button").press()
+        await pilot.pause(0.2)
+        text = log_text(app.query_one("#output_log", RichLog))
+        # MX is already shown while the slow WebFinger probe is still running.
+        assert "example.com" in text and "MX: Google Workspace" in text
+        assert "WebFinger" not in text
+        await app.workers.wait_for_complete()
+        await pilot.pause(0.1)
+        text = log_text(app.query_one("#output_log", RichLog))
+        for method in ("SPF:", "DMARC:", "SRV:", "Autoconfig:", "WebFinger: Google (WebFinger)"):
+            assert method in text
+
+
+@pytest.mark.asyncio
+async def test_bulk_panel_scans_file_with_progress(fresh_screen, monkeypatch, tmp_path):
+    from textual.widgets import Input, ProgressBar, RichLog, Static
+
+    async def fake_info(domain):
+        return (domain, [f"mx.{domain}"], "Google Workspace", [], "Unknown", [], "Unknown")
+
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_info)
+    path = tmp_path / "addresses.txt"
+    path.write_text("".join(f"user{i}@d{i % 40}.example\n" for i in range(200)) + "not-an-address\n")
+
+    app = email_host_lookup_screen.EmailHostLookupApp()
+    async with app.run_test(headless=True, size=(100, 50)) as pilot:
+        app.query_one("#bulk_path", Input).value = str(path)
+        app.query_one("#bulk_button").press()
+        await pilot.pause(0.1)
+        await app.workers.wait_for_complete()
+        await pilot.pause(0.1)
+        progress = app.query_one("#bulk_progress", ProgressBar)
+        assert progress.total == 201 and progress.progress == 201
+        status = str(app.query_one("#bulk_status", Static).renderable)
+        assert "201/201 addresses, 40 domains" in status and "1 invalid" in status and "done" in status
+        assert "user7@d7.example: Google Workspace" in log_text(app.query_one("#bulk_log", RichLog))
@@ -0,0 +1,93 @@
+# tests/test_metrics.py
+import io
+import urllib.request
+
+import dns.asyncresolver
+import dns.exception
+import dns.resolver
+import dns.rrset
+import pytest
+
+from email_host_lookup import bulk, metrics, resolver
+from email_host_lookup.email_host_lookup import get_mx_records
+
+
+class Answer:
+    def __init__(self, rrset):
+        self.rrset = rrset
+
+
+async def fake_resolve(qname, rdtype):
+    if qname.startswith("missing"):
+        raise dns.resolver.NXDOMAIN()
+    if qname.startswith("slow"):
+        raise dns.exception.Timeout()
+    if qname.startswith("broken"):
+        raise dns.resolver.NoNameservers()
+    if rdtype == "MX":
+        return Answer(dns.rrset.from_text(qname + ".", 300, "IN", "MX", "10 aspmx.l.google.com."))
+    raise dns.resolver.NoAnswer()
+
+
+@pytest.fixture
+def enabled(monkeypatch):
+    monkeypatch.setattr(resolver.dns.asyncresolver, "resolve", fake_resolve)
+    monkeypatch.setattr(resolver, "_cache", resolver.DnsCache())
+    m = metrics.Metrics()
+    monkeypatch.setattr(metrics, "_metrics", m)
+    return m
+
+
+def test_disabled_by_default_records_nothing(monkeypatch):
+    monkeypatch.setattr(resolver.dns.resolver, "resolve", lambda qname, rdtype: Answer(
+        dns.rrset.from_text(qname + ".", 300, "IN", "MX", "10 aspmx.l.google.com.")))
+    monkeypatch.setattr(resolver, "_cache", None)
+    assert metrics.get_metrics() is None
+    assert get_mx_records("example.com") == ["aspmx.l.google.com"]
+
+
+def test_bulk_run_returns_method_timings_and_query_outcomes(enabled):
+    out = io.StringIO()
+    addresses = ["a@example.com", "b@missing.example", "c@slow.example", "d@broken.example", "e@example.com"]
+    stats = bulk.run_bulk(iter(addresses), out)
+    snap = stats.as_dict()["metrics"]
+
+    assert snap["methods"]["domain"]["count"] == 4
+    assert snap["methods"]["mx"]["count"] == 4
+    # SPF and DMARC lookups are cancelled once MX fails, so they may not all run.
+    assert snap["methods"]["dmarc"]["count"] >= 1
+    outcomes = snap["dns"]["outcomes"]
+    assert outcomes["noerror"] == 1
+    assert outcomes["nxdomain"] >= 1 and outcomes["timeout"] >= 1 and outcomes["servfail"] >= 1
+    assert snap["dns"]["queries"]["MX"] == 4
+    assert snap["cache"]["misses"] > 0
+    assert snap["in_flight"]["domains"] == {"current": 0, "peak": 4}
+    assert snap["in_flight"]["dns"]["current"] == 0
+
+
+def test_histogram_quantiles_use_bucket_bounds():
+    histogram = metrics.Histogram()
+    for seconds in (0.0005, 0.003, 0.003, 0.2):
+        histogram.observe(seconds)
+    assert histogram.quantile(0.5) == 0.005
+    assert histogram.quantile(0.99) == 0.25
+    assert histogram.summary()["count"] == 4
+
+
+def test_prometheus_endpoint_serves_text_format(enabled):
+    enabled.observe("mx", 0.02)
+    enabled.count_query("MX", "nxdomain", 0.01)
+    enabled.count_http("webfinger", "4xx")
+    server = metrics.start_http_server(0)
+    try:
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url) as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+    assert '# TYPE email_host_lookup_method_duration_seconds histogram' in text
+    assert 'email_host_lookup_method_duration_seconds_bucket{method="mx",le="0.025"} 1' in text
+    assert 'email_host_lookup_method_duration_seconds_bucket{method="mx",le="+Inf"} 1' in text
+    assert 'email_host_lookup_dns_queries_total{rdtype="MX",outcome="nxdomain"} 1' in text
+    assert 'email_host_lookup_http_requests_total{channel="webfinger",outcome="4xx"} 1' in text
+    assert "email_host_lookup_dns_cache_hit_ratio" in text
@@ -0,0 +1,130 @@
+# tests/test_offline.py
+import gzip
+import json
+
+import dns.asyncresolver
+import dns.resolver
+import pytest
+
+from email_host_lookup import offline, resolver
+from email_host_lookup.async_lookup import async_detect_provider_by_srv, async_get_email_host_info
+
+ZONE = """\
+$ORIGIN example.com.
+$TTL 1h
+@   IN SOA ns1 hostmaster ( 2024010101 7200 3600
+        1209600 300 ) ; multi-line
+    IN NS ns1
+    IN MX 20 alt1.aspmx.l.google.com.
+    300 IN MX 10 aspmx.l.google.com.
+    IN TXT "v=spf1 include:_spf.google.com ~all ; not a comment" ; a comment
+_dmarc IN TXT ( "v=DMARC1; p=reject; "
+    "rua=mailto:d@example.com" )
+_imaps._tcp IN 600 SRV 0 1 993 imap.gmail.com.
+www IN A 192.0.2.1
+$ORIGIN other.example.
+mail IN MX 10 mx.zoho.com.
+"""
+
+
+@pytest.fixture
+def index(tmp_path):
+    zone = tmp_path / "example.com.zone"
+    zone.write_text(ZONE)
+    pdns = tmp_path / "dump.json.gz"
+    with gzip.open(pdns, "wt") as fp:
+        fp.write(json.dumps({"obj": {"rrname": "zoho.example.", "rrtype": "MX", "rdata": ["10 mx.zoho.com."]}}) + "\n")
+        fp.write("not json\n")
+        fp.write(json.dumps({"rrname": "zoho.example.", "rrtype": "TXT", "rdata": "v=spf1 include:zoho.com ~all"}) + "\n")
+        fp.write(json.dumps({"rrname": "zoho.example.", "rrtype": "A", "rdata": "192.0.2.7"}) + "\n")
+    array = tmp_path / "export"
+    array.write_text(json.dumps([{"rrname": "ms.example", "rrtype": "MX", "rdata": "0 ms-example.mail.protection.outlook.com.",
+                                  "ttl": 60}]))
+    return offline.load_index([str(zone), str(pdns), str(array)])
+
+
+def test_zone_and_passive_dns_files_are_indexed(index):
+    assert len(index) == 9
+    mx = index.resolve("EXAMPLE.com.", "MX")
+    assert sorted(str(r.exchange) for r in mx) == ["alt1.aspmx.l.google.com.", "aspmx.l.google.com."]
+    assert mx.ttl == 300
+    assert [r.strings for r in index.resolve("example.com", "TXT")] == [
+        (b"v=spf1 include:_spf.google.com ~all ; not a comment",)
+    ]
+    assert [r.strings for r in index.resolve("_dmarc.example.com", "TXT")] == [
+        (b"v=DMARC1; p=reject; ", b"rua=mailto:d@example.com")
+    ]
+    assert index.resolve("_imaps._tcp.example.com", "SRV").ttl == 600
+    assert str(index.resolve("mail.other.example", "MX")[0].exchange) == "mx.zoho.com."
+    assert [r.strings for r in index.resolve("zoho.example", "TXT")] == [(b"v=spf1 include:zoho.com ~all",)]
+    assert index.resolve("ms.example", "MX").ttl == 60
+
+    with pytest.raises(dns.resolver.NoAnswer):
+        index.resolve("zoho.example", "SRV")
+    with pytest.raises(dns.resolver.NXDOMAIN):
+        index.resolve("www.example.com", "MX")  # A records are not indexed
+
+
+def test_ttl_units():
+    assert offline.parse_ttl("1h30m") == 5400
+    assert offline.parse_ttl("2d") == 172800
+    with pytest.raises(ValueError):
+        offline.parse_ttl("1x")
+
+
+@pytest.mark.asyncio
+async def test_engine_classifies_from_the_index_without_network(index, monkeypatch):
+    async def no_network(*args, **kwargs):
+        raise AssertionError("network query while offline")
+
+    monkeypatch.setattr(dns.asyncresolver, "resolve", no_network)
+    monkeypatch.setattr(resolver, "_cache", None)
+    monkeypatch.setattr(resolver, "_source", index)
+
+    info = await async_get_email_host_info("example.com")
+    assert info.provider_mx == "Google Workspace"
+    assert info.provider_spf == "Google Workspace (SPF)"
+    assert info.dmarc_records == ["v=DMARC1; p=reject; rua=mailto:d@example.com"]
+    assert (await async_get_email_host_info("zoho.example")).provider_spf.startswith("Zoho Mail")
+    assert "_imaps._tcp.example.com" in await async_detect_provider_by_srv("example.com")
+
+
+def test_json_array_exports_are_decoded_entry_by_entry():
+    entries = [{"rrname": f"d{i}.example", "rrtype": "MX", "rdata": [f"10 mx{i}.zoho.com."], "ttl": i + 1}
+               for i in range(3)]
+    text = json.dumps(entries, indent=2).splitlines(keepends=True)
+    read = []
+
+    def lines():
+        for line in text:
+            read.append(line)
+            yield line
+
+    records = offline.passive_dns_records(lines())
+    assert next(records) == ("d0.example", 1, "MX", "10 mx0.zoho.com.", "")
+    assert len(read) < len(text) / 2
+    assert [record[0] for record in records] == ["d1.example", "d2.example"]
+    # A compact array on one line decodes the same way.
+    assert len(list(offline.passive_dns_records([json.dumps(entries)]))) == 3
+
+
+def test_relative_rdata_names_use_the_current_origin(tmp_path):
+    zone = tmp_path / "relative.zone"
+    zone.write_text(
+        "$ORIGIN example.com.\n"
+        "@ IN MX 10 mail\n"
+        "@ IN MX 20 @\n"
+        "_imaps._tcp IN SRV 0 1 993 imap\n"
+        "$ORIGIN sub.example.com.\n"
+        "@ IN MX 10 mx.other.example.\n"
+        "  IN MX 20 backup\n"
+    )
+    index = offline.load_index([str(zone)])
+
+    assert sorted(str(r.exchange) for r in index.resolve("example.com", "MX")) == [
+        "example.com.", "mail.example.com."
+    ]
+    assert str(index.resolve("_imaps._tcp.example.com", "SRV")[0].target) == "imap.example.com."
+    assert sorted(str(r.exchange) for r in index.resolve("sub.example.com", "MX")) == [
+        "backup.sub.example.com.", "mx.other.example."
+    ]
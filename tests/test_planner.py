@@ -0,0 +1,94 @@
+# tests/test_planner.py
+import asyncio
+
+import pytest
+
+from email_host_lookup import bulk, http_probe, planner
+from email_host_lookup.email_host_lookup import detect_provider_by_spf
+from email_host_lookup.signatures import get_signatures
+
+GOOGLE_MX = ["aspmx.l.google.com"]
+GOOGLE_SPF = ["v=spf1 include:_spf.google.com ~all"]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """Fake detection engine; `records[domain]` holds (mx, spf); every call is logged."""
+    calls = []
+    records = {}
+
+    def fake(name, result, delay=0.0):
+        async def run(domain, *args):
+            calls.append((name, domain))
+            await asyncio.sleep(delay)
+            return result(domain, *args)
+        return run
+
+    monkeypatch.setattr(planner, "async_get_mx_records", fake("mx", lambda d: records[d][0]))
+    monkeypatch.setattr(planner, "async_get_spf_record", fake("spf", lambda d: records[d][1]))
+    monkeypatch.setattr(
+        planner, "async_detect_provider_by_spf_expanded", fake("spf_expanded", lambda d, r: detect_provider_by_spf(r))
+    )
+    monkeypatch.setattr(planner, "async_get_dmarc_record", fake("dmarc", lambda d: [], delay=0.05))
+    monkeypatch.setattr(planner, "async_detect_provider_by_srv", fake("srv", lambda d: "No SRV"))
+    monkeypatch.setattr(
+        http_probe, "async_detect_provider_by_autoconfig", fake("autoconfig", lambda d: "Google Workspace (autoconfig: x)")
+    )
+    monkeypatch.setattr(http_probe, "async_detect_provider_by_webfinger", fake("webfinger", lambda d: "No response"))
+    return calls, records
+
+
+def test_signature_labels_map_back_to_providers():
+    table = get_signatures()
+    assert table.provider_of("spf", "Microsoft 365 (SPF)") == "Microsoft 365"
+    assert table.provider_of("autoconfig", "Zoho Mail (autoconfig: https://x/)") == "Zoho Mail"
+    assert table.provider_of("mx", "Unknown or Custom Provider") is None
+
+
+def test_score_is_the_leaders_margin():
+    assert planner.score({"mx": "Google Workspace", "spf": "Google Workspace (SPF)"}) == ("Google Workspace", 0.85)
+    assert planner.score({"mx": "Google Workspace", "spf": "Microsoft 365 (SPF)"}) == ("Google Workspace", 0.15)
+    assert planner.score({"mx": "Unknown or Custom Provider"}) == (None, 0.0)
+
+
+@pytest.mark.asyncio
+async def test_confident_dns_verdict_skips_the_probes(engine):
+    calls, records = engine
+    records["a.example"] = (GOOGLE_MX, GOOGLE_SPF)
+    verdict = await planner.Planner().run("a.example")
+
+    assert verdict["provider"] == "Google Workspace" and verdict["confidence"] == 0.85
+    # DMARC was still in flight and is cancelled; the later stages never start.
+    assert verdict["skipped"] == ["autoconfig", "dmarc", "srv", "webfinger"]
+    assert {name for name, _ in calls} == {"mx", "spf", "spf_expanded", "dmarc"}
+    assert "provider_dmarc" not in verdict
+
+
+@pytest.mark.asyncio
+async def test_unclear_verdict_escalates_and_full_evidence_runs_everything(engine):
+    calls, records = engine
+    records["custom.example"] = (["mx.custom.example"], GOOGLE_SPF)
+    verdict = await planner.Planner().run("custom.example")
+    assert verdict["provider"] == "Google Workspace" and verdict["confidence"] == 0.7
+    assert verdict["autoconfig"].startswith("Google Workspace") and "skipped" not in verdict
+
+    records["a.example"] = (GOOGLE_MX, GOOGLE_SPF)
+    verdict = await planner.Planner(threshold=None).run("a.example")
+    assert "skipped" not in verdict and verdict["provider_dmarc"] and verdict["webfinger"]
+
+
+@pytest.mark.asyncio
+async def test_bulk_scan_reports_saved_probes(engine):
+    _, records = engine
+    records["a.example"] = records["b.example"] = (GOOGLE_MX, GOOGLE_SPF)
+    stats = bulk.BulkStats()
+    rows = [
+        row
+        async for row in bulk.scan_addresses(
+            iter(["x@a.example", "y@b.example"]), stats=stats, planner=planner.Planner()
+        )
+    ]
+    assert [row["provider"] for row in rows] == ["Google Workspace"] * 2
+    summary = stats.as_dict()
+    assert summary["skipped"] == {"autoconfig": 2, "dmarc": 2, "srv": 2, "webfinger": 2}
+    assert summary["saved_cost"] == 2 * (12.0 + 1.5 + 3.0 + 8.0)
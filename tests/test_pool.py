@@ -0,0 +1,170 @@
+# tests/test_pool.py
+import asyncio
+import socket
+
+import dns.exception
+import dns.resolver
+import dns.rrset
+import pytest
+
+from benchmarks.standins import StandInServers, SyntheticZone
+from email_host_lookup import metrics, pool, resolver
+from email_host_lookup.email_host_lookup import get_mx_records
+
+
+class Answer:
+    def __init__(self, rrset):
+        self.rrset = rrset
+
+
+class FakeServer:
+    """Stands in for one upstream's dnspython resolver."""
+
+    def __init__(self, fail=False):
+        self.fail = fail
+        self.calls = 0
+
+    def resolve(self, qname, rdtype, lifetime=None):
+        self.calls += 1
+        if self.fail:
+            raise dns.exception.Timeout()
+        if qname.startswith("missing"):
+            raise dns.resolver.NXDOMAIN()
+        return Answer(dns.rrset.from_text(qname + ".", 300, "IN", "MX", "10 mx.example.net."))
+
+
+def fake_pool(*servers, **kwargs):
+    upstreams = []
+    for i, server in enumerate(servers):
+        upstream = pool.Upstream(f"192.0.2.{i + 1}", timeout=1.0, lifetime=1.0)
+        upstream._sync = server
+        upstreams.append(upstream)
+    return pool.ResolverPool(upstreams, seed=1, **kwargs)
+
+
+def test_token_bucket_allows_a_burst_then_paces():
+    bucket = pool.TokenBucket(rate=10, burst=2)
+    assert bucket.take() == 0 and bucket.take() == 0
+    assert bucket.take() == pytest.approx(0.1, abs=0.01)
+    assert bucket.take() == pytest.approx(0.2, abs=0.01)
+
+
+def test_failing_server_is_retried_elsewhere_and_ejected():
+    bad, good = FakeServer(fail=True), FakeServer()
+    p = fake_pool(bad, good, eject_after=1)
+    for i in range(20):
+        assert p.resolve(f"d{i}.example", "MX")[0].exchange.to_text() == "mx.example.net."
+    # Tried first on the tie, then ejected.
+    assert bad.calls == 1
+    stats = {s["server"]: s for s in p.stats()}
+    assert stats["192.0.2.1"]["ejected"] and stats["192.0.2.1"]["errors"] == 1
+    assert stats["192.0.2.2"]["queries"] == 20 and stats["192.0.2.2"]["error_rate"] == 0
+
+
+def test_error_rate_steers_load_away_before_ejection():
+    flaky, good = pool.Upstream("192.0.2.1"), pool.Upstream("192.0.2.2")
+    p = pool.ResolverPool([flaky, good], eject_after=10)
+    flaky.record(0.01, False, p.eject_after, p.cooldown)
+    assert not flaky.ejected(0) and p.pick() is good
+
+
+def test_nxdomain_is_an_answer_not_a_server_failure():
+    first, second = FakeServer(), FakeServer()
+    p = fake_pool(first, second)
+    with pytest.raises(dns.resolver.NXDOMAIN):
+        p.resolve("missing.example", "MX")
+    assert first.calls + second.calls == 1
+    assert all(s["errors"] == 0 for s in p.stats())
+
+
+def test_all_servers_failing_raises_the_last_error():
+    p = fake_pool(FakeServer(fail=True), FakeServer(fail=True), attempts=5)
+    with pytest.raises(dns.exception.Timeout):
+        p.resolve("d.example", "MX")
+
+
+def test_load_follows_lower_latency():
+    fast, slow = pool.Upstream("192.0.2.1"), pool.Upstream("192.0.2.2")
+    fast.latency, slow.latency = 0.01, 0.2
+    p = pool.ResolverPool([fast, slow], seed=2)
+    assert {p.pick().address for _ in range(10)} == {"192.0.2.1"}
+    fast.in_flight = 50
+    assert p.pick().address == "192.0.2.2"
+
+
+def test_parse_server():
+    assert pool.parse_server("192.0.2.1") == ("192.0.2.1", 53)
+    assert pool.parse_server("192.0.2.1:5353") == ("192.0.2.1", 5353)
+    assert pool.parse_server("2001:db8::1") == ("2001:db8::1", 53)
+    assert pool.parse_server("[2001:db8::1]:5353") == ("2001:db8::1", 5353)
+
+
+def test_lookups_go_through_the_pool_and_skip_a_dead_server(monkeypatch):
+    zone = SyntheticZone(4, seed=2)
+    dead = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    dead.bind(("127.0.0.1", 0))  # bound but never answers
+    monkeypatch.setattr(resolver, "_cache", None)
+    m = metrics.Metrics()
+    monkeypatch.setattr(metrics, "_metrics", m)
+    try:
+        with StandInServers(zone) as servers:
+            resolver.configure_nameservers(
+                [f"127.0.0.1:{dead.getsockname()[1]}", f"127.0.0.1:{servers.dns_port}"],
+                timeout=0.2,
+                lifetime=0.2,
+                rate=1000,
+            )
+            for domain in zone.domains:
+                assert get_mx_records(domain)
+                assert asyncio.run(resolver.resolve_async(domain, "MX"))
+            upstreams = m.snapshot()["upstreams"]
+            assert "upstream_queries_total" in m.prometheus()
+    finally:
+        resolver.configure_nameservers(None)
+        dead.close()
+    assert resolver.get_pool() is None
+    live = [u for u in upstreams if u["server"].endswith(str(servers.dns_port))][0]
+    assert live["queries"] == 2 * len(zone.domains) and live["errors"] == 0
+    assert sum(u["errors"] for u in upstreams) >= 1
+
+
+class FakeAsyncServer:
+    def __init__(self, delay):
+        self.delay = delay
+        self.cancelled = False
+
+    async def resolve(self, qname, rdtype, lifetime=None):
+        try:
+            await asyncio.sleep(self.delay)
+        except asyncio.CancelledError:
+            self.cancelled = True
+            raise
+        return Answer(dns.rrset.from_text(qname + ".", 300, "IN", "MX", "10 mx.example.net."))
+
+
+def test_slow_query_is_hedged_to_a_second_server():
+    slow, fast = FakeAsyncServer(5.0), FakeAsyncServer(0.0)
+    upstreams = [pool.Upstream("192.0.2.1"), pool.Upstream("192.0.2.2")]
+    upstreams[0]._async, upstreams[1]._async = slow, fast
+    upstreams[1].latency = 0.2  # the slow server looks better, so it is tried first
+    p = pool.ResolverPool(upstreams)
+    for _ in range(p.latency.min_samples):
+        p.latency.observe(0.01)
+
+    async def query():
+        return await asyncio.wait_for(p.resolve_async("d.example", "MX"), 1.0)
+
+    assert asyncio.run(query())[0].exchange.to_text() == "mx.example.net."
+    assert p.hedges == 1 and slow.cancelled
+    assert [u.in_flight for u in upstreams] == [0, 0]
+    assert upstreams[0].errors == 0
+
+
+def test_attempt_timeout_follows_observed_latency():
+    p = fake_pool(FakeServer(), FakeServer(), min_timeout=0.1)
+    assert p.latency.timeout() == 1.0  # no data yet: the configured lifetime
+    for _ in range(p.latency.min_samples):
+        p.latency.observe(0.02)
+    assert p.latency.timeout() == pytest.approx(0.1)
+    p.latency.observe(10.0)
+    assert p.latency.timeout() <= 1.0
@@ -0,0 +1,113 @@
+# tests/test_records.py
+import csv
+import io
+import json
+import tracemalloc
+
+from email_host_lookup import bulk, rescan
+from email_host_lookup.records import VERDICT_FIELDS, HostInfo, ResultBatch
+
+GOOGLE = {
+    "provider_mx": "Google Workspace",
+    "provider_spf": "Google Workspace (SPF)",
+    "provider_dmarc": "Unknown or Custom Provider (DMARC)",
+    "mx_records": ["alt1.aspmx.l.google.com", "aspmx.l.google.com"],
+    "spf_records": ["v=spf1 include:_spf.google.com ~all"],
+    "dmarc_records": [],
+}
+PLANNED = {"provider_mx": "Zoho Mail", "mx_records": ["mx.zoho.com"], "provider": None, "confidence": 0.0,
+           "skipped": ["srv"], "partial": ["dmarc"]}
+ERROR = {"error": "Failed to resolve MX records for broken.example: NXDOMAIN"}
+
+
+def sample_rows(count, domains=50):
+    for i in range(count):
+        domain = f"d{i % domains}.example"
+        verdict = ERROR if i % domains == 7 else PLANNED if i % 3 == 0 else GOOGLE
+        yield bulk._row(f"user{i}@{domain}", domain, verdict)
+    yield bulk._row("not-an-address", None, bulk._INVALID)
+
+
+def test_host_info_is_a_slotted_record_that_unpacks_like_the_tuple():
+    info = HostInfo("example.com", ["mx.example.com"], "Unknown", [], "SPF", [], "DMARC")
+    domain, mx_records, *_ = info
+    assert (domain, mx_records) == ("example.com", ["mx.example.com"])
+    assert info[2] == info.provider_mx == "Unknown" and len(info) == 7
+    assert info == ("example.com", ["mx.example.com"], "Unknown", [], "SPF", [], "DMARC")
+    assert not hasattr(info, "__dict__")
+    assert info.verdict()["provider_spf"] == "SPF"
+
+
+def test_batch_round_trips_rows_and_shares_verdicts():
+    rows = list(sample_rows(300))
+    batch = ResultBatch()
+    batch.extend(rows)
+    assert len(batch) == len(rows) and batch.verdicts == 4
+    assert list(batch) == rows
+    # Every distinct string is stored once.
+    assert batch.strings.values.count("aspmx.l.google.com") == 1
+
+
+def test_exports_match_the_row_writer():
+    rows = list(sample_rows(120))
+    batch = ResultBatch()
+    batch.extend(rows)
+
+    for fmt in ("jsonl", "csv"):
+        expected, actual = io.StringIO(), io.StringIO()
+        writer = bulk.RowWriter(expected, fmt)
+        for row in rows:
+            writer.write(row)
+        batch.write(actual, fmt)
+        if fmt == "csv":
+            assert actual.getvalue() == expected.getvalue()
+            assert next(csv.reader(io.StringIO(actual.getvalue()))) == bulk.CSV_FIELDS
+        else:
+            assert [json.loads(line) for line in actual.getvalue().splitlines()] == rows
+    assert list(VERDICT_FIELDS) == bulk.CSV_FIELDS[2:]
+
+
+def test_jsonl_export_keeps_what_a_rescan_needs():
+    expires = {"mx": 2_000_000_000, "spf": 2_000_000_000, "dmarc": 2_000_000_000}
+    vanity = {**GOOGLE, "mx_ip": "Google Workspace (MX IP: mx.vanity.example → 74.125.24.27)",
+              "mx_addresses": ["74.125.24.27"]}
+    rows = [bulk._row("a@one.example", "one.example", {**GOOGLE, "expires": expires}),
+            bulk._row("b@one.example", "one.example", {**GOOGLE, "expires": expires}),
+            bulk._row("c@two.example", "two.example", {**vanity, "expires": {**expires, "mx": 1}}),
+            bulk._row("not-an-address", None, bulk._INVALID)]
+    batch = ResultBatch()
+    batch.extend(rows)
+    assert batch.verdicts == 3 and list(batch) == rows
+    out = io.StringIO()
+    batch.write(out)
+    assert [json.loads(line) for line in out.getvalue().splitlines()] == rows
+
+    # Still-valid rows are reused as they are; the expired MX record is refreshed.
+    out.seek(0)
+    refresh = rescan.Rescan(rescan.read_results(out), now=1_000_000_000)
+    pairs = list(refresh.rows())[:3]
+    kept = [refresh.reuse(address.partition("@")[2], verdict) for address, verdict in pairs]
+    assert kept[0] == kept[1] == {**GOOGLE, "expires": expires}
+    assert kept[2] is None
+
+
+def test_batch_uses_a_fraction_of_the_row_dicts_memory():
+    def measure(build):
+        tracemalloc.start()
+        try:
+            kept = build()
+            size = tracemalloc.get_traced_memory()[0]
+        finally:
+            tracemalloc.stop()
+        del kept
+        return size
+
+    def as_dicts():
+        return list(sample_rows(20_000, domains=2_000))
+
+    def as_batch():
+        batch = ResultBatch()
+        batch.extend(sample_rows(20_000, domains=2_000))
+        return batch
+
+    assert measure(as_batch) < measure(as_dicts) / 5
@@ -0,0 +1,152 @@
+# tests/test_rescan.py
+import asyncio
+import io
+import json
+import time
+
+import dns.asyncresolver
+import dns.rrset
+import pytest
+
+from email_host_lookup import planner, rescan, resolver
+from email_host_lookup.dns_cache import DnsCache
+from email_host_lookup.email_host_lookup import detect_provider_by_spf
+
+GOOGLE_MX = ["aspmx.l.google.com"]
+GOOGLE_SPF = ["v=spf1 include:_spf.google.com ~all"]
+
+
+@pytest.fixture
+def engine(monkeypatch):
+    """Fake record lookups; `records[domain]` holds (mx, spf); every call is logged."""
+    calls = []
+    records = {}
+
+    def fake(name, result):
+        async def run(domain, *args):
+            calls.append((name, domain))
+            return result(domain, *args)
+        return run
+
+    monkeypatch.setattr(planner, "async_get_mx_records", fake("mx", lambda d: records[d][0]))
+    monkeypatch.setattr(planner, "async_get_spf_record", fake("spf", lambda d: records[d][1]))
+    monkeypatch.setattr(
+        planner, "async_detect_provider_by_spf_expanded", lambda d, r: asyncio.sleep(0, detect_provider_by_spf(r))
+    )
+    monkeypatch.setattr(planner, "async_get_dmarc_record", fake("dmarc", lambda d: []))
+    return calls, records
+
+
+def previous_row(address, domain, expires):
+    return {
+        "address": address,
+        "domain": domain,
+        "provider_mx": "Google Workspace",
+        "provider_spf": "Google Workspace (SPF)",
+        "provider_dmarc": "Unknown or Custom Provider (DMARC)",
+        "mx_records": GOOGLE_MX,
+        "spf_records": GOOGLE_SPF,
+        "dmarc_records": [],
+        "expires": expires,
+    }
+
+
+def test_rescan_requeries_only_expired_records_and_diffs_changes(engine):
+    calls, records = engine
+    now = time.time()
+    later, past = int(now + 3600), int(now - 60)
+    records["moved.example"] = (["moved-example.mail.protection.outlook.com"], GOOGLE_SPF)
+    records["broken.example"] = (GOOGLE_MX, GOOGLE_SPF)
+    previous = [
+        previous_row("a@fresh.example", "fresh.example", dict.fromkeys(("mx", "spf", "dmarc"), later)),
+        previous_row("b@moved.example", "moved.example", {"mx": past, "spf": later, "dmarc": later}),
+        {"address": "c@broken.example", "domain": "broken.example", "error": "Failed to resolve MX records"},
+        previous_row("d@fresh.example", "fresh.example", dict.fromkeys(("mx", "spf", "dmarc"), later)),
+        {"address": "not-an-address", "domain": None, "error": "Invalid email address"},
+    ]
+    out, diffs = io.StringIO(), io.StringIO()
+    stats, scan = rescan.run_rescan(iter(previous), out, diffs)
+
+    assert sorted(calls) == [("dmarc", "broken.example"), ("mx", "broken.example"), ("mx", "moved.example"),
+                             ("spf", "broken.example")]
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [row["address"] for row in rows] == [row["address"] for row in previous]
+    assert rows[0] == previous[0] and rows[3] == previous[3]
+    assert rows[1]["provider_mx"] == "Microsoft 365" and rows[1]["expires"]["spf"] == later
+    assert rows[1]["expires"]["mx"] > now
+    assert rows[2]["provider_mx"] == "Google Workspace"
+    assert [json.loads(line) for line in diffs.getvalue().splitlines()] == [
+        {"domain": "moved.example", "changed": {"provider_mx": ["Google Workspace", "Microsoft 365"]}}
+    ]
+    assert scan.as_dict() == {"fresh": 1, "refreshed": 2, "changed": 1, "methods_reused": 5, "methods_run": 4}
+    assert stats.deduplicated == 1
+
+
+def test_rescan_matches_previous_rows_to_org_domains(engine):
+    calls, records = engine
+    later = int(time.time() + 3600)
+    records["moved.example"] = (["moved-example.mail.protection.outlook.com"], GOOGLE_SPF)
+    previous = [
+        # Scanned per subdomain last time, grouped by organizational domain now.
+        previous_row("a@mail.fresh.example", "mail.fresh.example", dict.fromkeys(("mx", "spf", "dmarc"), later)),
+        previous_row("b@eu.moved.example", "eu.moved.example", {"mx": 0, "spf": later, "dmarc": later}),
+    ]
+    out, diffs = io.StringIO(), io.StringIO()
+    _, scan = rescan.run_rescan(iter(previous), out, diffs, org_domains=True)
+
+    assert calls == [("mx", "moved.example")]
+    assert [json.loads(line)["domain"] for line in out.getvalue().splitlines()] == ["fresh.example", "moved.example"]
+    assert json.loads(diffs.getvalue())["domain"] == "moved.example"
+    assert scan.as_dict()["fresh"] == 1 and scan.as_dict()["changed"] == 1
+
+
+def test_rescan_keeps_an_early_exit_while_its_records_are_valid(engine):
+    calls, records = engine
+    later = int(time.time() + 3600)
+    decided = dict(previous_row("a@early.example", "early.example", {"mx": later, "spf": later}),
+                   provider="Google Workspace", confidence=0.85,
+                   skipped=["autoconfig", "dmarc", "srv", "webfinger"])
+    del decided["provider_dmarc"], decided["dmarc_records"]
+    records["stale.example"] = (GOOGLE_MX, GOOGLE_SPF)
+    stale = dict(decided, address="b@stale.example", domain="stale.example", expires={"mx": 0, "spf": later})
+    out, diffs = io.StringIO(), io.StringIO()
+    _, scan = rescan.run_rescan(iter([decided]), out, diffs, methods=planner.ALL_METHODS)
+
+    assert calls == []
+    assert json.loads(out.getvalue()) == decided
+    assert scan.as_dict()["fresh"] == 1 and scan.as_dict()["methods_run"] == 0
+
+    # Once a deciding record expires, the skipped methods run again too.
+    _, scan = rescan.run_rescan(iter([stale]), io.StringIO(), diffs, methods=planner.DNS_METHODS)
+    assert sorted(calls) == [("dmarc", "stale.example"), ("mx", "stale.example")]
+    assert scan.as_dict()["refreshed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_watch_records_the_shortest_remaining_ttl(monkeypatch):
+    answers = {
+        "a.example": dns.rrset.from_text("a.example.", 300, "IN", "MX", "10 mx.a.example."),
+        "b.example": dns.rrset.from_text("b.example.", 60, "IN", "MX", "10 mx.b.example."),
+    }
+
+    class Answer:
+        def __init__(self, rrset):
+            self.rrset = rrset
+
+    async def fake_resolve(qname, rdtype):
+        return Answer(answers[qname])
+
+    monkeypatch.setattr(dns.asyncresolver, "resolve", fake_resolve)
+    clock = [0.0]
+    monkeypatch.setattr(resolver, "_cache", DnsCache(clock=lambda: clock[0]))
+
+    await resolver.resolve_async("b.example", "MX")
+    clock[0] = 50.0
+    with resolver.watch_ttls() as watch:
+        await resolver.resolve_async("a.example", "MX")
+        assert watch.ttl == 300
+        # Served from the cache with 10 of its 60 seconds left.
+        await asyncio.ensure_future(resolver.resolve_async("b.example", "MX"))
+    assert watch.ttl == 10
+    await resolver.resolve_async("a.example", "MX")
+    assert watch.ttl == 10
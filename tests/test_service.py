@@ -0,0 +1,103 @@
+# tests/test_service.py
+import asyncio
+import json
+import time
+
+import pytest
+
+from email_host_lookup import service
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Fake `lookup_domain`: slow, logged, and fresh for an hour."""
+    calls = []
+
+    async def lookup_domain(domain, probes=False, budget=None, planner=None):
+        calls.append(domain)
+        await asyncio.sleep(0.05)
+        if domain == "broken.example":
+            return {"error": "NXDOMAIN"}
+        return {"provider_mx": "Google Workspace", "mx_records": [f"mx.{domain}"],
+                "expires": {"mx": int(time.time() + 3600)}}
+
+    monkeypatch.setattr(service, "lookup_domain", lookup_domain)
+    return calls
+
+
+async def request(port, method, target, body=None, reader_writer=None):
+    reader, writer = reader_writer or await asyncio.open_connection("127.0.0.1", port)
+    data = json.dumps(body).encode() if body is not None else b""
+    writer.write(f"{method} {target} HTTP/1.1\r\nHost: x\r\nContent-Length: {len(data)}\r\n\r\n".encode() + data)
+    await writer.drain()
+    head = (await reader.readuntil(b"\r\n\r\n")).decode()
+    status = int(head.split()[1])
+    headers = dict(line.split(": ", 1) for line in head.split("\r\n")[1:] if line)
+    payload = json.loads(await reader.readexactly(int(headers["Content-Length"])))
+    if reader_writer is None:
+        writer.close()
+    return status, headers, payload
+
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_share_one_lookup(lookups):
+    svc = service.LookupService()
+    server = await svc.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        responses = await asyncio.gather(
+            *[request(port, "GET", "/lookup?domain=Example.COM") for _ in range(20)],
+            request(port, "GET", "/lookup?address=someone@example.com"),
+        )
+        assert lookups == ["example.com"]
+        assert all(status == 200 for status, _, _ in responses)
+        assert responses[0][2] == {"domain": "example.com", "provider_mx": "Google Workspace",
+                                   "mx_records": ["mx.example.com"], "expires": responses[0][2]["expires"]}
+        assert responses[-1][2]["address"] == "someone@example.com"
+        assert svc.coalesced == 20 and svc.lookups == 1
+
+        # Kept until the records expire, served on a kept-alive connection.
+        connection = await asyncio.open_connection("127.0.0.1", port)
+        for _ in range(2):
+            status, headers, _ = await request(port, "GET", "/lookup?domain=example.com", reader_writer=connection)
+            assert status == 200 and headers["Connection"] == "keep-alive"
+        connection[1].close()
+        assert lookups == ["example.com"] and svc.cache_hits == 2
+
+
+@pytest.mark.asyncio
+async def test_batches_and_backpressure(lookups):
+    svc = service.LookupService(concurrency=2, max_pending=3, max_batch=10)
+    assert svc.max_batch == 3  # a batch must fit into an idle service
+    server = await svc.start(port=0)
+    port = server.sockets[0].getsockname()[1]
+    async with server:
+        status, _, payload = await request(
+            port, "POST", "/lookup", {"domains": ["a.example", "bad..name"], "addresses": ["x@broken.example"]}
+        )
+        assert status == 200
+        assert [row.get("error") for row in payload["results"]] == [None, "Invalid domain", "NXDOMAIN"]
+        assert payload["results"][2]["domain"] == "broken.example"
+
+        # With one lookup pending only two more are admitted; cached domains are free.
+        pending = asyncio.ensure_future(request(port, "GET", "/lookup?domain=slow.example"))
+        await asyncio.sleep(0.01)
+        status, headers, _ = await request(port, "POST", "/lookup", {"domains": ["d.example", "e.example", "f.example"]})
+        assert status == 503 and headers["Retry-After"] == "1"
+        status, _, payload = await request(port, "POST", "/lookup", {"domains": ["a.example", "d.example", "e.example"]})
+        assert status == 200 and len(payload["results"]) == 3
+        assert (await pending)[0] == 200
+        assert "f.example" not in lookups
+
+        assert (await request(port, "POST", "/lookup", {"domains": ["x"] * 4}))[0] == 413
+        assert (await request(port, "GET", "/lookup"))[0] == 400
+        assert (await request(port, "GET", "/nowhere"))[0] == 404
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(b"POST /lookup HTTP/1.1\r\nHost: x\r\nContent-Length: -1\r\n\r\n")
+        head = await asyncio.wait_for(reader.read(), 1)
+        writer.close()
+        assert head.startswith(b"HTTP/1.1 400 ") and b"Malformed request" in head
+        _, _, health = await request(port, "GET", "/health")
+        assert health == {"status": "ok", "in_flight": 0, "max_pending": 3}
+        _, _, stats = await request(port, "GET", "/stats")
+        assert stats["rejected"] == 1 and stats["lookups"] == 5 and stats["cache_hits"] == 1
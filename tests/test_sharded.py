@@ -0,0 +1,156 @@
+# tests/test_sharded.py
+import io
+import json
+import os
+import signal
+
+import pytest
+
+from benchmarks import run
+from benchmarks.standins import StandInServers, SyntheticZone
+from email_host_lookup import bulk, sharded
+
+
+@pytest.fixture(scope="module")
+def servers():
+    zone = SyntheticZone(16, nxdomain_rate=0.2, seed=5)
+    with StandInServers(zone, seed=5) as running:
+        yield running
+
+
+def addresses(zone):
+    # Every domain twice (the repeat is deduplicated), plus one invalid entry.
+    listed = [f"u{i}@{domain}" for i, domain in enumerate(zone.domains)]
+    return listed + ["not-an-address"] + [f"v@{domain.upper()}" for domain in zone.domains]
+
+
+def scanner(servers, **kwargs):
+    config = sharded.WorkerConfig(concurrency=4, batch_size=4, **kwargs.pop("config", {}))
+    return sharded.ShardedScanner(
+        workers=2,
+        config=config,
+        initializer=run.configure_client,
+        initargs=(servers.dns_port, servers.https_port),
+        **kwargs,
+    )
+
+
+def failing_lookups(dns_port, https_port):
+    """Worker initializer: every domain with a 3 in it fails inside `lookup_domain`."""
+    run.configure_client(dns_port, https_port)
+    lookup_domain = sharded.lookup_domain
+
+    async def lookup(domain, *args):
+        if "3" in domain:
+            raise RuntimeError(f"planner failed for {domain}")
+        return await lookup_domain(domain, *args)
+
+    sharded.lookup_domain = lookup
+
+
+def check_rows(rows, zone):
+    for row in rows:
+        if row["domain"] is None:
+            assert row["error"] == "Invalid email address"
+        elif row["domain"].startswith("nx"):
+            assert "NXDOMAIN" in row["error"] or "does not exist" in row["error"]
+        else:
+            assert row["mx_records"], row
+
+
+def test_sharded_scan_merges_workers_in_input_order(servers):
+    zone = servers.zone
+    scan = scanner(servers)
+    rows = list(scan.scan(iter(addresses(zone))))
+
+    assert [row["address"] for row in rows] == addresses(zone)
+    check_rows(rows, zone)
+    stats = scan.stats.as_dict()
+    assert stats["domains_resolved"] == len(zone.domains)
+    assert stats["deduplicated"] == len(zone.domains)
+    assert stats["invalid"] == 1
+    assert stats["domain_errors"] == zone.nxdomains
+    assert scan.crashes == 0
+
+
+def test_memory_cap_retires_workers_without_losing_rows(servers):
+    zone = servers.zone
+    scan = scanner(servers, ordered=False, config={"memory_limit_mb": 1})
+    rows = list(scan.scan(iter(addresses(zone))))
+
+    assert sorted(row["address"] for row in rows) == sorted(addresses(zone))
+    check_rows(rows, zone)
+    assert scan.restarts > 0 and scan.crashes == 0
+
+
+def test_failing_lookups_become_error_rows(servers):
+    zone = servers.zone
+    scan = scanner(servers)
+    scan.initializer = failing_lookups
+    rows = list(scan.scan(iter(addresses(zone))))
+
+    assert [row["address"] for row in rows] == addresses(zone)
+    failed = [row for row in rows if row["domain"] and "3" in row["domain"]]
+    assert failed and all(row["error"] == f"planner failed for {row['domain']}" for row in failed)
+    check_rows([row for row in rows if row not in failed], zone)
+    assert scan.crashes == 0
+
+
+def test_finished_worker_with_unanswered_domains_settles_them():
+    class Finished:
+        done = False
+        outstanding = {"lost.example"}
+
+        def release(self):
+            pass
+
+    scan = sharded.ShardedScanner(workers=1, ordered=False)
+    shard = Finished()
+    scan._shards = [shard]
+    entry = ["u@lost.example", "lost.example", None]
+    scan._waiting = {"lost.example": [entry]}
+    scan._waiting_count = 1
+    scan._replace(shard)
+    assert entry[2] == {"error": "Shard worker finished without a verdict"}
+    assert scan._pending() == 0 and scan._shards == []
+
+
+def test_sigint_drains_to_a_resumable_prefix(servers, tmp_path):
+    from email_host_lookup.store import VerdictStore
+
+    zone = servers.zone
+    listed = addresses(zone)
+    store = VerdictStore(str(tmp_path / "verdicts.sqlite"))
+    out = io.StringIO()
+
+    def interrupt_after_first(items):
+        for i, item in enumerate(items):
+            if i == 3:
+                os.kill(os.getpid(), signal.SIGINT)
+            yield item
+
+    try:
+        stats = sharded.run_sharded(
+            interrupt_after_first(listed),
+            out,
+            flush_every=1,
+            run_id="big",
+            store=store,
+            workers=2,
+            config=sharded.WorkerConfig(concurrency=4),
+            initializer=run.configure_client,
+            initargs=(servers.dns_port, servers.https_port),
+        )
+        assert stats.as_dict()["interrupted"] is True
+        rows = [json.loads(line) for line in out.getvalue().splitlines()]
+        assert 3 <= len(rows) < len(listed)
+        assert [row["address"] for row in rows] == listed[: len(rows)]
+        check_rows(rows, zone)
+        assert store.resume_position("big") == len(rows)
+    finally:
+        store.close()
+    assert signal.getsignal(signal.SIGINT) is signal.default_int_handler
+
+
+def test_bulk_stats_omit_interrupted_flag_by_default():
+    assert "interrupted" not in bulk.BulkStats().as_dict()
@@ -0,0 +1,69 @@
+# tests/test_signatures.py
+import json
+
+from email_host_lookup.email_host_lookup import (
+    detect_provider,
+    detect_provider_by_dmarc,
+    detect_provider_by_spf,
+    detect_provider_by_srv_entries,
+)
+from email_host_lookup.signatures import AhoCorasick, SuffixTrie, get_signatures, load_signatures, set_signatures
+
+
+def test_aho_corasick_overlapping_patterns():
+    ac = AhoCorasick([("hers", 3), ("his", 2), ("she", 1), ("he", 0)])
+    assert ac.search("ushers") == 0
+    assert ac.search("this") == 2
+    assert ac.search("xyz") == -1
+    # Streaming stops at the earliest match and resumes across chunk boundaries.
+    state, priority = ac.scan("us")
+    assert priority == -1
+    assert ac.scan("hers", state)[1] == 0  # "she" and "he" both end at the same character
+    assert AhoCorasick([("his", 2)]).scan("th")[1] == -1
+
+
+def test_suffix_trie_matches_whole_labels():
+    trie = SuffixTrie([("google.com", 0), ("protection.outlook.com", 2), ("outlook.com", 1)])
+    assert trie.search("ASPMX.L.Google.com.") == 0
+    assert trie.search("notgoogle.com") == -1
+    assert trie.search("example-com.mail.protection.outlook.com") == 1
+    assert trie.search("com") == -1
+
+
+def test_first_match_precedence_is_preserved():
+    # Within a record, table order decides; across records, the first matching record wins.
+    assert detect_provider_by_spf(["v=spf1 include:zoho.com include:_spf.google.com ~all"]) == "Google Workspace (SPF)"
+    assert detect_provider_by_spf(["v=spf1 include:spf.mail.yahoo.com include:zoho.com -all"]) == "Zoho Mail (SPF)"
+    assert detect_provider_by_dmarc(["v=DMARC1; rua=mailto:x@fastmail.com", "rua=x@google.com"]) == "Fastmail (DMARC)"
+    assert detect_provider(["mx.someotherprovider.com", "mx.zoho.com", "aspmx.l.google.com"]) == "Zoho Mail"
+    assert detect_provider_by_srv_entries(["_imaps._tcp.google.com → imap.zoho.com"]).startswith("Zoho Mail (SRV:")
+
+
+def test_classify_many_batches_hosts():
+    mx = get_signatures()["mx"]
+    hosts = ["aspmx.l.google.com", "mx.custom.example", "aspmx.l.google.com", "in1-smtp.messagingengine.com"]
+    assert [r.provider if r else None for r in mx.classify_many(hosts)] == [
+        "Google Workspace", None, "Google Workspace", "Fastmail"
+    ]
+
+
+def test_custom_table_from_file(tmp_path):
+    path = tmp_path / "signatures.json"
+    path.write_text(json.dumps({"channels": {"mx": {"match": "suffix", "rules": [
+        {"provider": "Proofpoint", "patterns": ["pphosted.com"]},
+    ]}}}))
+    set_signatures(load_signatures(str(path)))
+    try:
+        assert detect_provider(["mx0a-001.pphosted.com"]) == "Proofpoint"
+    finally:
+        set_signatures(None)
+    assert detect_provider(["mx0a-001.pphosted.com"]) == "Unknown or Custom Provider"
+
+
+def test_mx_hosts_no_longer_match_on_a_provider_name_alone():
+    # Provider MX hosts still match; hosts that merely contain a provider's
+    # name matched the old substring checks and are now unclassified.
+    assert detect_provider(["mailsec.protonmail.ch"]) == "ProtonMail"
+    assert detect_provider(["alt1.gmail-smtp-in.l.google.com."]) == "Google Workspace"
+    for host in ("mx.protonmail-relay.example", "fastmail.example.net", "aspmx.l.google.com.mx.example"):
+        assert detect_provider([host]) == "Unknown or Custom Provider"
@@ -0,0 +1,130 @@
+# tests/test_spf.py
+import asyncio
+
+import dns.resolver
+import dns.rrset
+import pytest
+
+from email_host_lookup import async_lookup, spf
+
+SPF = {
+    "example.com": "v=spf1 include:_spf.example.com -all",
+    "_spf.example.com": "v=spf1 ip4:192.0.2.0/24 include:spf.protection.outlook.com ~all",
+    "spf.protection.outlook.com": "v=spf1 ip4:40.92.0.0/15 -all",
+    "other.example": "v=spf1 redirect=_spf.example.com",
+    "_spf.google.com": "v=spf1 include:_netblocks.google.com ~all",
+    "_netblocks.google.com": "v=spf1 ip4:35.190.247.0/24 ~all",
+    "loop.example": "v=spf1 include:loop2.example -all",
+    "loop2.example": "v=spf1 include:loop.example -all",
+    "many.example": "v=spf1 a mx include:_spf.example.com include:_spf.google.com "
+                    "a:a1.example a:a2.example a:a3.example a:a4.example exists:%{i}.x.example -all",
+}
+
+
+def generated(qname):
+    """Records of endless include graphs: a chain, and a binary fan-out."""
+    kind, _, index = qname.partition(".")[0].partition("-")
+    if kind == "chain":
+        return f"v=spf1 include:chain-{int(index) + 1}.example -all"
+    if kind == "fan":
+        return f"v=spf1 include:fan-{2 * int(index) + 1}.example include:fan-{2 * int(index) + 2}.example -all"
+    return None
+
+
+@pytest.fixture
+def graph(monkeypatch):
+    queries = []
+
+    async def resolve_async(qname, rdtype):
+        queries.append(qname)
+        await asyncio.sleep(0.01)
+        record = SPF.get(qname) or generated(qname)
+        if record is None:
+            raise dns.resolver.NXDOMAIN()
+        return dns.rrset.from_text_list(qname + ".", 300, "IN", "TXT", [f'"{record}"'])
+
+    monkeypatch.setattr(spf, "resolve_async", resolve_async)
+    graph = spf.SpfGraph()
+    monkeypatch.setattr(spf, "_graph", graph)
+    graph.queries = queries
+    return graph
+
+
+def test_parse_spf_counts_lookup_terms():
+    node = spf.parse_spf("v=spf1 a mx/24 ip4:192.0.2.1 include:_SPF.Example.com. ?exists:%{i}.x redirect=r.example")
+    assert node.includes == ("_spf.example.com",)
+    assert node.redirect == "r.example"
+    assert node.lookups == 5
+
+
+@pytest.mark.asyncio
+async def test_nested_include_is_classified(graph):
+    provider, tree = await spf.async_detect_provider_by_spf_tree("example.com", [SPF["example.com"]])
+    assert provider == "Microsoft 365 (SPF)"
+    assert tree.domains == ("_spf.example.com", "spf.protection.outlook.com")
+    assert tree.error is None
+
+    provider = await async_lookup.async_detect_provider_by_spf_expanded("other.example", [SPF["other.example"]])
+    assert provider == "Microsoft 365 (SPF)"
+
+
+@pytest.mark.asyncio
+async def test_shared_includes_are_fetched_once(graph):
+    roots = ["example.com", "other.example"] * 20
+    await asyncio.gather(*(graph.expand(root, SPF[root]) for root in roots))
+    assert sorted(graph.queries) == ["_spf.example.com", "spf.protection.outlook.com"]
+
+
+@pytest.mark.asyncio
+async def test_loops_and_lookup_limit_are_reported(graph):
+    tree = await graph.expand("loop.example")
+    assert tree.error == "include loop at loop.example"
+
+    tree = await graph.expand("many.example")
+    assert tree.lookups == 11  # 9 in the record itself, one in each included google/example record
+    assert tree.error == "exceeds the limit of 10 DNS lookups (11)"
+    # The include that spent the budget is listed but not expanded.
+    assert "_spf.google.com" in tree.domains and "_netblocks.google.com" not in tree.domains
+
+
+@pytest.mark.asyncio
+async def test_deep_include_chain_stops_at_the_lookup_limit(graph):
+    tree = await asyncio.wait_for(graph.expand("chain-0.example"), 5)
+    assert tree.error == "exceeds the limit of 10 DNS lookups (11)"
+    assert tree.domains[-1] == "chain-10.example"
+    assert graph.fetches == 11
+
+
+@pytest.mark.asyncio
+async def test_fan_out_is_expanded_once_within_the_limit(graph, monkeypatch):
+    builds = []
+    build = graph._build
+
+    async def counted(domain, *args):
+        builds.append(domain)
+        return await build(domain, *args)
+
+    monkeypatch.setattr(graph, "_build", counted)
+    record = "v=spf1 a include:fan-0.example -all"
+    trees = await asyncio.wait_for(asyncio.gather(*(graph.expand(f"root{i}.example", record) for i in range(20))), 5)
+    assert trees[0].error == "exceeds the limit of 10 DNS lookups (12)"
+    assert len(set(trees)) == 1
+    # Each record is fetched once, and only as far as the budget reaches.
+    assert len(graph.queries) == len(set(graph.queries)) == graph.fetches <= 2 * graph.max_lookups
+    # Concurrent roots share the flattening of every subtree.
+    assert len(builds) == len(set(builds))
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_restart_the_fetch(graph):
+    first = asyncio.ensure_future(graph.node("example.com"))
+    await asyncio.sleep(0)
+    second = asyncio.ensure_future(graph.node("example.com"))
+    await asyncio.sleep(0)
+    first.cancel()
+    await asyncio.sleep(0)
+    third = asyncio.ensure_future(graph.node("example.com"))
+    assert (await second).includes == ("_spf.example.com",)
+    assert (await third) == (await second)
+    assert await graph.node("example.com") == (await second)
+    assert graph.queries == ["example.com"] and graph.fetches == 1
@@ -0,0 +1,72 @@
+# tests/test_startup.py
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Self time of the package's own modules on a cold start (dependencies such
+# as dnspython are not counted).  Generous so slow CI machines pass.
+IMPORT_BUDGET_MS = 60
+
+HEAVY = {"textual", "sqlite3", "http.server", "urllib.request"}
+
+
+def import_profile(code):
+    """Run `code` in a fresh interpreter; return (stdout, {module: self_us})."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        capture_output=True,
+        text=True,
+        check=True,
+        cwd=ROOT,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if line.startswith("import time:") and "self [us]" not in line:
+            self_us, _, name = line[len("import time:"):].split("|")
+            modules[name.strip()] = int(self_us)
+    return result.stdout, modules
+
+
+def own_import_ms(modules):
+    return sum(us for name, us in modules.items() if name.startswith("email_host_lookup")) / 1000
+
+
+def test_help_loads_no_dns_probes_or_ui():
+    code = "import sys; from email_host_lookup import cli; cli.build_parser().format_help(); print(*sys.modules)"
+    stdout, modules = import_profile(code)
+    loaded = set(stdout.split())
+    assert not loaded & (HEAVY | {"dns.resolver", "ssl", "asyncio", "email_host_lookup.email_host_lookup"})
+    assert own_import_ms(modules) < IMPORT_BUDGET_MS
+
+
+def test_mx_lookup_loads_only_the_blocking_resolver():
+    code = (
+        "import sys; from email_host_lookup.email_host_lookup import detect_provider, get_mx_records; "
+        "from email_host_lookup.signatures import get_signatures; "
+        "assert detect_provider(['aspmx.l.google.com']) == 'Google Workspace'; "
+        "assert get_signatures()['spf']._compiled is None; "
+        "print(*sys.modules)"
+    )
+    stdout, modules = import_profile(code)
+    loaded = set(stdout.split())
+    assert "dns.resolver" in loaded
+    assert not loaded & (HEAVY | {
+        "asyncio",
+        "dns.asyncresolver",
+        "email_host_lookup.async_lookup",
+        "email_host_lookup.bulk",
+        "email_host_lookup.http_probe",
+        "email_host_lookup.spf",
+    })
+    assert own_import_ms(modules) < IMPORT_BUDGET_MS
+
+
+def test_screen_module_defers_textual_until_the_app_is_used():
+    code = (
+        "import sys; import email_host_lookup.email_host_lookup_screen as screen; "
+        "print('textual' in sys.modules); screen.EmailHostLookupApp; print('textual.app' in sys.modules)"
+    )
+    stdout, _ = import_profile(code)
+    assert stdout.split() == ["False", "True"]
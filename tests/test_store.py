@@ -0,0 +1,105 @@
+# tests/test_store.py
+import io
+import json
+import time
+
+import pytest
+
+from email_host_lookup import bulk
+from email_host_lookup.store import VerdictStore
+
+
+def fake_engine(calls):
+    async def async_get_email_host_info(domain):
+        calls.append(domain)
+        return (domain, [f"mx.{domain}"], "Zoho Mail", [], "Unknown or Custom Provider (SPF)",
+                [], "Unknown or Custom Provider (DMARC)")
+    return async_get_email_host_info
+
+
+def test_put_get_and_expiry(tmp_path):
+    path = str(tmp_path / "verdicts.sqlite")
+    with VerdictStore(path, ttl=100, error_ttl=10, batch_size=2) as store:
+        store.put("example.com", {"provider_mx": "Zoho Mail"})
+        assert store.get("example.com") == {"provider_mx": "Zoho Mail"}  # served before the batch commits
+        store.put("broken.example", {"error": "NXDOMAIN"})
+
+    with VerdictStore(path) as store:
+        assert store.get("example.com")["provider_mx"] == "Zoho Mail"
+        now = store._conn.execute("SELECT updated_at FROM verdicts WHERE domain = 'broken.example'").fetchone()[0]
+        assert store.get("broken.example", now=now + 11) is None
+        assert store.get("example.com", now=now + 11) is not None
+        assert store.purge_expired(now=now + 101) == 2
+
+
+def test_verdicts_expire_with_their_records(tmp_path):
+    with VerdictStore(str(tmp_path / "v.sqlite"), ttl=3600) as store:
+        now = time.time()
+        store.put("short.example", {"provider_mx": "Zoho Mail", "expires": {"mx": now + 60, "spf": now + 600}})
+        store.put("long.example", {"provider_mx": "Zoho Mail", "expires": {"mx": now + 86400 * 7}})
+        assert store.get("short.example", now=now + 30) is not None
+        assert store.get("short.example", now=now + 61) is None
+        assert store.get("long.example", now=now + 3599) is not None
+        assert store.get("long.example", now=now + 3601) is None  # bounded by the store's ttl
+
+
+def test_bulk_reuses_fresh_verdicts(tmp_path, monkeypatch):
+    calls = []
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_engine(calls))
+    with VerdictStore(str(tmp_path / "v.sqlite")) as store:
+        bulk.run_bulk(iter(["a@one.example", "b@two.example"]), io.StringIO(), store=store)
+        stats = bulk.run_bulk(iter(["c@one.example", "d@three.example"]), io.StringIO(), store=store)
+    assert calls == ["one.example", "two.example", "three.example"]
+    assert stats.store_hits == 1
+
+
+def test_interrupted_run_resumes(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_engine([]))
+    addresses = [f"user{i}@d{i % 3}.example" for i in range(10)]
+
+    class InterruptedOutput(io.StringIO):
+        def write(self, text):
+            if self.getvalue().count("\n") == 4:
+                raise KeyboardInterrupt
+            return super().write(text)
+
+    out = InterruptedOutput()
+    with VerdictStore(str(tmp_path / "v.sqlite")) as store:
+        with pytest.raises(KeyboardInterrupt):
+            bulk.run_bulk(iter(addresses), out, store=store, run_id="weekly")
+        resume_from = store.resume_position("weekly")
+        assert resume_from == 4
+        out = io.StringIO(out.getvalue())
+        out.seek(0, io.SEEK_END)
+        bulk.run_bulk(iter(addresses), out, store=store, run_id="weekly", resume_from=resume_from)
+        assert store.resume_position("weekly") == 0
+
+    rows = [json.loads(line) for line in out.getvalue().splitlines()]
+    assert [row["address"] for row in rows] == addresses
+
+
+def test_rows_written_after_the_last_checkpoint_are_not_duplicated(tmp_path, monkeypatch):
+    monkeypatch.setattr(bulk, "async_get_email_host_info", fake_engine([]))
+    addresses = [f"user{i}@d{i % 3}.example" for i in range(10)]
+    path = tmp_path / "out.jsonl"
+
+    class KilledAfterFirstCheckpoint(VerdictStore):
+        """Every row reaches the file, but the run dies before checkpointing past row 4."""
+
+        def checkpoint(self, run_id, rows_done, finished=False, output_offset=None):
+            if rows_done <= 4:
+                super().checkpoint(run_id, rows_done, finished, output_offset)
+
+    with KilledAfterFirstCheckpoint(str(tmp_path / "v.sqlite")) as store, open(path, "w") as out:
+        bulk.run_bulk(iter(addresses), out, store=store, run_id="weekly", flush_every=4)
+    assert len(path.read_text().splitlines()) == 10
+
+    with VerdictStore(str(tmp_path / "v.sqlite")) as store:
+        resume_from = store.resume_position("weekly")
+        assert resume_from == 4
+        with open(path, "a") as out:
+            bulk.run_bulk(iter(addresses), out, store=store, run_id="weekly", resume_from=resume_from)
+        assert store.resume_position("weekly") == 0
+
+    rows = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [row["address"] for row in rows] == addresses